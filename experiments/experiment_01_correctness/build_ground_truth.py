@@ -11,9 +11,15 @@ from typing import List, Optional
 import logging
 import os
 import subprocess
+import sys
 
 logger = logging.getLogger("GroundTruther")
 ORACLE_LIB = Path("./target/debug/libcorrectness_oracle.so").resolve()
+LOKIATTACK_DIR = Path("../../lokiattack/").resolve()
+
+sys.path.insert(0, (LOKIATTACK_DIR / "miasm").as_posix())
+sys.path.insert(0, LOKIATTACK_DIR.as_posix())
+from lokiattack.symbols import get_symbols  # pylint: disable=wrong-import-position
 
 TESTCASES = [
     "aes_encrypt",
@@ -42,29 +48,14 @@ def setup_logging() -> None:
 
 
 def get_symbol(binary: Path) -> Optional[int]:
-    cmd = ["nm", binary.as_posix()]
-    output = None
     try:
-        p = subprocess.run(cmd, shell=False, check=True, stdout=subprocess.PIPE,
-                            stderr=subprocess.STDOUT)
-        output = p.stdout.decode("utf-8")
-    except subprocess.TimeoutExpired:
-        print(f"TIMEOUT: nm {binary.as_posix()}")
-        return None
-    except subprocess.CalledProcessError as e:
-        print(f"ERROR: {' '.join(cmd)} -> {str(e)}")
-        print(e.stdout.decode("utf-8"))
-        print(e.stderr.decode("utf-8"))
-        return None
-    if not output:
-        print(f"ERROR: No output by nm {binary.as_posix()}")
+        symbols = get_symbols(binary)
+    except Exception as e:
+        print(f"ERROR: Failed to parse symbols of {binary.as_posix()} -> {str(e)}")
         return None
-    target_function = None
-    for l in [l.strip() for l in output.splitlines() if l.strip()]:
-        if "T target_function" in l:
-            target_function = int(l.split(" ", 1)[0], 16)
+    target_function = symbols.get("target_function")
     if target_function is None:
-        print(f"ERROR: Failed to locate target_function via nm {binary.as_posix()}")
+        print(f"ERROR: Failed to locate target_function in {binary.as_posix()}")
         return None
     return target_function
 
@@ -7,6 +7,7 @@ Check correctness
 import logging
 import os
 import subprocess
+import sys
 from argparse import ArgumentParser
 from functools import partial
 from multiprocessing import Pool
@@ -16,6 +17,11 @@ from typing import Dict, List, Optional, Tuple
 
 logger = logging.getLogger("Checker")
 CHECKER_LIB = Path("./target/debug/libcorrectness_checker_runtime.so").resolve()
+LOKIATTACK_DIR = Path("../../lokiattack/").resolve()
+
+sys.path.insert(0, (LOKIATTACK_DIR / "miasm").as_posix())
+sys.path.insert(0, LOKIATTACK_DIR.as_posix())
+from lokiattack.symbols import get_symbols as load_symbols  # pylint: disable=wrong-import-position
 
 TESTCASES = [
     "aes_encrypt",
@@ -44,35 +50,18 @@ def setup_logging() -> None:
 
 
 def get_symbols(binary: Path) -> Optional[Tuple[int, int]]:
-    cmd = ["nm", binary.as_posix()]
-    output = None
     try:
-        p = subprocess.run(cmd, shell=False, check=True, stdout=subprocess.PIPE,
-                            stderr=subprocess.STDOUT)
-        output = p.stdout.decode("utf-8")
-    except subprocess.TimeoutExpired:
-        print(f"TIMEOUT: nm {binary.as_posix()}")
-        return None
-    except subprocess.CalledProcessError as e:
-        print(f"ERROR: {' '.join(cmd)} -> {str(e)}")
-        print(e.stdout.decode("utf-8"))
-        print(e.stderr.decode("utf-8"))
-        return None
-    if not output:
-        print(f"ERROR: No output by nm {binary.as_posix()}")
+        symbols = load_symbols(binary)
+    except Exception as e:
+        print(f"ERROR: Failed to parse symbols of {binary.as_posix()} -> {str(e)}")
         return None
-    context = None
-    vm_setup = None
-    for l in [l.strip() for l in output.splitlines() if l.strip()]:
-        if "B context" in l:
-            context = int(l.split(" ", 1)[0], 16)
-        elif "T _Z8vm_setupPmR7Contextm" in l:
-            vm_setup = int(l.split(" ", 1)[0], 16)
+    context = symbols.get("context")
+    vm_setup = symbols.get("_Z8vm_setupPmR7Contextm")
     if context is None:
-        print(f"ERROR: Failed to locate context via nm {binary.as_posix()}")
+        print(f"ERROR: Failed to locate context in {binary.as_posix()}")
         return None
     if vm_setup is None:
-        print(f"ERROR: Failed to locate context via nm {binary.as_posix()}")
+        print(f"ERROR: Failed to locate vm_setup in {binary.as_posix()}")
         return None
     return (context, vm_setup)
 
@@ -85,7 +74,7 @@ def run_checker(tc_name: str, inputs_file: Path, instance: Path) -> bool:
     assert obf_exe.exists(), f"Failed to find obf_exe binary at {obf_exe.as_posix()}"
 
     # get symbols from binary
-    logger.debug("Using nm to parse symbols")
+    logger.debug("Parsing symbols of obf_exe")
     tup = get_symbols(obf_exe)
     assert tup is not None, f"Failed to retrieve symbols for {obf_exe.as_posix()}"
     addr_context, addr_vm_setup = tup
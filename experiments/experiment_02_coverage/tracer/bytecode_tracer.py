@@ -6,9 +6,15 @@ Parse bytecode and extract 'trace' of bytecode entries that will be executed.
 from argparse import ArgumentParser
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Iterator, List
+from typing import List
+import sys
 import time
 
+LOKIATTACK_DIR = (Path(__file__).parent / "../../../lokiattack").resolve()
+sys.path.insert(0, LOKIATTACK_DIR.as_posix())
+from lokiattack.bytecode import handler_trace, load_bytecode  # pylint: disable=wrong-import-position
+
+
 @dataclass
 class BytecodeEntry(object):
     # path: Path
@@ -19,27 +25,15 @@ class BytecodeEntry(object):
         return hash(self.handler_idx) + hash(self.key)
 
 
-def parse_bytecode(path: Path) -> Iterator[bytes]:
-    with open(path, 'rb') as f:
-        content = f.read()
-    assert len(content) % 24 == 0, f"Bytecode length should be a mulitple of 24 but is {len(content)}"
-    for i in range(0, len(content), 24):
-        yield content[i:i+24]
+def bytecode_trace(path: Path) -> List[BytecodeEntry]:
+    bytecode = load_bytecode(path / "byte_code.bin")
+    return [BytecodeEntry(handler_idx, key)
+            for (handler_idx, key) in zip(bytecode["handler_idx"].tolist(), bytecode["key"].tolist())]
 
 
-def bytecode_trace(path: Path) -> List[BytecodeEntry]:
-    entries = set()
-    trace = []
-    handler_indices = set()
-    for chunk in parse_bytecode(path / "byte_code.bin"):
-        handler_idx = int.from_bytes(chunk[:2], byteorder='little')
-        key = int.from_bytes(chunk[16:24], byteorder='little')
-        # entry = BytecodeEntry(path, handler_idx, key)
-        entry = BytecodeEntry(handler_idx, key)
-        trace += [entry]
-        entries.add(entry)
-        handler_indices.add(handler_idx)
-    return list(trace)
+def bytecode_handler_trace(path: Path) -> List[int]:
+    """Handler indices of the bytecode entries in execution order"""
+    return handler_trace(load_bytecode(path / "byte_code.bin")).tolist()
 
 
 def main(path: Path) -> None:
@@ -16,7 +16,7 @@ from pathlib import Path
 from time import time
 from typing import Dict, Iterator, List, Tuple, TypeVar
 
-from bytecode_tracer import bytecode_trace
+from bytecode_tracer import bytecode_handler_trace
 
 
 logger = logging.getLogger("SubSetBytecodeVerifier")
@@ -104,9 +104,8 @@ def verify_bytecode(task: Tuple[Path, List[Tuple[List[int], List[int]]], int]) -
     """
     instance, inputs, chunk_id = task
 
-    expected_bc_trace = bytecode_trace(instance)
     # TODO: we ignore key currently
-    expected_trace = [e.handler_idx for e in expected_bc_trace]
+    expected_trace = bytecode_handler_trace(instance)
 
     for input_tup in inputs:
         observed_trace = trace_vm(instance, input_tup, chunk_id)
@@ -37,6 +37,10 @@ def main(path: Path) -> None:
     solver.add(f != BitVecVal(0, 64))
     solver.add((key & BitVecVal(0xffffffff, 64)) != BitVecVal(1, 64))
 
+    # the equivalence check of a candidate key only adds key == candidate
+    # on top of f != g, in a scope that is dropped after the check
+    equivalence_solver.add(f != g)
+
     # init CEGAR
     solving_time = 0.0
     success = False
@@ -58,12 +62,11 @@ def main(path: Path) -> None:
             # parse key value
             val = solver.model()[key].as_long()
 
-            # reset equivalence solver
-            equivalence_solver.reset()
+            # set equivalence solver timeout
             equivalence_solver.set("timeout", TIMEOUT - int(solving_time))
 
-            # add constraints
-            equivalence_solver.add(f != g)
+            # add candidate key
+            equivalence_solver.push()
             equivalence_solver.add(key == BitVecVal(val, 64))
 
             # measure solving time
@@ -81,6 +84,9 @@ def main(path: Path) -> None:
                 val = BitVecVal(equivalence_solver.model()[key].as_long(), 64)
                 solver.add(key != val)
 
+            # drop candidate key
+            equivalence_solver.pop()
+
         # timeout check
         if solving_time >= TIMEOUT:
             break
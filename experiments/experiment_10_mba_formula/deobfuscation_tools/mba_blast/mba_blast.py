@@ -14,7 +14,8 @@ import sys
 sys.path.append("../tools")
 import z3
 from argparse import ArgumentParser
-from typing import Any, List, Optional, Tuple, Union
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 # FIX: imported by me
 import logging
@@ -37,6 +38,11 @@ def setup_logging() -> logging.Logger:
 logger = setup_logging()
 ### end fix
 
+#basis vector per number of variables
+BASIS_VECTORS = {2:["x", "y", "(x&y)", "~(x&~x)"], 3:["x", "y", "z", "(x&y)",  "(y&z)", "(x&z)", "(x&y&z)", "~(x&~x)"]}
+#number of z3 verification results kept per process
+VERIFICATION_CACHE_SIZE = 65536
+
 
 def postfix(itemString: str) -> str:
     """transform infixExpre into postfixExpre
@@ -51,7 +57,7 @@ def postfix(itemString: str) -> str:
     Return:
         itemStr: expression string persented in postfix.
     """
-    logger.debug(f"postfix(itemString={itemString} (type={type(itemString)}))")
+    logger.debug("postfix(itemString=%s (type=%s))", itemString, type(itemString))
     itemStr = ""
     boperatorList = ["&", "|", "^"]
     uoperator = "~"
@@ -94,85 +100,82 @@ def postfix(itemString: str) -> str:
     elif len(opeList):
         itemStr += opeList[0]
 
-    print(f"  -> postfix={itemStr}")
     return itemStr
 
 
-def postfix_cal(itemString: str, vnumber: int = 0) -> List[int]:
-    """calculate the result of the expression string.
+def variable_masks(vnumber: int) -> Dict[str, int]:
+    """the truth table columns of the variables, packed into integers: bit i is the value of the variable in row i.
     Args:
-        itemString: bitwise expression string persented in postfix.
         vnumber: the number of variables.
     Returns:
-        result: the result list of the expression string.
-    Raises:
-        through out SystemExit exception.
+        maskDict: the packed column of every variable name.
     """
-    logger.debug(f"postfix_cal(itemString={itemString}(type={type(itemString)}), vnumber={vnumber}(type={type(vnumber)})")
     if vnumber == 1:
-        x = [0,1]
-    elif vnumber == 2:
-        y = [0, 1, 0, 1]
-        x = [0, 0, 1, 1] 
-    elif vnumber == 3:
-        y = [0, 1, 0, 1, 0, 1, 0, 1]
-        x = [0, 0, 1, 1, 0, 0, 1, 1]
-        z = [0, 0, 0, 0, 1, 1, 1, 1]
-    elif vnumber == 4:
-        y = [0, 1] * 8
-        x = [0, 0, 1, 1] * 4
-        z = [0] * 4 + [1] * 4 + [0] * 4 + [1] * 4
-        t = [0] * 8 + [1] * 8
+        variableList = ["x"]
+    elif vnumber in [2, 3, 4]:
+        #same row order as the original lists: y toggles on every row, then x, z, t
+        variableList = ["y", "x", "z", "t"][:vnumber]
     else:
         raise NotImplementedError(f"Currently only 1 - 4 variables are supported")
+    maskDict = {}
+    for (bit, variable) in enumerate(variableList):
+        mask = 0
+        for row in range(2**vnumber):
+            if (row >> bit) & 1:
+                mask |= 1 << row
+        maskDict[variable] = mask
+
+    return maskDict
+
+
+def postfix_mask(itemString: str, vnumber: int) -> int:
+    """calculate the truth table of the expression string for all rows at once.
+    Args:
+        itemString: bitwise expression string persented in postfix.
+        vnumber: the number of variables.
+    Returns:
+        result: the truth table packed into an integer, bit i is the result of row i.
+    Raises:
+        NameError: variable not in the variable list of vnumber variables.
+    """
+    maskDict = variable_masks(vnumber)
+    fullMask = (1 << 2**vnumber) - 1
     variableList = ["x", "y", "z", "t"]
-    binaryOperator = ["&", "|", "^"]
-    unaryOperator = ["~"]
 
-    stack: List[List[int]] = []
+    stack: List[int] = []
     for c in itemString:
-        # logger.debug(f"  c={c}")
         if c in variableList:
-            # logger.debug(f"  insert={eval(c)}(type={type(eval(c))})")
-            stack.insert(0, eval(c))
-        elif c in unaryOperator:
-            operation = stack.pop(0)
-            res = np.invert(operation)
-            res = res % 2
-            # logger.debug(f"  insert={res}(type={type(res)})")
-            stack.insert(0, res)
-        elif c in binaryOperator:
-            operation1 = stack.pop(0)
-            operation2 = stack.pop(0)
-            if c == "&":
-                res = np.bitwise_and(operation1, operation2)
-                # logger.debug(f"  insert={res}(type={type(res)})")
-                stack.insert(0, res)
-            elif c == "|":
-                res = np.bitwise_or(operation1, operation2)
-                # logger.debug(f"  insert={res}(type={type(res)})")
-                stack.insert(0, res)
-            elif c == "^":
-                res = np.bitwise_xor(operation1, operation2)
-                # logger.debug(f"  insert={res}(type={type(res)})")
-                stack.insert(0, res)
-        else: # FIX: added by me
-            logger.debug(f"FIX: c was neither in variableList, unaryOperator, nor binaryOperator: {c}")
+            if c not in maskDict:
+                raise NameError(f"name '{c}' is not defined")
+            stack.append(maskDict[c])
+        elif c == "~":
+            stack.append(stack.pop() ^ fullMask)
+        elif c == "&":
+            stack.append(stack.pop() & stack.pop())
+        elif c == "|":
+            stack.append(stack.pop() | stack.pop())
+        elif c == "^":
+            stack.append(stack.pop() ^ stack.pop())
 
     if len(stack) > 1:
         raise RuntimeError("postfix_cal: stack > 1")
-    result: Union[List[int], "np.ndarray"] = stack[0]
-    # logger.debug(f"  result={result}(type={type(result)})")
-    if isinstance(result, list):
-        pass
-    else:
-        assert isinstance(result, np.ndarray), f"FIX: expected np.array, found type {type(result)}"
-        result = result.tolist()
-        # logger.debug(f"  result.tolist()={result}(type={type(result)})")
 
-    assert isinstance(result, list)
-    print(f"  -> postfix_cal={result}")
-    return result
+    return stack[0]
+
+
+def postfix_cal(itemString: str, vnumber: int = 0) -> List[int]:
+    """calculate the result of the expression string.
+    Args:
+        itemString: bitwise expression string persented in postfix.
+        vnumber: the number of variables.
+    Returns:
+        result: the result list of the expression string.
+    Raises:
+        through out SystemExit exception.
+    """
+    mask = postfix_mask(itemString, vnumber)
+
+    return [(mask >> i) & 1 for i in range(2**vnumber)]
 
 
 
@@ -188,7 +191,27 @@ def verify_mba_unsat(leftExpre: str, rightExpre: str, bitnumber: int = 2) -> boo
     Raises:
         None.
     """
-    logger.debug(f"verify_mba_unsat(...)")
+    logger.debug("verify_mba_unsat(...)")
+    #the relation is symmetric: the canonical pair has no spaces and the smaller expression on the left
+    leftExpre = leftExpre.replace(" ", "")
+    rightExpre = rightExpre.replace(" ", "")
+    if rightExpre < leftExpre:
+        (leftExpre, rightExpre) = (rightExpre, leftExpre)
+
+    return verify_canonical_mba_unsat(leftExpre, rightExpre, bitnumber)
+
+
+@lru_cache(maxsize=VERIFICATION_CACHE_SIZE)
+def verify_canonical_mba_unsat(leftExpre: str, rightExpre: str, bitnumber: int) -> bool:
+    """check the relaion whether the left expression is euqal to the right expression, once per canonical pair.
+    Args:
+        leftExpre: left expression.
+        rightExpre: right expression.
+        bitnumber: the number of the bits of the variable.
+    Returns:
+        True: equation.
+        False: unequal.
+    """
     x,y,z,t,a,b,c,d,e,f = z3.BitVecs("x y z t a b c d e f", bitnumber)
 
     leftEval = eval(leftExpre)
@@ -215,7 +238,7 @@ def truthtable_term_list(termList: List[str], vnumber: int = 0) -> List[int]:
     Raises:
         through out SystemExit exception.
     """
-    logger.debug(f"truthtable_term_list(termList={termList} (type={type(termList)}), vnumber={vnumber} = 0 (type={type(vnumber)}))")
+    logger.debug("truthtable_term_list(termList=%s (type=%s), vnumber=%s = 0 (type=%s))", termList, type(termList), vnumber, type(vnumber))
     #function call error
     if not vnumber:
         raise RuntimeError(f"vnumber must be [1-4] - is {vnumber}")
@@ -257,11 +280,22 @@ def truthtable_bitwise(bitExpre: str, vnumber: int) -> List[int]:
     Returns:
         truthList: a truth table on a format of list.
     """
-    logger.debug(f"truthtable_bitwise(bitExpre={bitExpre} (type={type(bitExpre)}), vnumber={vnumber} (type={type(vnumber)}))")
-    truthList = postfix_cal(postfix(bitExpre), vnumber)
-    print(f"{bitExpre} -> {truthList}")
+    mask = truthtable_mask(bitExpre, vnumber)
 
-    return truthList
+    return [(mask >> i) & 1 for i in range(2**vnumber)]
+
+
+@lru_cache(maxsize=None)
+def truthtable_mask(bitExpre: str, vnumber: int) -> int:
+    """generate the truth table of a bitwise expression, packed into an integer.
+       every expression is parsed and evaluated once, later calls are looked up.
+    Args:
+        bitExpre: a bitwise expression.
+        vnumber: the number of variables in a expression.
+    Returns:
+        mask: bit i is the result of the expression on row i of the truth table.
+    """
+    return postfix_mask(postfix(bitExpre), vnumber)
 
 
 
@@ -273,7 +307,7 @@ def truthtable_expression(expreStr: str, vnumber: int) -> List[int]:
     Returns:
         truthtalbeList: a truth table on a format of list.
     """
-    logger.debug(f"truthtable_expression(expreStr={expreStr} (type={type(expreStr)}), vnumber={vnumber} (type={type(vnumber)}))")
+    logger.debug("truthtable_expression(expreStr=%s (type=%s), vnumber=%s (type=%s))", expreStr, type(expreStr), vnumber, type(vnumber))
     termList = expression_2_term(expreStr)
 
     #truth table of bitwise expression 
@@ -290,30 +324,30 @@ def expression_2_term(expreStr: str) -> List[str]:
         termList: a list of terms on bitwise expression.
         constantList: a list of constant term of the linear MBA expression.
     """
-    logger.debug(f"expression_2_term(expreStr={expreStr} (type={type(expreStr)}))")
+    logger.debug("expression_2_term(expreStr=%s (type=%s))", expreStr, type(expreStr))
     itemList = re.split("([\+-])", expreStr)
-    print(f"  itemList={itemList}")
+    logger.debug("itemList=%s", itemList)
     item0 = itemList[0]
-    print(f"  item0='{item0}'")
+    logger.debug("item0='%s'", item0)
     termList = []
     constantList = []
     if item0 != "":
         itemList.insert(0, "")
-        print(f"  itemList={itemList} (inserted \"\")")
+        logger.debug("itemList=%s (inserted \"\")", itemList)
     for (idx, item) in enumerate(itemList):
-        print(f"  idx={idx}, item='{item}'")
+        logger.debug("idx=%s, item='%s'", idx, item)
         if item == "+" or item == "-" or item == "":
-            print(f"    skip (is '', '+', '-')")
+            logger.debug("skip (is '', '+', '-')")
             continue
         #bitwise term
         elif re.search("\w+", item):
             term = itemList[idx - 1] + itemList[idx]
-            print(f"    term={term}")
+            logger.debug("term=%s", term)
             termList.append(term)
         #constant term
         elif re.search("\d+", item):
             term = itemList[idx - 1] + itemList[idx]
-            print(f"    constant={term}")
+            logger.debug("constant=%s", term)
             constantList.append(term)
         else:
             raise RuntimeError(f"expression_2_term failed: This is something wrong in mba expression: idx={idx}, item={item}")
@@ -328,7 +362,7 @@ def generate_coe_bit(mbatermList: List[str]) -> List[List[str]]:
     Return:
         coeBitList: one list of pair [coe, bit]
     """
-    logger.debug(f"generate_coe_bit(mbatermList={mbatermList} (type={type(mbatermList)}))")
+    logger.debug("generate_coe_bit(mbatermList=%s (type=%s))", mbatermList, type(mbatermList))
     coeBitList = []
     for term in mbatermList:
         itemList = re.split("\*", term)
@@ -354,7 +388,7 @@ def generate_coe_bit(mbatermList: List[str]) -> List[List[str]]:
             coeBitList.append([str(coeValue), "~(x&~x)"])
             
         else:
-            print("error in function of generate_coe_bit")
+            logger.error("error in function of generate_coe_bit")
             exit(0)
 
     return coeBitList 
@@ -367,7 +401,7 @@ def combine_term(mbaExpre: str) -> str:
     Return:
         newmbaExpre: new mba expression have combined like terms.
     """
-    logger.debug(f"combine_term(mbaExpre={mbaExpre} (type={type(mbaExpre)}))")
+    logger.debug("combine_term(mbaExpre=%s (type=%s))", mbaExpre, type(mbaExpre))
     #get pair of coefficient and bitwise on the mba expression
     termList = expression_2_term(mbaExpre)
     coeBitList = generate_coe_bit(termList)
@@ -423,7 +457,7 @@ def addMBA(mbaExpre1: str, mbaExpre2: str) -> str:
     Return:
         mbaExpre: the mba expression by addition of mbaExpre1 and mbaExpre2
     """
-    logger.debug(f"addMBA(mbaExpre1={mbaExpre1} (type={type(mbaExpre1)}), mbaExpre2={mbaExpre2} (type={type(mbaExpre2)}))")
+    logger.debug("addMBA(mbaExpre1=%s (type=%s), mbaExpre2=%s (type=%s))", mbaExpre1, type(mbaExpre1), mbaExpre2, type(mbaExpre2))
     #get the coefficient and related bitwise 
     mbaterm1List = expression_2_term(mbaExpre1)
     coeBitList1 = generate_coe_bit(mbaterm1List)
@@ -482,7 +516,7 @@ def variable_list(expreStr: str) -> List[str]:
     Return:
         variableList: the list of variables.
     """
-    logger.debug(f"variable_list(expreStr={expreStr} (type={type(expreStr)}))")
+    logger.debug("variable_list(expreStr=%s (type=%s))", expreStr, type(expreStr))
     varSet = set(expreStr)
     variableList = []
     for i in varSet:
@@ -499,7 +533,18 @@ def get_entire_bitwise(vnumber: int) -> List[str]:
     Return:
         bitList: the entire bitwise expression.
     """
-    logger.debug(f"get_entire_bitwise(vnumber={vnumber} (type={type(vnumber)}))")
+    logger.debug("get_entire_bitwise(vnumber=%s (type=%s))", vnumber, type(vnumber))
+    return list(read_entire_bitwise(vnumber))
+
+
+@lru_cache(maxsize=None)
+def read_entire_bitwise(vnumber: int) -> Tuple[str, ...]:
+    """read the entire bitwise expression of 2/3/4-variable from the dataset, once per process.
+    Args:
+        vnumber: the number of the variables.
+    Return:
+        bitTuple: the entire bitwise expression.
+    """
     if not vnumber in [1, 2,3,4]:
         raise RuntimeError(f"vnumber must be [1-4], is - {vnumber}")
     truthfile = "./dataset/{vnumber}variable_truthtable.txt".format(vnumber=vnumber)
@@ -512,7 +557,31 @@ def get_entire_bitwise(vnumber: int) -> List[str]:
                 bit = itemList[1]
                 bitList.append(bit)
 
-    return bitList
+    return tuple(bitList)
+
+
+@lru_cache(maxsize=None)
+def basis_coefficients(vnumber: int, basisTuple: Tuple[str, ...]) -> List[List[int]]:
+    """transform the truth table of every bitwise expression into the linear combination of the basis.
+       the truth tables of the basis form an integer matrix A with an integer inverse, so the coefficients
+       of all bitwise expressions are one matrix product with the inverse of A.
+    Args:
+        vnumber: the number of the variables.
+        basisTuple: the basis vector.
+    Return:
+        bitTruthList: the coefficients of the basis on every one bitwise expression.
+    Raises:
+        RuntimeError: the basis has no integer inverse.
+    """
+    A = np.array([truthtable_bitwise(bit, vnumber) for bit in basisTuple], dtype=np.int64).T
+    inverse = np.rint(np.linalg.inv(A)).astype(np.int64)
+    if not (A @ inverse == np.identity(len(basisTuple), dtype=np.int64)).all():
+        raise RuntimeError("basis_coefficients: the truth table of the basis has no integer inverse")
+    #truth table of every bitwise expression, one per column
+    B = np.array([truthtable_bitwise(bit, vnumber) for bit in read_entire_bitwise(vnumber)], dtype=np.int64).T
+    bitTruthList: List[List[int]] = (inverse @ B).T.tolist()
+
+    return bitTruthList
 
 class MBASimplify(object):
     """
@@ -525,14 +594,12 @@ class MBASimplify(object):
     """
 
     def __init__(self, vnumber: int, basisList: List[str]) -> None:
-        logger.debug(f"MBASimplify.__init__(vnumber={vnumber} (type={type(vnumber)}), basisList={basisList} (type={type(basisList)}))")
+        logger.debug("MBASimplify.__init__(vnumber=%s (type=%s), basisList=%s (type=%s))", vnumber, type(vnumber), basisList, type(basisList))
         self.vnumber = vnumber
         self.basisList = basisList
         self.truthBasisList = []
         for bit in self.basisList:
-            print(f"  bit={bit}")
             self.truthBasisList.append(truthtable_bitwise(bit, vnumber))
-        print(f"truthBasisList={self.truthBasisList}")
         #transform bitwise to the combination of basis
         logger.info("transform bitwise to the combination of basis")
         self.bitTruthList = self.bit_2_basis()
@@ -541,8 +608,7 @@ class MBASimplify(object):
         for i in range(2 ** self.vnumber):
             vname = "X{num}".format(num=i)
             self.middleNameList.append(vname)
-        print(f"middleNameList={self.middleNameList}")
-        print("-----------------------------------INIT DONE--------------------------------------")
+        logger.debug("middleNameList=%s", self.middleNameList)
         return None
 
 
@@ -553,28 +619,9 @@ class MBASimplify(object):
         Returns:
             bitTruthList: the list of basis on every one bitwise expression.
         """
-        logger.debug(f"MBASimplify.bit_2_basis() -- get entire truth table, create the linear combination of every bitwise expression, just store the coefficient of every term.")
-        bitList = get_entire_bitwise(self.vnumber)
-        print(f"bitList={bitList}")
-        bitTruthList: List[List[int]] = []
-
-        print(f"  self.truthBasisList={self.truthBasisList}")
-        A = np.mat(self.truthBasisList).T
-        print(f"  A={A}")
-        for bit in bitList:
-            print(f"  bit={bit}")
-            truth = truthtable_bitwise(bit, self.vnumber)
-            print(f"  truth={truth}")
-            b = np.mat(truth).T
-            print(f"  b={b}")
-            resMatrix = np.linalg.solve(A, b)
-            print(f"  resMatrix={resMatrix}")
-            resList = np.array(resMatrix).reshape(-1,).tolist()
-            resList = [int(i) for i in resList]
-            print(f"  resList={resList}")
-            bitTruthList.append(resList)
-
-        return bitTruthList
+        logger.debug("MBASimplify.bit_2_basis() -- get entire truth table, create the linear combination of every bitwise expression, just store the coefficient of every term.")
+        #shared by every MBASimplify object on the same basis
+        return basis_coefficients(self.vnumber, tuple(self.basisList))
 
 
     def process_term(self, term: str) -> Optional[str]:
@@ -584,11 +631,10 @@ class MBASimplify(object):
             step4: construct every term into the multiplication of temp variable name.
             step5: goto step2, until loop end.
         """
-        print(f"  " + "-"*16)
-        print(f"  term={term}")
+        logger.debug("term=%s", term)
         #split the term
         itemList: List[str] = re.split("\*", term)
-        print(f"    itemList={itemList}")
+        logger.debug("itemList=%s", itemList)
         assert len(itemList), f"FIX: len(itemList) == 0 in MBASimplify.simplify"
         #the term is constant
         if len(itemList) == 1:
@@ -600,9 +646,9 @@ class MBASimplify(object):
                 elif coe_int > 0:
                     coeStr = "-{coe}".format(coe=coe_int)
                     itemList = [coeStr, "~(x&~x)"]
-                print(f"    -> itemList={itemList}")
+                logger.debug("-> itemList=%s", itemList)
             else:
-                print(f"    item contains variable (is not constant)")
+                logger.debug("item contains variable (is not constant)")
         #get the coefficient
         coe: str = itemList[0]
         if not re.search("\d", coe):
@@ -611,25 +657,20 @@ class MBASimplify(object):
                 coe = "-1"
             else:
                 coe = "+1"
-            print(f"    coe set to '{coe}'")
+            logger.debug("coe set to '%s'", coe)
         else:
-            print(f"    coe already set")
+            logger.debug("coe already set")
         bitTransList = []
         #transform every bitwise expression into linear combination of basis
         logger.debug("transform every bitwise expression into linear combination of basis")
         for bit in itemList[1:]:
-            print(f"      bit={bit}")
-            truth = truthtable_bitwise(bit, self.vnumber)
-            print(f"      truth={truth}")
-            #get the index of truth table
-            index = 0
-            for (idx, value) in enumerate(truth):
-                index += value *  2**idx
-            print(f"      index={index}")
+            logger.debug("bit=%s", bit)
+            #get the index of truth table: the packed truth table
+            index = truthtable_mask(bit, self.vnumber)
+            logger.debug("index=%s", index)
             #transform the truth table to the related basis
-            print(f"      self.bitTruthList={self.bitTruthList}")
             basisVec = self.bitTruthList[index]
-            print(f"      basisVec={basisVec}")
+            logger.debug("basisVec=%s", basisVec)
             basisStrList = []
             for (idx, value) in enumerate(basisVec):
                 if value < 0:
@@ -638,28 +679,27 @@ class MBASimplify(object):
                     basisStrList.append("+" + str(value) + "*" + self.middleNameList[idx]) 
             #construct one bitwise transformation 
             basisStr = "".join(basisStrList)
-            print(f"      basisStrList={basisStrList}")
+            logger.debug("basisStrList=%s", basisStrList)
             if basisStr:
                 if basisStr[0] == "+":
                     basisStr = basisStr[1:]
                 #one bitwise transformation
                 bitTransList.append("({basis})".format(basis=basisStr))
-                print(f"      bitTransList={bitTransList}")
+                logger.debug("bitTransList=%s", bitTransList)
         #not zero 
         if bitTransList:
             #construct the entire term.
             bitTrans = "*".join(bitTransList)
             #contain coefficient
             bitTrans = coe + "*" + bitTrans
-            print(f"      bitTrans={bitTrans}")
+            logger.debug("bitTrans=%s", bitTrans)
             return bitTrans
         return None
 
 
     def parse_subexpression(self, expr: str, depth: int = 0) -> Tuple[int, str, bool]:
         new_expr = ""
-        print("-"*64)
-        print(f"parse_subexpression({expr}, depth={depth})")
+        logger.debug("parse_subexpression(%s, depth=%s)", expr, depth)
         if depth > 100:
             raise RuntimeError(f"Recursion error")
         num_skip = 0
@@ -672,8 +712,7 @@ class MBASimplify(object):
                 # print("skipped!")
                 num_skip -= 1
                 continue
-            print(f"i={i}, c={c}, depth={depth}, new_expr={new_expr} -- {expr}")
-            print(" "*(2+len(str(i))+5+8+len(str(depth))+11+len(new_expr)+4) + " "*i + "^")
+            logger.debug("i=%s, c=%s, depth=%s, new_expr=%s -- %s", i, c, depth, new_expr, expr)
             if c == "(":
                 # recursively call this function again to resolve inner term
                 # we return both how many chars were processed in the inner term and the term itself
@@ -684,22 +723,19 @@ class MBASimplify(object):
             elif c == ")":
                 # if none of the inner expressions contain arithmetic, we can simplify the whole
                 if not any(map(lambda inner: inner[1], inner_stack)):
-                    print("="*32)
-                    print(f"can simplify: {new_expr}")
+                    logger.debug("can simplify: %s", new_expr)
                     old = new_expr
                     try:
                         simplified_expr = self.simplify(new_expr)
                         if "+" in simplified_expr or "-" in simplified_expr:
-                            print(f"refusing simplification: {old} -> {new_expr} <" + "~"*70)
+                            logger.debug("refusing simplification: %s -> %s", old, new_expr)
                         else:
                             new_expr = simplified_expr
-                        print("="*16 + "DONE" + "="*16)
-                        print(f"simplified: {old} -> {new_expr} <" + "~"*70)
+                        logger.debug("simplified: %s -> %s", old, new_expr)
                     except Exception as e:
                         logger.error(f"Skipping simplification -- raised: {str(e)}\ntried: {new_expr}")
                 ret_has_arith = has_arith or any(map(lambda inner: inner[1], inner_stack))
-                print(f"return len={i}, {new_expr}, has_arith={ret_has_arith}")
-                print("-"*16)
+                logger.debug("return len=%s, %s, has_arith=%s", i, new_expr, ret_has_arith)
                 return i, new_expr, ret_has_arith
             else:
                 new_expr += c
@@ -708,23 +744,23 @@ class MBASimplify(object):
         # if none of the inner expressions contain arithmetic, we can simplify the whole
         if not any(map(lambda inner: inner[1], inner_stack)):
             if "+" in new_expr or "-" in new_expr:
-                print(f"can simplify: {new_expr}")
+                logger.debug("can simplify: %s", new_expr)
                 old = new_expr
                 try:
                     new_expr = self.simplify(new_expr)
-                    print(f"simplified: {old} -> {new_expr} <" + "~"*70)
+                    logger.debug("simplified: %s -> %s", old, new_expr)
                 except Exception as e:
                     logger.error(f"Skipping simplification -- raised: {str(e)}\ntried: {new_expr}")
             else:
-                print(f"Only boolean arithmetic here.. not simplifying {new_expr}")
+                logger.debug("Only boolean arithmetic here.. not simplifying %s", new_expr)
         ret_has_arith = has_arith or any(map(lambda inner: inner[1], inner_stack))
-        print(f"return {len(expr) - 1}, {new_expr}, {ret_has_arith} -- string done")
+        logger.debug("return %s, %s, %s -- string done", len(expr) - 1, new_expr, ret_has_arith)
         return len(expr) - 1, new_expr, ret_has_arith
 
 
     def simplify_non_normalized(self, mbaexpre: str) -> str:
         # parse all subexpressions
-        print(f"initial mba_expr={mbaexpre}")
+        logger.debug("initial mba_expr=%s", mbaexpre)
         if len(mbaexpre) > 1:
             while mbaexpre[0] == "(" and mbaexpre[-1] == ")":
                 mbaexpre = mbaexpre[1:-1]
@@ -747,16 +783,15 @@ class MBASimplify(object):
         Return:
             resExpre: the related simplified MBA expression.
         """
-        logger.debug(f"MBASimplify.simplify(mbaExpre={mbaExpre} (type={type(mbaExpre)}))")
+        logger.debug("MBASimplify.simplify(mbaExpre=%s (type=%s))", mbaExpre, type(mbaExpre))
         #split the expression into terms
         logger.info("Stage 1: convert expression into terms")
         termList = expression_2_term(mbaExpre)
-        logger.debug(f"Term parsing done -- found {len(termList)} terms")
-        print(f"termList from expression_2_term: termList={termList}")
-        print("+"*32 + "Stage 1 done" + "+"*32)
+        logger.debug("Term parsing done -- found %s terms", len(termList))
+        logger.debug("termList from expression_2_term: termList=%s", termList)
         newtermList = []
         logger.info("Stage 2: apply magic onto terms")
-        print(f"process all terms in list:")
+        logger.debug("process all terms in list:")
         for term in termList:
             bitTrans = self.process_term(term)
             if bitTrans:
@@ -765,16 +800,14 @@ class MBASimplify(object):
         if not newtermList:
             logger.warning(f"Failed to find new terms -> returning original expression")
             return mbaExpre # no simplification possible
-        print("-"*12 + "terms processed" + "-"*12)
-        print(f"  newtermList={newtermList}")
+        logger.debug("newtermList=%s", newtermList)
         #construct the transformation temp result
         midExpre = "".join(newtermList)
-        print(f"  midExpre={midExpre}")
-        print("+"*32 + "Stage 2 done" + "+"*32)
+        logger.debug("midExpre=%s", midExpre)
         logger.info("Stage 3: Pass transformed formula to sympy")
         #simplify the temp result, but must process the power operator
         resExpre = self.sympy_simplify(midExpre)
-        print(f"  resExpre={resExpre}")
+        logger.debug("resExpre=%s", resExpre)
         resExpre = resExpre.strip()
         resExpre = resExpre.replace(" ", "")
         resExpre = self.power_expand(resExpre)
@@ -784,7 +817,7 @@ class MBASimplify(object):
             var = self.middleNameList[idx]
             basis = self.basisList[idx]
             resExpre = resExpre.replace(var, basis)
-        print(f"  -> resExpre={resExpre}")
+        logger.debug("-> resExpre=%s", resExpre)
 
         #verification
         z3res = verify_mba_unsat(mbaExpre, resExpre)
@@ -802,7 +835,7 @@ class MBASimplify(object):
         Returns:
             newmbaExpre: the simplified mba expression.
         """
-        logger.debug(f"MBASimplify.sympy_simplify(mbaExpre={mbaExpre} (type={type(mbaExpre)}))")
+        logger.debug("MBASimplify.sympy_simplify(mbaExpre=%s (type=%s))", mbaExpre, type(mbaExpre))
         #variable symbols
         if self.vnumber in [1, 2, 3, 4]:
             X0 = sympy.symbols("X0")
@@ -848,7 +881,7 @@ class MBASimplify(object):
         Returns:
             newmbaExpre: the expanded mba expression.
         """
-        logger.debug(f"MBASimplify.power_expand(mbaExpre={mbaExpre} (type={type(mbaExpre)}))")
+        logger.debug("MBASimplify.power_expand(mbaExpre=%s (type=%s))", mbaExpre, type(mbaExpre))
         #split the expression by power operator.
         itemList = re.split("(\*\*)", mbaExpre)
 
@@ -904,7 +937,7 @@ def refine_simplification(resultVector: List[int], vnumber: int) -> Tuple[bool,
     Raise:
         None.
     """
-    logger.debug(f"refine_simplification(resultVector={resultVector} (type={type(resultVector)}), vnumber={vnumber} (type={type(vnumber)}))")
+    logger.debug("refine_simplification(resultVector=%s (type=%s), vnumber=%s (type=%s))", resultVector, type(resultVector), vnumber, type(vnumber))
     truthtableList = get_entire_bitwise(vnumber)
 
     #refine the simplification result
@@ -941,7 +974,7 @@ def refine_mba(mbaExpre: str, vnumber: int) -> str:
         resList[1]: the new expression after refining.
         mbaExpre: cannot be refined, return the orignal mba expression.
     """
-    logger.debug(f"refine_mba(mbaExpre={mbaExpre} (type={type(mbaExpre)}), vnumber={vnumber} (type={type(vnumber)}))")
+    logger.debug("refine_mba(mbaExpre=%s (type=%s), vnumber=%s (type=%s))", mbaExpre, type(mbaExpre), vnumber, type(vnumber))
     truthList = truthtable_expression(mbaExpre, vnumber)
     resList = refine_simplification(truthList, vnumber)
 
@@ -951,6 +984,17 @@ def refine_mba(mbaExpre: str, vnumber: int) -> str:
         return mbaExpre
 
 
+@lru_cache(maxsize=None)
+def get_simplifier(vnumber: int) -> MBASimplify:
+    """get the MBASimplify object of the basis vector of vnumber variables, created once per process.
+    Args:
+        vnumber: the number of variables.
+    Returns:
+        psObj: the MBASimplify object.
+    """
+    return MBASimplify(vnumber, BASIS_VECTORS[vnumber])
+
+
 def simplify_MBA(mbaExpre: str) -> Tuple[str, int, str]:
     """simplify a MBA expression.
     Args:
@@ -960,17 +1004,13 @@ def simplify_MBA(mbaExpre: str) -> Tuple[str, int, str]:
         vnumber: the nubmer of variable in the mba expression.
         replaceStr: the variable name replacement relationship since our program only process the expression containing "x,y,z" variable.
     """
-    logger.debug(f"simplify_MBA(mbaExpre={mbaExpre} (type={type(mbaExpre)}))")
-    basisVecs = {2:["x", "y", "(x&y)", "~(x&~x)"], 3:["x", "y", "z", "(x&y)",  "(y&z)", "(x&z)", "(x&y&z)", "~(x&~x)"]}
-
+    logger.debug("simplify_MBA(mbaExpre=%s (type=%s))", mbaExpre, type(mbaExpre))
     assert "0x" not in mbaExpre, f"Cannot deal with constants yet"
     variables = set(re.findall("[a-z]", mbaExpre))
     assert "x" in variables and "y" in variables, f"Code currently only works for x, y"
     vnumber = len(variables)
-    print("+"*32 + "Stage 0" + "+"*32)
     logger.info("Stage 0: Create MBASimplify object and generate truth tables for basis vector")
-    psObj = MBASimplify(vnumber, basisVecs[vnumber])
-    print("+"*32 + "Stage 0 done" + "+"*32)
+    psObj = get_simplifier(vnumber)
     simExpre = psObj.simplify_non_normalized(mbaExpre)
     return (simExpre, vnumber, "xy")
 
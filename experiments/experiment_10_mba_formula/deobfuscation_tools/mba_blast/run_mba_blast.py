@@ -4,8 +4,8 @@
 Run MBA-Blast on MBA formulas
 """
 
-import io
 import json
+import os
 import sys
 import time
 from argparse import ArgumentParser
@@ -14,7 +14,7 @@ from multiprocessing import Pool
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
 
-from mba_blast import simplify_string
+from mba_blast import BASIS_VECTORS, get_simplifier, simplify_string
 
 
 def load_mbas(path: Path) -> List[str]:
@@ -42,18 +42,21 @@ def name_to_groundtruth(name: str) -> str:
     raise RuntimeError(f"Unexpected filename '{name}' -- expected one of {{add, sub, xor, or, and, mul, shl}}")
 
 
+def init_worker() -> None:
+    # MBA-Blast reports its progress on stdout, which is not used
+    sys.stdout = open(os.devnull, "w", encoding="utf-8")
+    # basis tables are built once per worker and variable count
+    for vnumber in BASIS_VECTORS:
+        get_simplifier(vnumber)
+
+
 def test_mba(groundtruth: str, mba: str) -> Tuple[str, str, str, Optional[bool]]:
-    stdout = sys.stdout
-    buf = io.StringIO()
-    sys.stdout = buf
     try:
         simplified = simplify_string(mba, groundtruth)
     except Exception as e:
         if str(e).strip() == "error in simplify MBA expression: mbaExpre != resExpre":
             return (mba, "None", groundtruth, None)
         raise RuntimeError(f"mba={mba} raised: {e}") from e
-    finally:
-        sys.stdout = stdout
     return (mba, simplified, groundtruth, check_result(mba, simplified, groundtruth))
 
 
@@ -75,38 +78,39 @@ def main(paths: List[Path], output_dir: Path) -> None:
     result_dir = (output_dir / "mba_blast_data").resolve()
     result_dir.mkdir()
     starttime = time.time()
-    for path in paths:
-        print(f"Processing {path}")
-        assert "_" in path.name, "Expected filename to be of format OP_depthDEPTH.txt"
-        groundtruth = name_to_groundtruth(path.name.split("_", 1)[0])
-        mbas = load_mbas(path)
-        func = partial(test_mba, groundtruth)
-        with Pool() as pool:
+    # one pool for all files: workers keep their basis tables and verification results
+    with Pool(initializer=init_worker) as pool:
+        for path in paths:
+            print(f"Processing {path}")
+            assert "_" in path.name, "Expected filename to be of format OP_depthDEPTH.txt"
+            groundtruth = name_to_groundtruth(path.name.split("_", 1)[0])
+            mbas = load_mbas(path)
+            func = partial(test_mba, groundtruth)
             res = pool.map(func, mbas)
-        with open(result_dir / path.with_suffix(".txt").name, "w", encoding="utf-8") as df:
-            for entry in res:
-                df.write(",".join(map(str, entry)) + "\n")
-        data_result = list(map(lambda t: t[-1], res))
-        data = {path.name : {
-            "success" : data_result.count(True),
-            "failure" : data_result.count(False),
-            "error" : data_result.count(None)
-        }}
-        # with open(result_dir / path.with_suffix(".json").name, "w") as df:
-        #     json.dump(data, df)
-        stats["data"].update(data)
-        if len(res):
-            success_p = round(100 * data_result.count(True) / len(res), 2)
-            failure_p = round(100 * data_result.count(False) / len(res), 2)
-            error_p = round(100 * data_result.count(None) / len(res), 2)
-        else:
-            success_p = 0
-            failure_p = 0
-            error_p = 0
-        print(f"Success: {data_result.count(True)} ({success_p}%)")
-        print(f"Failure: {data_result.count(False)} ({failure_p}%)")
-        print(f"Error: {data_result.count(None)} ({error_p}%)")
-        print(f"Total: {len(res)}")
+            with open(result_dir / path.with_suffix(".txt").name, "w", encoding="utf-8") as df:
+                for entry in res:
+                    df.write(",".join(map(str, entry)) + "\n")
+            data_result = list(map(lambda t: t[-1], res))
+            data = {path.name : {
+                "success" : data_result.count(True),
+                "failure" : data_result.count(False),
+                "error" : data_result.count(None)
+            }}
+            # with open(result_dir / path.with_suffix(".json").name, "w") as df:
+            #     json.dump(data, df)
+            stats["data"].update(data)
+            if len(res):
+                success_p = round(100 * data_result.count(True) / len(res), 2)
+                failure_p = round(100 * data_result.count(False) / len(res), 2)
+                error_p = round(100 * data_result.count(None) / len(res), 2)
+            else:
+                success_p = 0
+                failure_p = 0
+                error_p = 0
+            print(f"Success: {data_result.count(True)} ({success_p}%)")
+            print(f"Failure: {data_result.count(False)} ({failure_p}%)")
+            print(f"Error: {data_result.count(None)} ({error_p}%)")
+            print(f"Total: {len(res)}")
     runtime = round(time.time() - starttime, 2)
     stats["metadata"]["runtime"] = f"{runtime}s"
     with open(output_dir / "mba_blast_stats.json", "w", encoding="utf-8") as f:
@@ -10,10 +10,12 @@ from argparse import ArgumentParser
 from collections import namedtuple
 from multiprocessing import Pool
 from pathlib import Path
-from typing import Iterator, List
+from typing import List
 import random
 import time
 
+from lokiattack.bytecode import first_key_per_handler, load_bytecode
+
 
 Entry = namedtuple("Entry", "path handler_idx key")
 
@@ -29,30 +31,15 @@ def enumerate_testcases(workdirs: Path, allow: List[str], deny: List[str]) -> Li
     return testcases
 
 
-def parse_bytecode(path: Path) -> Iterator[bytes]:
-    with open(path, "rb") as f:
-        content = f.read()
-    assert len(content) % 24 == 0, f"Bytecode length should be a mulitple of 24 but is {len(content)}"
-    for i in range(0, len(content), 24):
-        yield content[i:i+24]
-
-
 def collect_entry(path: Path) -> List[Entry]:
     """
     Extract handler_idx key for each handler. Ignores calls to memory handler (0x1)
     and picks the first key found for each handler. Multiple keys exist but only the
     first found key is used.
     """
-    entries = set()
-    handler_indices = set()
-    for chunk in parse_bytecode(path / "byte_code.bin"):
-        handler_idx = int.from_bytes(chunk[:2], byteorder="little")
-        key = int.from_bytes(chunk[16:24], byteorder="little")
-        if handler_idx == 0x1 or handler_idx in handler_indices:
-            continue
-        entries.add(Entry(path.as_posix(), hex(handler_idx), hex(key)))
-        handler_indices.add(handler_idx)
-    return list(entries)
+    bytecode = load_bytecode(path / "byte_code.bin")
+    return [Entry(path.as_posix(), hex(handler_idx), hex(key))
+            for handler_idx, key in first_key_per_handler(bytecode).items()]
 
 
 def collect_all(path: Path) -> List[Entry]:
@@ -27,23 +27,22 @@ def slice_backwards_path(file_path, address, output_instr_va, path):
     asm_cfg = mdis.dis_multiblock(address)
     ir_cfg = ira.new_ircfg_from_asmcfg(asm_cfg)
 
-    output_instr_loc = va_to_cfg_loc(ir_cfg, output_instr_va)
-    sliced_instr_locs = _slice_backwards_path(ir_cfg, path, output_instr_loc)
-
-    return cfg_locs_to_vas(ir_cfg, sliced_instr_locs)
+    return PathSlicer(ir_cfg).slice_path(output_instr_va, path)
 
 
 def slice_backwards_path_alt(ir_cfg, output_instr_va, path):
-    output_instr_loc = va_to_cfg_loc(ir_cfg, output_instr_va)
-    sliced_instr_locs = _slice_backwards_path(ir_cfg, path, output_instr_loc)
-
-    return cfg_locs_to_vas(ir_cfg, sliced_instr_locs)
+    return PathSlicer(ir_cfg).slice_path(output_instr_va, path)
 
 
 def _slice_backwards_path(cfg, path, output_instr_loc):
     _cfg = copy_ircfg(cfg)
     ssa_path = BackwardSlicer(_cfg)
     ssa_path.transform(path)
+
+    return _slice_backwards_ssa_path(ssa_path, output_instr_loc)
+
+
+def _slice_backwards_ssa_path(ssa_path, output_instr_loc):
     ssa_exprs = ssa_path.get_ssa_exprs_at_loc(output_instr_loc)
     sliced_instr_locs = set()
     for ssa_expr in ssa_exprs:
@@ -101,6 +100,19 @@ def va_to_cfg_loc(cfg, va):
     raise VADoesNotExistExeception
 
 
+def index_cfg_locs(cfg):
+    """
+    Maps each VA of cfg to its first location, like va_to_cfg_loc
+    :return: {va: (loc_key, index)}
+    """
+    _va_to_loc = {}
+    for _loc_key, _block in cfg.blocks.items():
+        for _index, assignblk in enumerate(_block.assignblks):
+            _va_to_loc.setdefault(assignblk.instr.offset, (_loc_key, _index))
+
+    return _va_to_loc
+
+
 class RHS:
     def __init__(self, rhs, loc):
         self.rhs = rhs
@@ -117,14 +129,35 @@ class BackwardSlicer(SSAPath):
     def __init__(self, ircfg):
         self.mem_assignments = {}
         self.path = None
+        # index of the last occurrence of each block on the path
+        self.path_index = {}
+        # SSA expressions per location, inverse of ssa_to_location
+        self.location_to_ssa = {}
         self.word_size = ircfg.IRDst.size  # assuming arch word size from IRDst
         super(BackwardSlicer, self).__init__(ircfg)
+        # blocks of the path, transformed in place
+        self.blocks = self.ircfg.blocks
 
     def transform(self, path):
         self.mem_assignments = {}
-        self.path = path
+        self.location_to_ssa = {}
+        self.set_path(path)
         super(BackwardSlicer, self).transform(path)
 
+    def set_path(self, path):
+        self.path = path
+        self.path_index = {loc_key: i for i, loc_key in enumerate(path)}
+
+    def get_block(self, loc_key):
+        return self.blocks.get(loc_key, None)
+
+    def set_location(self, ssa_expr, loc):
+        old_loc = self.ssa_to_location.get(ssa_expr)
+        if old_loc is not None:
+            self.location_to_ssa[old_loc].discard(ssa_expr)
+        self.ssa_to_location[ssa_expr] = loc
+        self.location_to_ssa.setdefault(loc, set()).add(ssa_expr)
+
     def slice_backwards(self, expr):
         instruction_locations = set()
 
@@ -186,7 +219,7 @@ class BackwardSlicer(SSAPath):
             todo.add(RHS(rhs_of_rhs, mem_assgnmnt.cfg_loc))
 
     def get_rhs_from_cfg(self, lhs, loc):
-        assignblk = self.ircfg.blocks[loc[0]][loc[1]]
+        assignblk = self.blocks[loc[0]][loc[1]]
         for dst, src in viewitems(assignblk):
             if lhs == dst:
                 return src
@@ -212,17 +245,23 @@ class BackwardSlicer(SSAPath):
         cur_block = cur_cfg_loc[0]
         cur_index = cur_cfg_loc[1]
 
-        for i, loc_key in enumerate(self.path):
-            if cur_block == loc_key:
-                _index = i
+        _index = self.path_index[cur_block]
 
         path = self.path[:_index+1]
         path.reverse()
 
+        # assignment indexes per block, in descending order
+        block_indexes = {}
+        for a_loc in expr_mem_cfg_locs.keys():
+            block_indexes.setdefault(a_loc[0], []).append(a_loc[1])
+        for indexes in block_indexes.values():
+            indexes.sort(reverse=True)
+
         resulting_locs = []
         bits_covered = 0
         for loc_key in path:
             tmp_locs, bits_covered = self._retrieve_closest_mem_assignments(loc_key, expr_mem_cfg_locs,
+                                                                            block_indexes.get(loc_key, []),
                                                                             cur_block, cur_index, expr_size,
                                                                             bits_covered)
             resulting_locs.extend(tuple(tmp_locs))
@@ -231,20 +270,13 @@ class BackwardSlicer(SSAPath):
 
         return resulting_locs
 
-    def _retrieve_closest_mem_assignments(self, loc_key, expr_mem_cfg_locs,
+    def _retrieve_closest_mem_assignments(self, loc_key, expr_mem_cfg_locs, indexes,
                                           cur_block, cur_index, expr_size, bits_covered):
         assignment_locs = []
         if loc_key == cur_block:
             s_index = cur_index
         else:
-            s_index = len(self.ircfg.blocks[loc_key].assignblks)-1
-
-        indexes = set()
-        for a_loc in expr_mem_cfg_locs.keys():
-            if a_loc[0] == loc_key:
-                indexes.add(a_loc[1])
-        indexes = sorted(indexes)
-        indexes.reverse()
+            s_index = len(self.blocks[loc_key].assignblks)-1
 
         for index in indexes:
             if index >= s_index:
@@ -308,7 +340,7 @@ class BackwardSlicer(SSAPath):
                 # rebuild SSA expression
                 expr = ExprAssign(dst_ssa, src_ssa)
                 self.expressions[dst_ssa] = src_ssa
-                self.ssa_to_location[dst_ssa] = (loc_key, index)
+                self.set_location(dst_ssa, (loc_key, index))
 
                 if dst_ssa.is_mem():
                     if dst_ssa in self.mem_assignments:
@@ -321,12 +353,102 @@ class BackwardSlicer(SSAPath):
 
         # replace blocks IR expressions with corresponding SSA transformations
         new_irblock = self._convert_block(irblock, ssa_expressions_block)
-        self.ircfg.blocks[loc_key] = new_irblock
+        self.blocks[loc_key] = new_irblock
 
     def get_ssa_exprs_at_loc(self, instr_loc):
-        _ssa_exprs = set()
-        for _ssa_expr, _loc in self.ssa_to_location.items():
-            if _loc == instr_loc:
-                _ssa_exprs.add(_ssa_expr)
+        return set(self.location_to_ssa.get(instr_loc, ()))
+
 
-        return _ssa_exprs
+class SSAPrefix(object):
+    """
+    Node of the prefix trie of a PathSlicer: the SSA renaming
+    state after a path prefix, and the SSA expressions and
+    transformed block added by its last block.
+    """
+
+    def __init__(self, loc_key, stack_rhs, stack_lhs, expressions, ssa_to_location, mem_assignments, block):
+        self.loc_key = loc_key
+        self.stack_rhs = stack_rhs
+        self.stack_lhs = stack_lhs
+        self.expressions = expressions
+        self.ssa_to_location = ssa_to_location
+        self.mem_assignments = mem_assignments
+        self.block = block
+        self.children = {}
+
+
+class PathSlicer(object):
+    """
+    Backward slicer for the paths of an IRCFG. The SSA
+    transformation of a path prefix is computed once and
+    shared by all paths starting with it, in a prefix trie:
+    a new path only transforms the blocks after its longest
+    known prefix. The IRCFG is not modified.
+    """
+
+    def __init__(self, ircfg):
+        self.ircfg = ircfg
+        self.va_to_loc = index_cfg_locs(ircfg)
+        self.root = SSAPrefix(None, {}, {}, {}, {}, {}, None)
+        # transforms single blocks, its state is set per prefix
+        self._ssa_block = BackwardSlicer(ircfg)
+
+    def slice_path(self, output_instr_va, path):
+        """
+        :param output_instr_va: int, VA of instruction which writes to output
+        :param path: list of LocKeys
+        :return: set of VAs of the sliced instructions
+        """
+        if output_instr_va not in self.va_to_loc:
+            raise VADoesNotExistExeception
+        output_instr_loc = self.va_to_loc[output_instr_va]
+
+        sliced_instr_locs = _slice_backwards_ssa_path(self.transform(path), output_instr_loc)
+
+        return cfg_locs_to_vas(self.ircfg, sliced_instr_locs)
+
+    def transform(self, path):
+        """
+        Transforms a path into SSA
+        :param path: list of LocKeys
+        :return: BackwardSlicer of the path
+        """
+        ssa_path = BackwardSlicer(self.ircfg)
+        ssa_path.set_path(list(path))
+        ssa_path.ssa_variable_to_expr = self._ssa_block.ssa_variable_to_expr
+        ssa_path.blocks = {}
+
+        node = self.root
+        for loc_key in path:
+            child = node.children.get(loc_key)
+            if child is None:
+                # a block repeated on the path is transformed again in its SSA form
+                block = ssa_path.blocks.get(loc_key, self.ircfg.blocks.get(loc_key))
+                child = self._transform_block(node, loc_key, block)
+                node.children[loc_key] = child
+            node = child
+
+            ssa_path.expressions.update(node.expressions)
+            for ssa_expr, loc in viewitems(node.ssa_to_location):
+                ssa_path.set_location(ssa_expr, loc)
+            for dst, locs in viewitems(node.mem_assignments):
+                ssa_path.mem_assignments.setdefault(dst, []).extend(locs)
+            if node.block is not None:
+                ssa_path.blocks[loc_key] = node.block
+
+        return ssa_path
+
+    def _transform_block(self, node, loc_key, block):
+        ssa_block = self._ssa_block
+        ssa_block._stack_rhs = dict(node.stack_rhs)
+        ssa_block._stack_lhs = dict(node.stack_lhs)
+        ssa_block.expressions = {}
+        ssa_block.ssa_to_location = {}
+        ssa_block.location_to_ssa = {}
+        ssa_block.mem_assignments = {}
+        ssa_block.blocks = {loc_key: block} if block is not None else {}
+
+        ssa_block._rename_expressions(loc_key)
+
+        return SSAPrefix(loc_key, ssa_block._stack_rhs, ssa_block._stack_lhs, ssa_block.expressions,
+                         ssa_block.ssa_to_location, ssa_block.mem_assignments, ssa_block.blocks.get(loc_key))
@@ -0,0 +1,67 @@
+"""
+Reader for byte_code.bin.
+
+Each bytecode entry is 24 bytes (see loki's bytecode translator):
+
+    handler_idx (u16) | output (u16) | x (u16) | y (u16) | constant (u64) | key (u64)
+
+with all fields little-endian; output, x and y are VM register slots. The file is
+memory-mapped as a NumPy structured array, so queries over all entries are array
+operations instead of per-entry Python loops.
+"""
+
+import os
+from pathlib import Path
+from typing import Dict, Iterable, Union
+
+import numpy as np
+
+
+BYTECODE_ENTRY = np.dtype([
+    ("handler_idx", "<u2"),
+    ("output", "<u2"),
+    ("x", "<u2"),
+    ("y", "<u2"),
+    ("constant", "<u8"),
+    ("key", "<u8"),
+])
+assert BYTECODE_ENTRY.itemsize == 24
+
+MEMORY_HANDLER_IDX = 0x1
+
+
+def load_bytecode(path: Union[str, Path]) -> np.ndarray:
+    """Memory-map the bytecode file as a read-only array of BYTECODE_ENTRY"""
+    size = os.path.getsize(path)
+    assert size % BYTECODE_ENTRY.itemsize == 0, f"Bytecode length should be a mulitple of 24 but is {size}"
+    if size == 0:
+        # mmap cannot map empty files
+        return np.empty(0, dtype=BYTECODE_ENTRY)
+    return np.memmap(path, dtype=BYTECODE_ENTRY, mode="r")
+
+
+def get_entry_key(bytecode: np.ndarray, key_index: int) -> int:
+    """Key of the key_index-th entry (counting from 1)"""
+    if not 1 <= key_index <= len(bytecode):
+        raise IndexError(f"Bytecode entry {key_index} out of range (1..{len(bytecode)})")
+    return int(bytecode["key"][key_index - 1])
+
+
+def handler_trace(bytecode: np.ndarray) -> np.ndarray:
+    """Handler indices in execution order"""
+    return np.array(bytecode["handler_idx"])
+
+
+def handler_histogram(bytecode: np.ndarray) -> Dict[int, int]:
+    """Number of entries per handler index"""
+    handlers, counts = np.unique(bytecode["handler_idx"], return_counts=True)
+    return dict(zip(handlers.tolist(), counts.tolist()))
+
+
+def first_key_per_handler(bytecode: np.ndarray,
+                          ignored_handlers: Iterable[int] = (MEMORY_HANDLER_IDX,)) -> Dict[int, int]:
+    """Map each handler index to the key of its first entry in the bytecode"""
+    handlers, first_indices = np.unique(bytecode["handler_idx"], return_index=True)
+    keys = bytecode["key"][first_indices]
+    keep = ~np.isin(handlers, list(ignored_handlers))
+    return dict(zip(handlers[keep].tolist(), keys[keep].tolist()))
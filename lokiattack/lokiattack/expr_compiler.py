@@ -0,0 +1,191 @@
+"""
+Compilation of miasm expressions to Python functions.
+
+An expression is translated once, by a TranslatorPython whose operators follow the
+constant folding of expr_simp, into a function evaluating it on a list of input
+vectors. Subexpressions referenced more than once are computed once per sample,
+and compiled functions are cached per expression, so repeatedly evaluating the
+same semantics only costs the arithmetic.
+"""
+
+from collections import Counter
+from functools import lru_cache
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from miasm.expression.expression import Expr
+from miasm.ir.translators.python import TranslatorPython
+
+# number of compiled expressions kept per process
+MAX_COMPILED_EXPRS = 1024
+
+CompiledExpr = Callable[[Sequence[Sequence[int]]], List[int]]
+
+
+class UnsupportedExpression(Exception):
+    pass
+
+
+def _to_signed(value: int, size: int) -> int:
+    sign = 1 << (size - 1)
+    return (value ^ sign) - sign
+
+
+def _udiv(x: int, y: int, mask: int) -> int:
+    return (x // y) & mask
+
+
+def _umod(x: int, y: int, mask: int) -> int:
+    return (x % y) & mask
+
+
+def _sdiv_signed(x: int, y: int) -> int:
+    # rounds towards zero, like miasm's modint
+    quotient = abs(x) // abs(y)
+    return quotient if x * y >= 0 else -quotient
+
+
+def _sdiv(x: int, y: int, size: int, mask: int) -> int:
+    return _sdiv_signed(_to_signed(x, size), _to_signed(y, size)) & mask
+
+
+def _smod(x: int, y: int, size: int, mask: int) -> int:
+    x, y = _to_signed(x, size), _to_signed(y, size)
+    return (x - y * _sdiv_signed(x, y)) & mask
+
+
+def _rotate_right(value: int, shifter: int, size: int, mask: int) -> int:
+    shifter %= size
+    return ((value >> shifter) | (value << (size - shifter))) & mask
+
+
+def _rotate_left(value: int, shifter: int, size: int, mask: int) -> int:
+    shifter %= size
+    return ((value << shifter) | (value >> (size - shifter))) & mask
+
+
+NAMESPACE = {
+    "_to_signed": _to_signed,
+    "_udiv": _udiv,
+    "_umod": _umod,
+    "_sdiv": _sdiv,
+    "_smod": _smod,
+    "_rotate_right": _rotate_right,
+    "_rotate_left": _rotate_left,
+}
+
+
+def _arguments(expr: Expr) -> Tuple[Expr, ...]:
+    if expr.is_op() or expr.is_compose():
+        return expr.args
+    if expr.is_slice():
+        return expr.arg,
+    if expr.is_cond():
+        return expr.cond, expr.src1, expr.src2
+    if expr.is_mem():
+        return expr.ptr,
+    return ()
+
+
+def _shared_subexpressions(expr: Expr) -> set:
+    """Non-leaf subexpressions of expr that are referenced more than once"""
+    references = Counter()
+    todo = [expr]
+    while todo:
+        current = todo.pop()
+        references[current] += 1
+        if references[current] == 1:
+            todo.extend(_arguments(current))
+    return {e for e, count in references.items() if count > 1 and _arguments(e)}
+
+
+class TranslatorPythonFunction(TranslatorPython):
+    """
+    Translates an expression into the body of a Python function. Variables
+    are bound to the given names; shared subexpressions are assigned to
+    temporaries, which are collected in self.assignments.
+    """
+
+    def __init__(self, names: Dict[Expr, str], shared: set):
+        super().__init__()
+        self.names = dict(names)
+        self.shared = shared
+        self.assignments = []
+
+    def from_expr(self, expr):
+        if expr in self.names:
+            return self.names[expr]
+
+        code = super().from_expr(expr)
+        if expr not in self.shared:
+            return code
+
+        name = "t{}".format(len(self.assignments))
+        self.assignments.append("{} = {}".format(name, code))
+        self.names[expr] = name
+        return name
+
+    def from_ExprId(self, expr):
+        raise UnsupportedExpression(expr)
+
+    def from_ExprLoc(self, expr):
+        raise UnsupportedExpression(expr)
+
+    def from_ExprMem(self, expr):
+        raise UnsupportedExpression(expr)
+
+    def from_ExprOp(self, expr):
+        # mirrors the constant folding of miasm's simp_cst_propagation
+        op, size, mask = expr.op, expr.size, int(expr.mask)
+
+        if op in ("+", "*", "^", "&", "|", "-") or (op in ("%", ">>") and len(expr.args) == 2):
+            return super().from_ExprOp(expr)
+        if len(expr.args) != 2:
+            raise UnsupportedExpression(expr)
+
+        value, shifter = map(self.from_expr, expr.args)
+        if op == "/":
+            # floor division; TranslatorPython emits Python's true division
+            return "_udiv(%s, %s, 0x%x)" % (value, shifter, mask)
+        if op == "<<":
+            return "((%s << min(%s, %d)) & 0x%x)" % (value, shifter, size, mask)
+        if op == "a>>":
+            return "((_to_signed(%s, %d) >> min(%s, %d)) & 0x%x)" % (value, size, shifter, size, mask)
+        if op in ("udiv", "umod"):
+            return "_%s(%s, %s, 0x%x)" % (op, value, shifter, mask)
+        if op in ("sdiv", "smod"):
+            return "_%s(%s, %s, %d, 0x%x)" % (op, value, shifter, size, mask)
+        if op == ">>>":
+            return "_rotate_right(%s, %s, %d, 0x%x)" % (value, shifter, expr.args[1].size, mask)
+        if op == "<<<":
+            return "_rotate_left(%s, %s, %d, 0x%x)" % (value, shifter, expr.args[1].size, mask)
+
+        raise UnsupportedExpression(expr)
+
+
+@lru_cache(maxsize=MAX_COMPILED_EXPRS)
+def _compile_expr(expr: Expr, variables: Tuple[Expr, ...]) -> CompiledExpr:
+    names = {variable: "v{}".format(index) for index, variable in enumerate(variables)}
+    translator = TranslatorPythonFunction(names, _shared_subexpressions(expr))
+    result = translator.from_expr(expr)
+
+    body = "".join("        {}\n".format(assignment) for assignment in translator.assignments)
+    source = ("def evaluate(samples):\n"
+              "    outputs = []\n"
+              "    append = outputs.append\n"
+              "    for {} in samples:\n"
+              "{}"
+              "        append({})\n"
+              "    return outputs\n").format(", ".join(list(names.values()) + ["*_"]) if names else "_", body, result)
+
+    namespace = dict(NAMESPACE)
+    exec(compile(source, "<compiled {}>".format(expr), "exec"), namespace)
+    return namespace["evaluate"]
+
+
+def compile_expr(expr: Expr, variables: Sequence[Expr]) -> CompiledExpr:
+    """
+    Compile expr into a function mapping a list of input vectors (one value per
+    variable, fitting its size) to the list of outputs. Raises UnsupportedExpression
+    if expr contains memory, unbound identifiers or operators without a translation.
+    """
+    return _compile_expr(expr, tuple(variables))
@@ -1,7 +1,6 @@
 from __future__ import print_function
 
 from collections import OrderedDict
-from os import popen
 
 from miasm.core.locationdb import LocationDB
 from miasm.expression.expression import *
@@ -9,24 +8,24 @@ from miasm.expression.simplifications import expr_simp
 from miasm.ir.ir import AssignBlock, IRBlock
 from pathlib import Path
 
+from .bytecode import get_entry_key, load_bytecode
+from .symbols import get_symbol_address
+
 
 
 def get_context_address(file_path: str) -> int:
-    return int(popen('nm {} | grep context'.format(file_path)).read().split(" ")[0], 16)
+    return get_symbol_address(file_path, "context")
 
 
 def get_bytecode_address(file_path: str) -> int:
-    return int(popen('nm {} | grep bytecode'.format(file_path)).read().split(" ")[0], 16)
+    return get_symbol_address(file_path, "bytecode")
 
 def get_handler_address(file_path: str, index: int) -> int:
-    return int(popen('nm {} | grep vm_alu{}_rrr_generated'.format(file_path, index)).read().split(" ")[0], 16)
+    return get_symbol_address(file_path, "vm_alu{}_rrr_generated".format(index))
 
 def get_key(file_: Path, key_index: int) -> int:
     """Retrieve the key of the key_index-th entry"""
-    with open(file_, 'rb') as byte_code_file:
-        # 24 bytes = 1 entry; key is last 8 bytes
-        bytecode = byte_code_file.read()[24*(key_index-1)+16:24*key_index][::-1]
-    return int(''.join(['{:02x}'.format(b) for b in bytecode]), 16)
+    return get_entry_key(load_bytecode(file_), key_index)
 
 def drop_index(expr):
     if isinstance(expr, (ExprLoc, ExprInt)):
@@ -468,79 +467,14 @@ class CastExprComposeExprIntException(Exception):
 def contains_expr_cond(expr):
     assert isinstance(expr, Expr)
 
-    if expr.is_int():
-        return False
-
-    elif expr.is_id():
-        return False
-
-    elif expr.is_loc():
-        return False
-
-    elif expr.is_mem():
-        return contains_expr_cond(expr.ptr)
-
-    elif expr.is_op() or expr.is_compose():
-        contains_cond = False
-        for arg in expr.args:
-            contains_cond |= contains_expr_cond(arg)
-        return contains_cond
-
-    elif expr.is_cond():
-        return True
-
-    elif expr.is_slice():
-        return False
-
-    else:
-        print("ERROR in containexpr_cond:" + \
-              "{} not supported".format(type(expr)))
-        exit()
+    return expr.summary.has_cond
 
 
 def contains_slice_of_expr(expr, s_expr):
     assert isinstance(expr, Expr) and \
            isinstance(s_expr, Expr)
 
-    if s_expr.is_int():
-        return False
-
-    elif s_expr.is_id():
-        return False
-
-    elif s_expr.is_loc():
-        return False
-
-    elif s_expr.is_mem():
-        return contains_slice_of_expr(expr, s_expr.ptr)
-
-    elif s_expr.is_op() or s_expr.is_compose():
-        contains_slice = False
-        for arg in s_expr.args:
-            contains_slice |= contains_slice_of_expr(expr, arg)
-
-        return contains_slice
-
-    elif s_expr.is_cond():
-        contains_slice = contains_slice_of_expr(expr,
-                                                s_expr.cond)
-        contains_slice |= contains_slice_of_expr(expr,
-                                                 s_expr.src1)
-        contains_slice |= contains_slice_of_expr(expr,
-                                                 s_expr.src2)
-
-        return contains_slice
-
-    elif s_expr.is_slice():
-        if expr == s_expr.arg:
-            return True
-
-        return False
-
-    else:
-        print("ERROR in contains_slice_of_expr (helper.py):" + \
-              "{} not supported".format(type(expr)))
-        exit()
+    return expr in s_expr.summary.slice_args
 
 
 def transform_to_loc_key(el, loc_db):
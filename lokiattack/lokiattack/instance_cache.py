@@ -0,0 +1,169 @@
+"""
+Per-instance analysis cache.
+
+Every core semantics of an instance is analyzed on the same obf_exe, so parsing
+the binary and lifting its handlers is done once per instance: InstanceAnalysis
+holds the container, the symbols and the lifted CFGs of all vm_alu*_rrr_generated
+handlers. It is pickled to workdir/.lokiattack_cache, keyed by the SHA-256 of
+obf_exe, so that other plugins and processes only have to reload it.
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+from collections import OrderedDict, namedtuple
+from pathlib import Path
+from typing import Dict, Optional
+
+from miasm.analysis.binary import Container
+from miasm.analysis.machine import Machine
+from miasm.core.locationdb import LocationDB
+
+from .symbols import get_handler_addresses, get_symbol_address
+
+
+logger = logging.getLogger("LokiAttack")
+
+CACHE_DIR_NAME = ".lokiattack_cache"
+# bump whenever the pickled layout changes
+CACHE_FORMAT_VERSION = 1
+# number of instances kept in memory per process
+MAX_LOADED_INSTANCES = 4
+
+InstanceSymbols = namedtuple("InstanceSymbols", "context_addr bytecode_addr handler_addrs")
+LiftedHandler = namedtuple("LiftedHandler", "address asm_cfg ir_cfg")
+
+
+class InstanceAnalysis(object):
+    """Parsed obf_exe and lifted handlers of a single instance"""
+
+    def __init__(self, file_path: Path, digest: str, container: Container, loc_db: LocationDB,
+                 symbols: InstanceSymbols, handlers: Dict[int, LiftedHandler]):
+        self.file_path = file_path
+        self.digest = digest
+        self.container = container
+        self.loc_db = loc_db
+        self.symbols = symbols
+        self.handlers = handlers
+        self.machine = Machine(container.arch)
+        self.ira = self.machine.ira(loc_db)
+        self._mdis = None
+
+    @property
+    def mdis(self):
+        """Disassembly engine sharing the loc_db of the lifted handlers"""
+        if self._mdis is None:
+            self._mdis = self.machine.dis_engine(self.container.bin_stream, loc_db=self.loc_db)
+        return self._mdis
+
+    def handler(self, handler_index: int) -> LiftedHandler:
+        try:
+            return self.handlers[handler_index]
+        except KeyError:
+            raise RuntimeError(f"No handler vm_alu{handler_index}_rrr_generated in {self.file_path}")
+
+    @classmethod
+    def build(cls, file_path: Path, data: bytes, digest: str) -> "InstanceAnalysis":
+        """Parse obf_exe and lift all of its vm_alu*_rrr_generated handlers"""
+        container = Container.from_string(data)
+        symbols = read_symbols(file_path)
+
+        machine = Machine(container.arch)
+        mdis = machine.dis_engine(container.bin_stream)
+        ira = machine.ira(mdis.loc_db)
+
+        handlers = {}
+        for handler_index, address in sorted(symbols.handler_addrs.items()):
+            asm_cfg = mdis.dis_multiblock(address)
+            ir_cfg = ira.new_ircfg_from_asmcfg(asm_cfg)
+            handlers[handler_index] = LiftedHandler(address, asm_cfg, ir_cfg)
+
+        return cls(file_path, digest, container, mdis.loc_db, symbols, handlers)
+
+
+def read_symbols(file_path: Path) -> InstanceSymbols:
+    """Collect the VM context, bytecode and handler addresses of obf_exe"""
+    return InstanceSymbols(get_symbol_address(file_path, "context"), get_symbol_address(file_path, "bytecode"),
+                           get_handler_addresses(file_path))
+
+
+def _cache_file(workdir: Path, digest: str) -> Path:
+    return workdir / CACHE_DIR_NAME / f"{digest}.pickle"
+
+
+def _read_cache(workdir: Path, file_path: Path, data: bytes, digest: str) -> Optional[InstanceAnalysis]:
+    cache_file = _cache_file(workdir, digest)
+    if not cache_file.is_file():
+        return None
+    try:
+        with open(cache_file, "rb") as f:
+            state = pickle.load(f)
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable analysis cache {cache_file}: {e}")
+        return None
+    if state.get("version") != CACHE_FORMAT_VERSION or state.get("digest") != digest:
+        return None
+
+    # the container only wraps the raw file, re-parsing it is cheap
+    container = Container.from_string(data)
+    return InstanceAnalysis(file_path, digest, container, state["loc_db"], state["symbols"], state["handlers"])
+
+
+def _write_cache(workdir: Path, analysis: InstanceAnalysis) -> None:
+    cache_dir = workdir / CACHE_DIR_NAME
+    state = {
+        "version": CACHE_FORMAT_VERSION,
+        "digest": analysis.digest,
+        "loc_db": analysis.loc_db,
+        "symbols": analysis.symbols,
+        "handlers": analysis.handlers,
+    }
+    try:
+        cache_dir.mkdir(exist_ok=True)
+        # several workers may build the same instance: write to a temporary file and rename atomically
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, _cache_file(workdir, analysis.digest))
+    except OSError as e:
+        logger.warning(f"Failed to write analysis cache to {cache_dir}: {e}")
+        return
+
+    # drop caches of previous versions of obf_exe
+    for stale in cache_dir.glob("*.pickle"):
+        if stale.stem != analysis.digest:
+            try:
+                stale.unlink()
+            except OSError:
+                pass
+
+
+_loaded_instances: "OrderedDict[tuple, InstanceAnalysis]" = OrderedDict()
+
+
+def load_instance_analysis(workdir: Path) -> InstanceAnalysis:
+    """
+    Return the analysis of workdir/obf_exe. It is looked up in memory first, then
+    in the on-disk cache; if both miss, the binary is parsed, lifted and cached.
+    """
+    file_path = workdir / "obf_exe"
+    data = file_path.read_bytes()
+    digest = hashlib.sha256(data).hexdigest()
+
+    key = (file_path.resolve().as_posix(), digest)
+    analysis = _loaded_instances.get(key)
+    if analysis is not None:
+        _loaded_instances.move_to_end(key)
+        return analysis
+
+    analysis = _read_cache(workdir, file_path, data, digest)
+    if analysis is None:
+        analysis = InstanceAnalysis.build(file_path, data, digest)
+        _write_cache(workdir, analysis)
+
+    _loaded_instances[key] = analysis
+    if len(_loaded_instances) > MAX_LOADED_INSTANCES:
+        _loaded_instances.popitem(last=False)
+    return analysis
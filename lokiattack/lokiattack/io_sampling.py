@@ -0,0 +1,160 @@
+"""
+Concrete I/O sampling of symbolic semantics.
+
+Instead of substituting every random sample into the symbolic output and
+simplifying it with expr_simp (or executing the path again with concrete inputs),
+the output expression is evaluated once over whole columns of samples: each
+subexpression becomes a NumPy uint64 array holding its value for all samples.
+Expressions using operations without a vectorized counterpart, or wider than 64
+bits, are evaluated per sample by a compiled Python function (see expr_compiler),
+and by substitution and expr_simp as a last resort; the outputs are the same either
+way.
+"""
+
+from functools import reduce
+from random import getrandbits
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from miasm.expression.expression import Expr, ExprInt
+from miasm.expression.simplifications import expr_simp
+
+from .expr_compiler import UnsupportedExpression, compile_expr
+
+# expressions wider than this cannot be held in uint64 columns
+MAX_BATCH_SIZE = 64
+
+_FOLD_OPS = {
+    "+": np.add,
+    "*": np.multiply,
+    "^": np.bitwise_xor,
+    "&": np.bitwise_and,
+    "|": np.bitwise_or,
+}
+
+
+def _mask(size: int) -> np.uint64:
+    return np.uint64((1 << size) - 1)
+
+
+def _to_signed(value: np.ndarray, size: int) -> np.ndarray:
+    """Sign-extend size-bit values to int64"""
+    sign = np.uint64(1 << (size - 1))
+    return ((value ^ sign) - sign).view(np.int64)
+
+
+def _evaluate_op(expr: Expr, args: List[np.ndarray]) -> np.ndarray:
+    # mirrors the constant folding of miasm's simp_cst_propagation
+    op, size = expr.op, expr.size
+
+    if op in _FOLD_OPS:
+        return reduce(_FOLD_OPS[op], args) & _mask(size)
+    if op == "-":
+        if len(args) == 1:
+            return (np.uint64(0) - args[0]) & _mask(size)
+        return (args[0] - args[1]) & _mask(size)
+    if len(args) != 2:
+        raise UnsupportedExpression(expr)
+
+    value, shifter = args
+    if op == ">>":
+        return value >> shifter
+    if op == "<<":
+        return (value << shifter) & _mask(size)
+    if op == "a>>":
+        # shifting by more than the size fills with the sign bit
+        shifter = np.minimum(shifter, np.uint64(63)).view(np.int64)
+        return (_to_signed(value, size) >> shifter).view(np.uint64) & _mask(size)
+    if op in (">>>", "<<<"):
+        rotation_size = np.uint64(expr.args[1].size)
+        shifter = shifter % rotation_size
+        if op == ">>>":
+            return ((value >> shifter) | (value << (rotation_size - shifter))) & _mask(size)
+        return ((value << shifter) | (value >> (rotation_size - shifter))) & _mask(size)
+
+    raise UnsupportedExpression(expr)
+
+
+def _evaluate(expr: Expr, columns: Dict[Expr, np.ndarray], num_samples: int) -> np.ndarray:
+    if expr in columns:
+        return columns[expr]
+    if expr.size > MAX_BATCH_SIZE:
+        raise UnsupportedExpression(expr)
+
+    if expr.is_int():
+        result = np.full(num_samples, int(expr), dtype=np.uint64)
+    elif expr.is_op():
+        result = _evaluate_op(expr, [_evaluate(arg, columns, num_samples) for arg in expr.args])
+    elif expr.is_slice():
+        result = (_evaluate(expr.arg, columns, num_samples) >> np.uint64(expr.start)) & _mask(expr.size)
+    elif expr.is_compose():
+        result = np.zeros(num_samples, dtype=np.uint64)
+        for index, arg in expr.iter_args():
+            result |= _evaluate(arg, columns, num_samples) << np.uint64(index)
+    elif expr.is_cond():
+        cond = _evaluate(expr.cond, columns, num_samples)
+        result = np.where(cond != 0, _evaluate(expr.src1, columns, num_samples),
+                          _evaluate(expr.src2, columns, num_samples))
+    else:
+        # unbound identifiers and memory
+        raise UnsupportedExpression(expr)
+
+    # subexpressions are shared, evaluate each of them once
+    columns[expr] = result
+    return result
+
+
+def evaluate_batch(expr: Expr, values: Dict[Expr, Sequence[int]]) -> np.ndarray:
+    """
+    Evaluate expr for a batch of samples. values maps each variable of expr to its
+    values, one per sample; the result holds the output of each sample.
+    Raises UnsupportedExpression if expr cannot be evaluated on uint64 columns.
+    """
+    if any(variable.size > MAX_BATCH_SIZE for variable in values):
+        raise UnsupportedExpression(expr)
+
+    columns = {variable: np.array(samples, dtype=np.uint64) for variable, samples in values.items()}
+    num_samples = len(next(iter(columns.values()))) if columns else 0
+
+    with np.errstate(over="ignore"):
+        return _evaluate(expr, columns, num_samples)
+
+
+def evaluate_sample(expr: Expr, sample: Dict[Expr, int]) -> int:
+    """Evaluate expr for a single sample by substitution and constant propagation"""
+    simplified = expr_simp(expr.replace_expr({variable: ExprInt(value, variable.size)
+                                              for variable, value in sample.items()}))
+    assert simplified.is_int(), f"{expr} has no concrete value: {simplified}"
+    return int(simplified)
+
+
+def evaluate_io(expr: Expr, variables: Sequence[Expr], inputs: Sequence[Sequence[int]],
+                evaluate_sample: Callable[[Expr, Dict[Expr, int]], int] = evaluate_sample) -> List[int]:
+    """
+    Evaluate expr on a list of inputs (one value per variable); evaluate_sample
+    is the fallback for expressions that can neither be evaluated in batch nor compiled.
+    :return: list of outputs, per input
+    """
+    try:
+        values = {variable: [sample[index] for sample in inputs] for index, variable in enumerate(variables)}
+        return evaluate_batch(expr, values).tolist()
+    except UnsupportedExpression:
+        pass
+
+    try:
+        return compile_expr(expr, variables)(inputs)
+    except UnsupportedExpression:
+        return [evaluate_sample(expr, dict(zip(variables, sample))) for sample in inputs]
+
+
+def sample_io(expr: Expr, variables: Sequence[Expr], num_samples: int,
+              evaluate_sample: Callable[[Expr, Dict[Expr, int]], int] = evaluate_sample
+              ) -> Tuple[List[List[int]], List[int]]:
+    """
+    Sample the I/O behavior of expr for random variable values
+    :return: list of inputs (one value per variable) and list of outputs, per sample
+    """
+    inputs = [[getrandbits(variable.size) for variable in variables] for _ in range(num_samples)]
+
+    return inputs, evaluate_io(expr, variables, inputs, evaluate_sample)
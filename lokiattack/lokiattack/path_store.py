@@ -0,0 +1,219 @@
+"""
+Persistent store of explored handler paths.
+
+Exploring all paths of a handler can take up to the plugins' timeout, while its
+result -- the paths and their output expressions -- only depends on obf_exe, the
+handler and the attacker's knowledge of the key. Complete explorations are therefore
+stored in workdir/.lokiattack_cache/paths, keyed by the SHA-256 of obf_exe, the
+handler index and the key (None for the static attacker), and later runs replay them
+instead of exploring again.
+
+Output expressions are stored hash-consed: all expressions of a handler share one
+table of nodes, in which each distinct subexpression appears once and refers to its
+arguments by index.
+"""
+
+import logging
+import os
+import pickle
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from miasm.expression.expression import Expr, ExprCompose, ExprCond, ExprId, ExprInt, ExprLoc, ExprMem, \
+    ExprOp, ExprSlice, LocKey
+
+from .instance_cache import CACHE_DIR_NAME, load_instance_analysis
+from .se import OutputResultEntry, symbolically_execute_all_paths_alt
+
+
+logger = logging.getLogger("LokiAttack")
+
+PATH_STORE_DIR_NAME = "paths"
+# bump whenever the stored layout, the exploration or the simplification of outputs changes
+PATH_STORE_FORMAT_VERSION = 1
+# set LOKIATTACK_PATH_STORE=0 to always explore (e.g. to measure exploration times)
+PATH_STORE_ENABLED = os.environ.get("LOKIATTACK_PATH_STORE", "1") != "0"
+
+# node tags of the expression table
+INT, ID, LOC, MEM, OP, SLICE, COMPOSE, COND = range(8)
+
+
+def _arguments(expr: Expr) -> Tuple[Expr, ...]:
+    if expr.is_op() or expr.is_compose():
+        return expr.args
+    if expr.is_slice():
+        return expr.arg,
+    if expr.is_cond():
+        return expr.cond, expr.src1, expr.src2
+    if expr.is_mem():
+        return expr.ptr,
+    return ()
+
+
+def _encode_node(expr: Expr, index: Dict[Expr, int]) -> tuple:
+    if expr.is_int():
+        return INT, int(expr), expr.size
+    if expr.is_id():
+        return ID, expr.name, expr.size
+    if expr.is_loc():
+        return LOC, expr.loc_key.key, expr.size
+    if expr.is_mem():
+        return MEM, index[expr.ptr], expr.size
+    if expr.is_op():
+        return (OP, expr.op) + tuple(index[arg] for arg in expr.args)
+    if expr.is_slice():
+        return SLICE, index[expr.arg], expr.start, expr.stop
+    if expr.is_compose():
+        return (COMPOSE,) + tuple(index[arg] for arg in expr.args)
+    if expr.is_cond():
+        return COND, index[expr.cond], index[expr.src1], index[expr.src2]
+    raise TypeError(f"Cannot store expression {expr!r}")
+
+
+def encode_exprs(exprs: Sequence[Expr]) -> Tuple[List[tuple], List[int]]:
+    """
+    Encode expressions into a table of nodes, arguments preceding their users
+    :return: list of nodes, index of each expression in it
+    """
+    nodes: List[tuple] = []
+    index: Dict[Expr, int] = {}
+    for root in exprs:
+        todo = [(root, False)]
+        while todo:
+            expr, visited = todo.pop()
+            if expr in index:
+                continue
+            if not visited:
+                todo.append((expr, True))
+                todo.extend((arg, False) for arg in _arguments(expr) if arg not in index)
+                continue
+            index[expr] = len(nodes)
+            nodes.append(_encode_node(expr, index))
+    return nodes, [index[expr] for expr in exprs]
+
+
+def decode_exprs(nodes: Sequence[tuple], roots: Sequence[int]) -> List[Expr]:
+    """Inverse of encode_exprs"""
+    exprs: List[Expr] = []
+    for node in nodes:
+        tag = node[0]
+        if tag == INT:
+            expr = ExprInt(node[1], node[2])
+        elif tag == ID:
+            expr = ExprId(node[1], node[2])
+        elif tag == LOC:
+            expr = ExprLoc(LocKey(node[1]), node[2])
+        elif tag == MEM:
+            expr = ExprMem(exprs[node[1]], node[2])
+        elif tag == OP:
+            expr = ExprOp(node[1], *[exprs[i] for i in node[2:]])
+        elif tag == SLICE:
+            expr = ExprSlice(exprs[node[1]], node[2], node[3])
+        elif tag == COMPOSE:
+            expr = ExprCompose(*[exprs[i] for i in node[1:]])
+        elif tag == COND:
+            expr = ExprCond(exprs[node[1]], exprs[node[2]], exprs[node[3]])
+        else:
+            raise ValueError(f"Unknown node tag {tag}")
+        exprs.append(expr)
+    return [exprs[i] for i in roots]
+
+
+def _store_file(workdir: Path, digest: str, handler_index: int, key: Optional[int]) -> Path:
+    attacker = "static" if key is None else f"key_{key:x}"
+    return workdir / CACHE_DIR_NAME / PATH_STORE_DIR_NAME / f"{digest}_{handler_index}_{attacker}.pickle"
+
+
+def read_paths(ctx, digest: str) -> Optional[List[OutputResultEntry]]:
+    """Stored paths of the handler of ctx (a HandlerContext), or None"""
+    store_file = _store_file(ctx.workdir, digest, ctx.handler_index, ctx.key)
+    if not store_file.is_file():
+        return None
+    try:
+        with open(store_file, "rb") as f:
+            state = pickle.load(f)
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable path store {store_file}: {e}")
+        return None
+    if state.get("version") != PATH_STORE_FORMAT_VERSION or state.get("digest") != digest or \
+            state.get("key") != ctx.key:
+        return None
+
+    # LocKeys refer to the loc_db of the instance analysis
+    paths = [[LocKey(loc) for loc in path] for path in state["paths"]]
+    if any(loc not in ctx.ir_cfg.blocks for path in paths for loc in path):
+        return None
+
+    outputs = decode_exprs(state["nodes"], state["outputs"])
+    return [OutputResultEntry(path, output, output_instr_offset)
+            for path, output, output_instr_offset in zip(paths, outputs, state["output_instr_offsets"])]
+
+
+def write_paths(ctx, digest: str, entries: List[OutputResultEntry]) -> None:
+    """Store the paths of a complete exploration of the handler of ctx"""
+    nodes, outputs = encode_exprs([entry.output for entry in entries])
+    state = {
+        "version": PATH_STORE_FORMAT_VERSION,
+        "digest": digest,
+        "key": ctx.key,
+        "paths": [[loc.key for loc in entry.path] for entry in entries],
+        "nodes": nodes,
+        "outputs": outputs,
+        "output_instr_offsets": [entry.output_instr_offset for entry in entries],
+    }
+    store_file = _store_file(ctx.workdir, digest, ctx.handler_index, ctx.key)
+    store_dir = store_file.parent
+    try:
+        store_dir.mkdir(parents=True, exist_ok=True)
+        # several workers may store the same handler: write to a temporary file and rename atomically
+        fd, tmp_path = tempfile.mkstemp(dir=store_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, store_file)
+    except OSError as e:
+        logger.warning(f"Failed to write path store to {store_dir}: {e}")
+        return
+
+    # drop paths of previous versions of obf_exe
+    for stale in store_dir.glob("*.pickle"):
+        if not stale.name.startswith(f"{digest}_"):
+            try:
+                stale.unlink()
+            except OSError:
+                pass
+
+
+def explore_paths(ctx, timeout: Optional[int] = None, max_paths: Optional[int] = None,
+                  num_workers: Optional[int] = None) -> Iterator[OutputResultEntry]:
+    """
+    Generator yielding the paths of the handler of ctx (a HandlerContext), like
+    symbolically_execute_all_paths_alt. Stored paths are replayed (up to max_paths);
+    otherwise, the handler is explored and the paths are stored if the exploration
+    has been completed.
+    """
+    if not PATH_STORE_ENABLED:
+        for entry in symbolically_execute_all_paths_alt(ctx.ira, ctx.ir_cfg, ctx.address, ctx.se_context,
+                                                        timeout=timeout, max_paths=max_paths,
+                                                        num_workers=num_workers):
+            yield entry
+        return
+
+    digest = load_instance_analysis(ctx.workdir).digest
+    entries = read_paths(ctx, digest)
+    if entries is not None:
+        for entry in entries[:max_paths]:
+            yield entry
+        return
+
+    entries = []
+    explorers = []
+    for entry in symbolically_execute_all_paths_alt(ctx.ira, ctx.ir_cfg, ctx.address, ctx.se_context,
+                                                    timeout=timeout, max_paths=max_paths, num_workers=num_workers,
+                                                    on_explorer=explorers.append):
+        entries.append(entry)
+        yield entry
+
+    # explorations cut short by a budget are not stored
+    if explorers and explorers[0].exhausted:
+        write_paths(ctx, digest, entries)
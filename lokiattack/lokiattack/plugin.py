@@ -0,0 +1,154 @@
+"""
+Plugin API shared by all LokiAttack plugins.
+
+Every plugin module exposes two callables:
+
+    prepare_context(*args: str) -> HandlerContext
+    run(ctx: HandlerContext) -> result (a NamedTuple whose str() is the legacy output line)
+
+The plugin's `__main__` block chains both (subprocess mode), while run.py imports
+the plugin module once per worker and calls them directly (in-process mode).
+
+Plugins that analyze each explored path of a handler additionally expose
+
+    create_analysis(ctx: HandlerContext) -> PathAnalysis
+
+and implement run(ctx) as run_path_analyses([create_analysis(ctx)])[0]. run.py's fused
+mode feeds the paths of a single exploration to the analyses of several such plugins.
+"""
+
+import os
+import time
+from collections import namedtuple
+from pathlib import Path
+from typing import Any, List, Optional, Tuple
+
+from miasm.expression.expression import Expr
+
+from .helper import get_key
+from .instance_cache import load_instance_analysis
+from .path_store import explore_paths
+from .se import OutputResultEntry, SEContext
+
+
+# processes exploring the paths of a handler (1: sequential). run.py passes --se-workers to its
+# in-process workers and subprocesses alike; standalone runs use all cores
+SE_WORKERS = int(os.environ.get("LOKIATTACK_SE_WORKERS", "0")) or os.cpu_count() or 1
+
+
+HandlerContext = namedtuple(
+    "HandlerContext",
+    "name workdir file_path container machine mdis ira asm_cfg ir_cfg handler_index address "
+    "context_addr bytecode_addr key se_context core_semantics"
+)
+
+
+def parse_attacker_type(attacker_type: str) -> bool:
+    """Map static|dynamic attacker to whether the attacker knows the key"""
+    if attacker_type == "static":
+        return False
+    if attacker_type == "dynamic":
+        return True
+    raise RuntimeError(f"Unexpected value for static|dynamic attacker: {attacker_type}")
+
+
+def prepare_handler_context(workdir: Path, handler_index: int, key: Optional[int] = None,
+                            core_semantics: Optional[Expr] = None) -> HandlerContext:
+    """
+    Set up the SE context for the handler_index-th handler of workdir/obf_exe; the lifted
+    handler is taken from the instance's analysis cache.
+    If key is None, the key remains symbolic (static attacker).
+    """
+    analysis = load_instance_analysis(workdir)
+    handler = analysis.handler(handler_index)
+    symbols = analysis.symbols
+    se_context = SEContext(symbols.context_addr, symbols.bytecode_addr, None, None, None, key)
+
+    return HandlerContext(workdir.name, workdir, analysis.file_path, analysis.container, analysis.machine,
+                          analysis.mdis, analysis.ira, handler.asm_cfg, handler.ir_cfg, handler_index,
+                          handler.address, symbols.context_addr, symbols.bytecode_addr, key, se_context,
+                          core_semantics)
+
+
+def prepare_semantics_context(workdir: Path, core_semantics_index: int, attacker_type: str,
+                              handler_key_pos: List[Tuple[int, int, Expr]]) -> HandlerContext:
+    """
+    Prepare the context for the core_semantics_index-th entry of handler_key_pos,
+    a list of (handler index, key index in bytecode, expected core semantics).
+    """
+    set_key = parse_attacker_type(attacker_type)
+    if not 0 <= core_semantics_index < len(handler_key_pos):
+        raise IndexError(f"Semantics index out of range: {core_semantics_index}")
+
+    handler_index, key_index, core_semantics = handler_key_pos[core_semantics_index]
+    key = get_key(workdir / "byte_code.bin", key_index) if set_key else None
+
+    return prepare_handler_context(workdir, handler_index, key, core_semantics)
+
+
+class PathAnalysis(object):
+    """
+    Analysis of the explored paths of a handler. add() is called once per path,
+    until the path budget of the analysis is exhausted or the analysis marks itself
+    as done; result() returns the plugin's result.
+    """
+
+    def __init__(self, ctx: HandlerContext, timeout: Optional[int] = None, max_paths: Optional[int] = None,
+                 num_workers: Optional[int] = None):
+        self.ctx = ctx
+        self.timeout = timeout
+        self.max_paths = max_paths
+        self.num_workers = num_workers
+        self.num_paths = 0
+        self.done = False
+        self.start_time = time.time()
+
+    def add(self, result: OutputResultEntry) -> None:
+        raise NotImplementedError("Abstract method")
+
+    def result(self) -> Any:
+        raise NotImplementedError("Abstract method")
+
+    def consume(self, result: OutputResultEntry) -> bool:
+        """Analyze a path; returns whether the analysis takes further paths"""
+        if self.done:
+            return False
+        self.num_paths += 1
+        self.add(result)
+        if self.max_paths is not None and self.num_paths >= self.max_paths:
+            self.done = True
+        return not self.done
+
+    @property
+    def duration(self) -> float:
+        return time.time() - self.start_time
+
+
+def _shared_budget(budgets: List[Optional[int]]) -> Optional[int]:
+    """Largest budget; None (unlimited) if any budget is unlimited"""
+    if any(budget is None for budget in budgets):
+        return None
+    return max(budgets)
+
+
+def run_path_analyses(analyses: List[PathAnalysis]) -> List[Any]:
+    """
+    Explore the paths of the handler shared by all analyses once (or replay them from
+    the path store), and feed each path to every analysis still taking paths. The
+    exploration budgets are the largest ones of the analyses; each analysis stops after
+    its own path budget.
+    :return: list of results, per analysis
+    """
+    ctx = analyses[0].ctx
+    assert all((a.ctx.file_path, a.ctx.handler_index, a.ctx.key) == (ctx.file_path, ctx.handler_index, ctx.key)
+               for a in analyses), "Analyses of different handlers cannot share an exploration"
+
+    num_workers = max(a.num_workers or 1 for a in analyses)
+    for result in explore_paths(ctx, timeout=_shared_budget([a.timeout for a in analyses]),
+                                max_paths=_shared_budget([a.max_paths for a in analyses]),
+                                num_workers=num_workers if num_workers > 1 else None):
+        taking_paths = [analysis.consume(result) for analysis in analyses]
+        if not any(taking_paths):
+            break
+
+    return [analysis.result() for analysis in analyses]
@@ -1,15 +1,21 @@
-from collections import namedtuple
-from typing import Dict
+import multiprocessing
+import queue
+import random
+import time
+import traceback
+from collections import deque, namedtuple
+from enum import Enum
+from typing import Dict, Iterator
 
 from miasm.analysis.binary import Container
 from miasm.analysis.machine import Machine
 from miasm.expression.simplifications import expr_simp_explicit
-from miasm.ir.symbexec import SymbolicExecutionEngine
+from miasm.ir.symbexec import MemArray, MemSparse, SymbolicExecutionEngine, SymbolMngr, get_expr_base_offset
 
 from .helper import *
 
 
-Checkpoint = namedtuple("Checkpoint", "state succs path")
+Checkpoint = namedtuple("Checkpoint", "loc symbols path")
 SeResultEntry = namedtuple("SeResultEntry", "path state")
 OutputResultEntry = namedtuple("OutputResultEntry", "path output output_instr_offset")
 SEContext = namedtuple("SEContext", "context_addr bytecode_addr x_val y_val c_val key_val")
@@ -55,18 +61,33 @@ def symbolically_execute_path(file_path, address, se_context, path):
     return filter_output(result, replacements)
 
 
-def symbolically_execute_all_paths_alt(ira, cfg, address, se_context):
+def symbolically_execute_all_paths_alt(ira, cfg, address, se_context, order=None, max_paths=None, max_depth=None,
+                                       timeout=None, seed=None, num_workers=None, on_explorer=None):
+    """
+    Generator function; see PathExplorer for the exploration order and budgets.
+    With num_workers > 1, paths are explored by a ParallelPathExplorer (order and seed
+    are then ignored). on_explorer, if given, is called with the explorer before the
+    exploration starts, e.g. to check afterwards whether it has been exhausted.
+    """
     head = cfg.loc_db.get_offset_location(address)
 
+    if num_workers is not None and num_workers > 1:
+        explorer = ParallelPathExplorer(ira, cfg, se_context, num_workers, max_paths=max_paths,
+                                        max_depth=max_depth, timeout=timeout)
+        if on_explorer is not None:
+            on_explorer(explorer)
+        for entry in explorer.explore(head):
+            yield entry
+        return
+
     se, replacements = gen_se(ira, se_context)
+    explorer = PathExplorer(cfg, se, order=order, max_paths=max_paths, max_depth=max_depth, timeout=timeout,
+                            seed=seed)
+    if on_explorer is not None:
+        on_explorer(explorer)
 
-    for entry in _symbolically_execute_all_paths(ira, cfg, head, se=se):
-        output_res_entry = filter_output(entry, replacements)
-        if se.output_instr_offset:
-            output_res_entry = OutputResultEntry(output_res_entry.path,
-                                                 output_res_entry.output,
-                                                 se.output_instr_offset)
-        yield output_res_entry
+    for entry in explorer.explore(head):
+        yield _to_output_entry(entry, se, replacements)
 
 
 def symbolically_execute_all_paths(file_path, address, se_context):
@@ -100,6 +121,15 @@ def symbolically_execute_all_paths(file_path, address, se_context):
         yield output_res_entry
 
 
+def _to_output_entry(entry, se, replacements):
+    output_res_entry = filter_output(entry, replacements)
+    if se.output_instr_offset:
+        output_res_entry = OutputResultEntry(output_res_entry.path,
+                                             output_res_entry.output,
+                                             se.output_instr_offset)
+    return output_res_entry
+
+
 def replace_expressions(dct, replacements):
     _dct = {}
 
@@ -134,9 +164,381 @@ def filter_output(entry, replacements):
     return None
 
 
+class CowMemSparse(MemSparse):
+    """
+    MemSparse sharing its MemArrays with forks: fork() is O(1), a MemArray (and the
+    base -> MemArray dict) is only copied by the first write to it after a fork.
+    """
+
+    def __init__(self, addrsize, expr_simp=expr_simp_explicit):
+        super(CowMemSparse, self).__init__(addrsize, expr_simp)
+        # base_to_memarray itself is shared with a fork
+        self._shared = False
+        # bases whose MemArray is private to this instance; None if none is shared
+        self._owned_bases = None
+
+    def fork(self):
+        """Return a copy sharing the memory content until either side writes to it"""
+        obj = CowMemSparse(self.addrsize, self.expr_simp)
+        obj.base_to_memarray = self.base_to_memarray
+        obj._shared = self._shared = True
+        obj._owned_bases = set()
+        self._owned_bases = set()
+        return obj
+
+    def copy(self):
+        return self.fork()
+
+    def clear(self):
+        self.base_to_memarray = {}
+        self._shared = False
+        self._owned_bases = None
+
+    def _writable_memarray(self, base):
+        """Return a private MemArray for base, creating it if needed"""
+        if self._shared:
+            self.base_to_memarray = dict(self.base_to_memarray)
+            self._shared = False
+        memarray = self.base_to_memarray.get(base, None)
+        if memarray is None:
+            memarray = MemArray(base, self.expr_simp)
+            self.base_to_memarray[base] = memarray
+        elif self._owned_bases is not None and base not in self._owned_bases:
+            memarray = memarray.copy()
+            self.base_to_memarray[base] = memarray
+        if self._owned_bases is not None:
+            self._owned_bases.add(base)
+        return memarray
+
+    def write(self, ptr, expr):
+        assert ptr.size == self.addrsize
+        base, offset = get_expr_base_offset(ptr)
+        self._writable_memarray(base).write(offset, expr)
+
+    def __delitem__(self, expr):
+        base, _ = get_expr_base_offset(expr.ptr)
+        if base in self.base_to_memarray:
+            self._writable_memarray(base)
+        super(CowMemSparse, self).__delitem__(expr)
+
+    def delete_partial(self, expr):
+        base, _ = get_expr_base_offset(expr.ptr)
+        if base in self.base_to_memarray:
+            self._writable_memarray(base)
+        super(CowMemSparse, self).delete_partial(expr)
+
+
+class CowSymbolMngr(SymbolMngr):
+    """
+    Copy-on-write symbolic store: fork() is O(1) and shares ids and memory with
+    the original until either side writes. Used to checkpoint states at branches.
+    """
+
+    def __init__(self, init=None, addrsize=None, expr_simp=expr_simp_explicit):
+        super(CowSymbolMngr, self).__init__(addrsize=addrsize, expr_simp=expr_simp)
+        self.symbols_mem = CowMemSparse(addrsize, expr_simp)
+        self._ids_shared = False
+        if init is not None:
+            for expr, value in init.items():
+                self.write(expr, value)
+
+    def fork(self):
+        """Return a copy sharing the state until either side writes to it"""
+        obj = CowSymbolMngr(addrsize=self.addrsize, expr_simp=self.expr_simp)
+        obj.symbols_id = self.symbols_id
+        obj._ids_shared = self._ids_shared = True
+        obj.symbols_mem = self.symbols_mem.fork()
+        return obj
+
+    def copy(self):
+        return self.fork()
+
+    def clear(self):
+        self.symbols_id = {}
+        self._ids_shared = False
+        self.symbols_mem.clear()
+
+    def _unshare_ids(self):
+        if self._ids_shared:
+            self.symbols_id = dict(self.symbols_id)
+            self._ids_shared = False
+
+    def __delitem__(self, expr):
+        if expr.is_id():
+            self._unshare_ids()
+        super(CowSymbolMngr, self).__delitem__(expr)
+
+    def write(self, dst, src):
+        if dst.is_id():
+            self._unshare_ids()
+        super(CowSymbolMngr, self).write(dst, src)
+
+
+class ExplorationOrder(Enum):
+    DFS = "dfs"
+    BFS = "bfs"
+    RANDOM = "random"
+
+
+class PathExplorer(object):
+    """
+    Enumerates the paths from a start location to the leaves of an IRCFG, symbolically
+    executing each block once per path prefix. Pending branches are kept in a frontier
+    together with a fork of the symbolic store (see CowSymbolMngr), so branching and
+    backtracking never copy the whole state. If an IRDst evaluates to a specific LocKey,
+    the other jump location is not taken for that path.
+
+    order selects the frontier discipline (DFS by default, BFS or seeded random).
+    Exploration stops early after max_paths paths, once timeout seconds have passed or,
+    for paths longer than max_depth blocks, at that depth (without yielding the path).
+    exhausted tells whether every path has been explored.
+    """
+
+    def __init__(self, cfg, se, order=None, max_paths=None, max_depth=None, timeout=None, seed=None):
+        self.cfg = cfg
+        self.se = se
+        self.order = ExplorationOrder(order) if order is not None else ExplorationOrder.DFS
+        self.max_paths = max_paths
+        self.max_depth = max_depth
+        self.timeout = timeout
+        self.random = random.Random(seed)
+
+        if not isinstance(self.se.symbols, CowSymbolMngr):
+            self.se.symbols = CowSymbolMngr(self.se.symbols, addrsize=self.se.symbols.addrsize,
+                                            expr_simp=self.se.symbols.expr_simp)
+
+        self.num_paths = 0
+        self.num_blocks = 0
+        self.exhausted = False
+        self._start_time = None
+
+    def _pop(self, frontier):
+        if self.order == ExplorationOrder.BFS:
+            return frontier.popleft()
+        if self.order == ExplorationOrder.RANDOM:
+            index = self.random.randrange(len(frontier))
+            frontier[index], frontier[-1] = frontier[-1], frontier[index]
+        return frontier.pop()
+
+    def _out_of_budget(self, start_time):
+        if self.max_paths is not None and self.num_paths >= self.max_paths:
+            return True
+        return self.timeout is not None and time.time() - start_time > self.timeout
+
+    def explore(self, start_loc) -> Iterator[SeResultEntry]:
+        """Generator yielding a SeResultEntry per explored path"""
+        assert isinstance(start_loc, LocKey)
+        assert start_loc in self.cfg.blocks
+
+        frontier = deque([Checkpoint(start_loc, self.se.symbols.fork(), [])])
+        for entry in self.explore_frontier(frontier):
+            yield entry
+
+    def explore_frontier(self, frontier, step_hook=None) -> Iterator[SeResultEntry]:
+        """
+        Generator yielding a SeResultEntry per path explored from the pending checkpoints
+        in frontier (a deque of Checkpoint). step_hook(frontier) is called before each step;
+        it may take checkpoints out of the frontier or return True to stop the exploration,
+        leaving the remaining checkpoints in the frontier.
+        """
+        if self._start_time is None:
+            self._start_time = time.time()
+        leaves = self.cfg.leaves()
+
+        while frontier:
+            if self._out_of_budget(self._start_time):
+                return
+            if step_hook is not None and step_hook(frontier):
+                return
+            loc, symbols, path = self._pop(frontier)
+            path = path + [loc]
+
+            # resume from the (shared) state at the branch
+            self.se.symbols = symbols.fork()
+            _next_loc = self.se.run_block_at(self.cfg, loc)
+            _next_loc = transform_to_loc_key(_next_loc, self.cfg.loc_db)
+            self.num_blocks += 1
+
+            if loc in leaves:
+                self.num_paths += 1
+                yield SeResultEntry(path, dict(self.se.state))
+                continue
+
+            if self.max_depth is not None and len(path) >= self.max_depth:
+                continue
+
+            if isinstance(_next_loc, LocKey):
+                _succs = [_next_loc]
+            else:
+                _succs = self.cfg.successors(loc)
+
+            checkpoint_symbols = self.se.symbols
+            for succ in _succs:
+                frontier.append(Checkpoint(succ, checkpoint_symbols, path))
+
+        self.exhausted = True
+
+
+def _path_explorer_worker(ira, cfg, se_context, max_depth, tasks, results, num_idle):
+    """
+    Worker of ParallelPathExplorer: explores the checkpoints taken from tasks depth-first
+    and reports ("path", OutputResultEntry), ("donated", n) and ("done", None) to results.
+    While other workers are idle, the shallowest pending checkpoint -- the root of the
+    largest unexplored subtree -- is handed back to tasks.
+    """
+    try:
+        se, replacements = gen_se(ira, se_context)
+        explorer = PathExplorer(cfg, se, max_depth=max_depth)
+
+        def donate(frontier):
+            if num_idle.value > 0 and len(frontier) > 1:
+                # announce the donation before this task's "done" to keep the parent's count exact
+                results.put(("donated", 1))
+                tasks.put(frontier.popleft())
+            return False
+
+        while True:
+            with num_idle.get_lock():
+                num_idle.value += 1
+            checkpoint = tasks.get()
+            with num_idle.get_lock():
+                num_idle.value -= 1
+            if checkpoint is None:
+                return
+
+            for entry in explorer.explore_frontier(deque([checkpoint]), donate):
+                results.put(("path", _to_output_entry(entry, se, replacements)))
+            results.put(("done", None))
+    except Exception:
+        results.put(("error", traceback.format_exc()))
+
+
+class ParallelPathExplorer(object):
+    """
+    Spreads the exploration of PathExplorer over num_workers processes. The frontier is
+    first expanded breadth-first until it holds SEED_FACTOR checkpoints per worker; the
+    checkpoints (path prefix and symbolic store) are then pickled to a shared task queue.
+    Workers explore them depth-first and donate pending checkpoints while others are idle,
+    so a single handler can keep every core busy. Results are streamed back as
+    OutputResultEntry in completion order; use ObservedSemantics for an order-independent
+    view of them.
+
+    The budgets are enforced by the parent process, which terminates the workers once
+    they are exceeded. Daemonic processes, such as the workers of a default
+    multiprocessing.Pool, cannot start processes: there, the exploration runs sequentially
+    (run.py's pools use non-daemonic workers).
+    """
+
+    SEED_FACTOR = 4
+
+    def __init__(self, ira, cfg, se_context, num_workers, max_paths=None, max_depth=None, timeout=None):
+        self.ira = ira
+        self.cfg = cfg
+        self.se_context = se_context
+        self.num_workers = num_workers
+        self.max_paths = max_paths
+        self.max_depth = max_depth
+        self.timeout = timeout
+
+        self.num_paths = 0
+        self.exhausted = False
+
+    def _remaining_time(self, start_time):
+        if self.timeout is None:
+            return None
+        return self.timeout - (time.time() - start_time)
+
+    def explore(self, start_loc) -> Iterator[OutputResultEntry]:
+        start_time = time.time()
+        se, replacements = gen_se(self.ira, self.se_context)
+        explorer = PathExplorer(self.cfg, se, order=ExplorationOrder.BFS, max_paths=self.max_paths,
+                                max_depth=self.max_depth, timeout=self.timeout)
+
+        sequential = self.num_workers <= 1 or multiprocessing.current_process().daemon
+        seed_size = self.num_workers * self.SEED_FACTOR
+        frontier = deque([Checkpoint(start_loc, se.symbols.fork(), [])])
+        step_hook = None if sequential else lambda pending: len(pending) >= seed_size
+        for entry in explorer.explore_frontier(frontier, step_hook):
+            yield _to_output_entry(entry, se, replacements)
+        self.num_paths = explorer.num_paths
+        if explorer.exhausted or sequential or explorer._out_of_budget(start_time):
+            self.exhausted = explorer.exhausted
+            return
+
+        tasks = multiprocessing.Queue()
+        results = multiprocessing.Queue()
+        num_idle = multiprocessing.Value("i", 0)
+        workers = [multiprocessing.Process(target=_path_explorer_worker, daemon=True,
+                                           args=(self.ira, self.cfg, self.se_context, self.max_depth,
+                                                 tasks, results, num_idle))
+                   for _ in range(self.num_workers)]
+        for worker in workers:
+            worker.start()
+
+        outstanding = len(frontier)
+        for checkpoint in frontier:
+            tasks.put(checkpoint)
+
+        try:
+            while outstanding:
+                if self.max_paths is not None and self.num_paths >= self.max_paths:
+                    return
+                remaining_time = self._remaining_time(start_time)
+                if remaining_time is not None and remaining_time <= 0:
+                    return
+                try:
+                    kind, payload = results.get(timeout=remaining_time)
+                except queue.Empty:
+                    return
+
+                if kind == "path":
+                    self.num_paths += 1
+                    yield payload
+                elif kind == "donated":
+                    outstanding += payload
+                elif kind == "done":
+                    outstanding -= 1
+                else:
+                    raise RuntimeError(f"Path explorer worker failed:\n{payload}")
+            self.exhausted = True
+        finally:
+            for worker in workers:
+                worker.terminate()
+            for worker in workers:
+                worker.join()
+            tasks.cancel_join_thread()
+
+
+class ObservedSemantics(object):
+    """
+    Distinct outputs of the explored paths. Each output is attributed to the smallest
+    path (comparing LocKeys) producing it; iteration follows that order, so the result
+    does not depend on the order in which the paths were reported.
+    """
+
+    def __init__(self):
+        self._paths = {}
+
+    def add(self, entry: OutputResultEntry) -> None:
+        path_key = tuple(loc.key for loc in entry.path)
+        known_key = self._paths.get(entry.output)
+        if known_key is None or path_key < known_key:
+            self._paths[entry.output] = path_key
+
+    def __contains__(self, output) -> bool:
+        return output in self._paths
+
+    def __len__(self) -> int:
+        return len(self._paths)
+
+    def __iter__(self):
+        return iter(sorted(self._paths, key=self._paths.get))
+
+
 class IOSE(SymbolicExecutionEngine):
     def __init__(self, ira, input_x, input_y, output):
         super(IOSE, self).__init__(ira)
+        self.symbols = CowSymbolMngr(addrsize=ira.addrsize, expr_simp=self.expr_simp)
         self.input_x = input_x
         self.input_y = input_y
         self.output = output
@@ -232,67 +634,11 @@ def _symbolically_execute_all_paths(ira, cfg, start_loc, se=None):
     evaluate to a specific LocKey, the other jump location is not taken for that
     specific path, which somewhat reduces the set of paths.
     """
-    assert isinstance(start_loc, LocKey)
-
     if se is None:
         se = SymbolicExecutionEngine(ira)
 
-    assert start_loc in cfg.blocks
-
-    _next_loc = se.run_block_at(cfg, start_loc)
-    _next_loc = transform_to_loc_key(_next_loc, cfg.loc_db)
-    tmp_loc = start_loc
-
-    leaves = cfg.leaves()
-    if start_loc in leaves:
-        yield SeResultEntry([start_loc], dict(se.state))
-        return
-
-    if isinstance(_next_loc, LocKey):
-        _succs = [_next_loc]
-    else:
-        _succs = cfg.successors(start_loc)
-
-    tmp_succs = {start_loc: Checkpoint(se.get_state(),
-                                       _succs,
-                                       [start_loc])}
-
-    se_result = []
-
-    while True:
-        se.set_state(tmp_succs[tmp_loc].state)
-        tmp_path = list(tmp_succs[tmp_loc].path)
-
-        try:
-            tmp_loc = tmp_succs[tmp_loc].succs.pop()
-        except IndexError:
-            # All successors of the current block
-            # have been processed at this stage.
-            del tmp_succs[tmp_loc]
-
-            if tmp_loc == start_loc:
-                return
-
-            tmp_loc = tmp_path[-2]
-            continue
-
-        _next_loc = se.run_block_at(cfg, tmp_loc)
-        _next_loc = transform_to_loc_key(_next_loc, cfg.loc_db)
-        tmp_path.append(tmp_loc)
-
-        if tmp_loc in leaves:
-            yield SeResultEntry(tmp_path, dict(se.state))
-            tmp_loc = tmp_path[-2]
-            continue
-
-        if isinstance(_next_loc, LocKey):
-            _succs = [_next_loc]
-        else:
-            _succs = cfg.successors(tmp_loc)
-
-        tmp_succs[tmp_loc] = Checkpoint(se.get_state(),
-                                        _succs,
-                                        tmp_path)
+    for entry in PathExplorer(cfg, se).explore(start_loc):
+        yield entry
 
 
 def symbol_mem_read(address: Expr) -> Expr:
@@ -0,0 +1,65 @@
+"""
+Symbol lookup without shelling out to nm.
+
+The symbol tables (.symtab and .dynsym) of a binary are parsed once with miasm's
+ELF loader into a name -> address dict, memoized per path, mtime and size.
+Lookups are exact: vm_alu2_rrr_generated never matches vm_alu23_rrr_generated.
+"""
+
+import os
+import re
+from functools import lru_cache
+from pathlib import Path
+from types import MappingProxyType
+from typing import Dict, Mapping, Union
+
+from miasm.loader import elf_init
+
+
+HANDLER_SYMBOL = re.compile(r"^vm_alu(\d+)_rrr_generated$")
+
+
+def _parse_symbols(data: bytes) -> Dict[str, int]:
+    """Map each defined symbol of the ELF file to its address"""
+    elf = elf_init.ELF(data)
+    symbols = {}
+    for section_header in elf.sh:
+        if not hasattr(section_header, "symbols"):
+            continue
+        for name, sym in section_header.symbols.items():
+            if not name or sym.value == 0:
+                continue
+            symbols.setdefault(name.decode(errors="replace"), sym.value)
+    return symbols
+
+
+@lru_cache(maxsize=64)
+def _load_symbols(path: str, mtime_ns: int, size: int) -> Mapping[str, int]:
+    # mtime and size are only part of the memoization key
+    with open(path, "rb") as f:
+        return MappingProxyType(_parse_symbols(f.read()))
+
+
+def get_symbols(file_path: Union[str, Path]) -> Mapping[str, int]:
+    """Return the (read-only) symbol index of file_path"""
+    path = os.path.realpath(file_path)
+    stat = os.stat(path)
+    return _load_symbols(path, stat.st_mtime_ns, stat.st_size)
+
+
+def get_symbol_address(file_path: Union[str, Path], name: str) -> int:
+    """Address of the symbol called exactly name"""
+    try:
+        return get_symbols(file_path)[name]
+    except KeyError:
+        raise RuntimeError(f"Symbol {name} not found in {file_path}")
+
+
+def get_handler_addresses(file_path: Union[str, Path]) -> Dict[int, int]:
+    """Map the index N of every vm_aluN_rrr_generated handler to its address"""
+    handler_addrs = {}
+    for name, address in get_symbols(file_path).items():
+        match = HANDLER_SYMBOL.match(name)
+        if match:
+            handler_addrs[int(match.group(1))] = address
+    return handler_addrs
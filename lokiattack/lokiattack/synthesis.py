@@ -1,6 +1,5 @@
-from random import getrandbits
-
-from helper import cast_to_exprint, CastExprComposeExprIntException
+from helper import cast_to_exprint
+from io_sampling import sample_io
 from miasm.analysis.binary import Container
 from miasm.analysis.machine import Machine
 from miasm.expression.expression import *
@@ -93,6 +92,7 @@ def _synthesis_function(command, result, index):
 
     mc = MCTS(game, oracle, synthesis_inputs, uct_scalar=uct_scalar)
     mc.verbosity_level = 2
+    result.attach(mc)
     s = State(game, BITSIZE)
 
     mc.search(s, max_iter)
@@ -109,35 +109,30 @@ def _synthesis_function(command, result, index):
 
 
 def sample_i_o(ira, ir_cfg, path, in_syms, out_sym, state={}, iterations=30):
-    i_o_map = {}
-
-    for _ in range(iterations):
-        se = SymbolicExecutionEngine(ira, state=state)
-
-        input_list = []
-
-        for k in in_syms:
-            rand = getrandbits(k.size)
-            input_list.append(rand)
-            se.symbols[k] = ExprInt(rand, k.size)
+    # execute the path once with symbolic inputs
+    se = SymbolicExecutionEngine(ira, state=state)
+    _symbolically_execute_path(ira, ir_cfg, path, se=se)
 
-        _symbolically_execute_path(ir_cfg, path, se=se)
+    assert out_sym in se.symbols, \
+        "{} symbol not contained in SE symbols".format(out_sym)
 
-        symbols = dict(se.symbols)
-        assert symbols.has_key(out_sym), \
-            "{} symbol not contained in SE symbols".format(out_sym)
-
-        try:
-            val_out_sym = cast_to_exprint(se.symbols[out_sym])
-        except CastExprComposeExprIntException as err:
-            print(err)
+    def execute_sample(expr, sample):
+        # fallback: execute the path again on concrete inputs
+        se = SymbolicExecutionEngine(ira, state=state)
+        for k, value in sample.items():
+            se.symbols[k] = ExprInt(value, k.size)
+        _symbolically_execute_path(ira, ir_cfg, path, se=se)
 
+        val_out_sym = cast_to_exprint(se.symbols[out_sym])
         assert val_out_sym.is_int(), \
             "{} has no concrete value: {}".format(out_sym, val_out_sym)
 
-        i_o_map[tuple(input_list)] = val_out_sym.arg.arg
+        return int(val_out_sym)
+
+    # evaluate its output on all samples at once
+    inputs, outputs = sample_io(se.symbols[out_sym], in_syms, iterations, evaluate_sample=execute_sample)
 
-    return i_o_map
+    return {tuple(input_list): output for input_list, output in zip(inputs, outputs)}
 
 
 def synthesise(ira,
@@ -3,7 +3,7 @@ from collections import namedtuple
 from miasm.analysis.binary import Container
 from miasm.analysis.machine import Machine
 from miasm.expression.simplifications import expr_simp_explicit
-from miasm.ir.symbexec import SymbolicExecutionEngine, SymbolMngr
+from miasm.ir.symbexec import SymbolicExecutionEngine, SymbolMngr, get_expr_base_offset
 
 from .helper import *
 
@@ -61,7 +61,34 @@ def symbol_mem_read(address: Expr) -> Expr:
     return expr_simp_explicit(expr_simp(ExprMem(address, 64)))
 
 
+# operators whose result bit i only depends on bit i of the arguments
+BITWISE_OPS = {"&", "|", "^"}
+# operators whose result bit i depends on the bits 0..i of the arguments
+CARRY_OPS = {"+", "-", "*"}
+SHIFT_OPS = {"<<", ">>", "a>>", "<<<", ">>>"}
+# operators whose result is 0 for identical arguments
+CANCELLING_OPS = {"^", "-"}
+
+
+def size_mask(size):
+    return (1 << size) - 1
+
+
+def propagate_carry(taint, size):
+    """Taints all bits from the lowest tainted one upwards"""
+    if not taint:
+        return 0
+    return size_mask(size) & ~((taint & -taint) - 1)
+
+
 class TaintEngine(SymbolicExecutionEngine):
+    """
+    Bit-precise taint analysis. Values are symbolically executed without
+    taint, in order to resolve memory addresses; the taint of each register
+    and memory byte is a bit mask, propagated through the IR by transfer
+    functions per expression type and operator.
+    """
+
     def __init__(self, arch, taint_sources, ir_cfg, state={}, *arg, **kwargs):
         super(self.__class__, self).__init__(arch, *arg, **kwargs)
 
@@ -71,23 +98,11 @@ class TaintEngine(SymbolicExecutionEngine):
         self.to_be_tainted = {}
         self.tainted_instructions = set()
         self.visited_instructions = set()
-        self.tainted_bit_expr_name = "T"
-        self.tainted_bit_counter = 0
-        self.tainted_bits_created = []
+        # taint masks of registers and of memory bytes (base, offset)
+        self.id_taint = {}
+        self.mem_taint = {}
         self.ir_cfg = ir_cfg
 
-    def create_tainted_bit_string(self, length):
-        arr = []
-        for _ in range(length):
-            tainted_bit_name = self.tainted_bit_expr_name+"."+str(self.tainted_bit_counter)
-            tainted_bit = ExprId(tainted_bit_name, 1)
-            # arr.append(self.tainted_bit_expr)
-            arr.append(tainted_bit)
-            self.tainted_bits_created.append(tainted_bit)
-            self.tainted_bit_counter += 1
-
-        return ExprCompose(*arr)
-
     def analyze_path(self, path):
         # Resetting the SymbolManager before each analysis
         self.symbols = SymbolMngr(addrsize=self.ir_arch.addrsize,
@@ -97,8 +112,8 @@ class TaintEngine(SymbolicExecutionEngine):
         self.to_be_tainted = {}
         self.tainted_instructions = set()
         self.visited_instructions = set()
-        self.tainted_bit_counter = 0
-        self.tainted_bits_created = []
+        self.id_taint = {}
+        self.mem_taint = {}
         self.init_taint_pool(self.taint_sources)
 
         for loc in path:
@@ -119,15 +134,150 @@ class TaintEngine(SymbolicExecutionEngine):
                 self.to_be_tainted[taint_src.instr_offset] = taint_src.expr
 
     def taint_symbol(self, expr):
-        t_string = self.create_tainted_bit_string(expr.size)
-        self.symbols.write(expr, t_string)
-
-    def is_tainted(self, expr):
-        for t_bit in self.tainted_bits_created:
-            if t_bit in expr:
-                return True
-
-        return False
+        self.write_taint(expr, size_mask(expr.size))
+
+    def mem_bytes(self, ptr, size):
+        """Keys of the memory bytes accessed at the evaluated address @ptr"""
+        base, offset = get_expr_base_offset(ptr)
+        return [(base, (offset + i) & size_mask(ptr.size)) for i in range(size // 8)]
+
+    def write_taint(self, dst, taint):
+        """
+        Sets the taint of a register or of memory
+        @dst: ExprId or ExprMem with evaluated address
+        @taint: int, taint mask
+        """
+        if dst.is_id():
+            self.id_taint[dst] = taint
+            return
+
+        for i, key in enumerate(self.mem_bytes(dst.ptr, dst.size)):
+            self.mem_taint[key] = (taint >> (8 * i)) & 0xff
+
+    def is_tainted(self, expr, eval_cache=None):
+        return self.eval_taint(expr, eval_cache) != 0
+
+    def eval_taint(self, expr, eval_cache=None, taint_cache=None):
+        """
+        Taint mask of the IR expression @expr in the current state
+        @eval_cache: evaluation cache, shared with eval_expr
+        @taint_cache: taint masks of the subexpressions already visited
+        """
+        if eval_cache is None:
+            eval_cache = {}
+        if taint_cache is None:
+            taint_cache = {}
+        if expr in taint_cache:
+            return taint_cache[expr]
+
+        if expr.is_int() or expr.is_loc() or self.eval_expr(expr, eval_cache).is_int():
+            # constant values carry no taint, e.g. after xor rax, rax
+            taint = 0
+        elif expr.is_id():
+            taint = self.id_taint.get(expr, 0)
+        elif expr.is_mem():
+            taint = self.eval_taint_mem(expr, eval_cache, taint_cache)
+        elif expr.is_slice():
+            taint = self.eval_taint(expr.arg, eval_cache, taint_cache) >> expr.start
+        elif expr.is_compose():
+            taint = 0
+            for index, arg in expr.iter_args():
+                taint |= self.eval_taint(arg, eval_cache, taint_cache) << index
+        elif expr.is_cond():
+            taint = self.eval_taint_cond(expr, eval_cache, taint_cache)
+        elif expr.is_op():
+            taint = self.eval_taint_op(expr, eval_cache, taint_cache)
+        else:
+            raise TypeError("Unknown expr type")
+
+        taint &= size_mask(expr.size)
+        taint_cache[expr] = taint
+        return taint
+
+    def eval_taint_mem(self, expr, eval_cache, taint_cache):
+        # a tainted address taints the whole value read
+        if self.eval_taint(expr.ptr, eval_cache, taint_cache):
+            return size_mask(expr.size)
+
+        ptr = self.eval_expr(expr.ptr, eval_cache)
+        taint = 0
+        for i, key in enumerate(self.mem_bytes(ptr, expr.size)):
+            taint |= self.mem_taint.get(key, 0) << (8 * i)
+        return taint
+
+    def eval_taint_cond(self, expr, eval_cache, taint_cache):
+        if self.eval_taint(expr.cond, eval_cache, taint_cache):
+            return size_mask(expr.size)
+
+        # only the taken source matters for a concrete condition
+        cond = self.eval_expr(expr.cond, eval_cache)
+        if cond.is_int():
+            src = expr.src1 if int(cond) else expr.src2
+            return self.eval_taint(src, eval_cache, taint_cache)
+
+        return self.eval_taint(expr.src1, eval_cache, taint_cache) | \
+               self.eval_taint(expr.src2, eval_cache, taint_cache)
+
+    def eval_taint_op(self, expr, eval_cache, taint_cache):
+        taints = [self.eval_taint(arg, eval_cache, taint_cache) for arg in expr.args]
+        taint = 0
+        for arg_taint in taints:
+            taint |= arg_taint
+        if not taint:
+            return 0
+
+        op, size = expr.op, expr.size
+
+        if op in CANCELLING_OPS and len(expr.args) == 2 and \
+                self.eval_expr(expr.args[0], eval_cache) == self.eval_expr(expr.args[1], eval_cache):
+            return 0
+
+        if op in BITWISE_OPS:
+            # constant bits absorb the other arguments' bits
+            for arg in expr.args:
+                value = self.eval_expr(arg, eval_cache)
+                if not value.is_int():
+                    continue
+                if op == "&":
+                    taint &= int(value)
+                elif op == "|":
+                    taint &= ~int(value)
+            return taint
+
+        if op in CARRY_OPS:
+            return propagate_carry(taint, size)
+
+        if op in SHIFT_OPS and not taints[1]:
+            shifter = self.eval_expr(expr.args[1], eval_cache)
+            if shifter.is_int():
+                return self.shift_taint(op, taints[0], int(shifter), size)
+
+        if op.startswith("signExt_"):
+            arg_size = expr.args[0].size
+            if taint >> (arg_size - 1):
+                taint |= size_mask(size) & ~size_mask(arg_size)
+            return taint
+
+        # any tainted bit may affect all bits of the result
+        return size_mask(size)
+
+    @staticmethod
+    def shift_taint(op, taint, shifter, size):
+        if op == "<<":
+            return taint << shifter
+        if op == ">>":
+            return taint >> shifter
+        if op == "a>>":
+            # the shifted-in bits are copies of the sign bit
+            shifter = min(shifter, size)
+            shifted = taint >> shifter
+            if taint >> (size - 1):
+                shifted |= size_mask(size) & ~size_mask(size - shifter)
+            return shifted
+        shifter %= size
+        if op == ">>>":
+            shifter = (size - shifter) % size
+        return (taint << shifter) | (taint >> (size - shifter))
 
     def eval_updt_assignblk(self, assignblk):
         instr_offset = assignblk.instr.offset
@@ -137,19 +287,28 @@ class TaintEngine(SymbolicExecutionEngine):
             expr = self.to_be_tainted[instr_offset]
             self.taint_symbol(expr)
 
-        is_instr_tainted = False
+        # evaluate values and taints before updating the state
+        eval_cache = {}
+        taint_cache = {}
+        dst_src = {}
+        dst_taint = {}
+        for dst, src in viewitems(assignblk):
+            if dst.is_mem():
+                dst = ExprMem(self.eval_expr(dst.ptr, eval_cache), dst.size)
+            elif not dst.is_id():
+                raise ValueError("Unknown destination type", str(dst))
+            dst_src[dst] = self.eval_expr(src, eval_cache)
+            dst_taint[dst] = self.eval_taint(src, eval_cache, taint_cache)
+
         mem_dst = []
-        dst_src = self.eval_assignblk(assignblk)
         for dst, src in viewitems(dst_src):
             self.apply_change(dst, src)
-
-            if self.is_tainted(src):
-                is_instr_tainted |= True
+            self.write_taint(dst, dst_taint[dst])
 
             if dst.is_mem():
                 mem_dst.append(dst)
 
-        if is_instr_tainted:
+        if any(dst_taint.values()):
             self.tainted_instructions.add(assignblk.instr)
 
         return mem_dst
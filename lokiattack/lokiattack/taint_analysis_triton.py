@@ -4,9 +4,11 @@ from miasm.analysis.binary import Container
 from miasm.analysis.machine import Machine
 from miasm.expression.expression import *
 from miasm.expression.simplifications import expr_simp, expr_simp_explicit
-from miasm.ir.symbexec import SymbolicExecutionEngine, SymbolMngr
+from miasm.ir.symbexec import SymbolicExecutionEngine
 from triton import *
 
+from .se import CowSymbolMngr
+
 
 class UnsupportedArchitecture(Exception):
     """Raised if architecture not supported by Triton"""
@@ -18,10 +20,9 @@ MIASM_TRITON_REGISTER_MAP = {}
 
 
 def taint_analysis_triton_alt(ira, asm_cfg, ir_cfg, arch, bin_stream, path, context_address, bytecode_address):
-    taint_sources = gen_taint_sources(context_address, bytecode_address, ira, ir_cfg, path)
-    path = make_address_path(path, ir_cfg)
+    session = TritonTaintSession(ira, asm_cfg, ir_cfg, arch, bin_stream, context_address, bytecode_address)
 
-    return forward_taint(asm_cfg, bin_stream, path, taint_sources, arch)
+    return session.analyze_path(path)
 
 
 def taint_analysis_triton(file_path, address, path, context_address, bytecode_address):
@@ -40,6 +41,15 @@ def taint_analysis_triton(file_path, address, path, context_address, bytecode_ad
 
 
 def gen_taint_sources(context_address, bytecode_address, ira, ir_cfg, path):
+    to_be_tainted = gen_to_be_tainted(context_address, bytecode_address)
+
+    se = TaintSourceLocalization(ira)
+    taint_sources = se.analyze_path(ir_cfg, path, to_be_tainted)
+
+    return taint_sources
+
+
+def gen_to_be_tainted(context_address, bytecode_address):
     context = ExprInt(context_address, 64)
     bytecode = ExprInt(bytecode_address, 64)
     vip = context + ExprInt(8, 64)  # build addresses
@@ -52,12 +62,8 @@ def gen_taint_sources(context_address, bytecode_address, ira, ir_cfg, path):
     y = symbol_mem_read(y_address)
     c = symbol_mem_read(c_address)
     key = symbol_mem_read(key_address)
-    to_be_tainted = set([x, y, c, key])
 
-    se = TaintSourceLocalization(ira)
-    taint_sources = se.analyze_path(ir_cfg, path, to_be_tainted)
-
-    return taint_sources
+    return set([x, y, c, key])
 
 
 def symbol_mem_read(address: Expr) -> Expr:
@@ -164,6 +170,27 @@ def init_register_map(ctx):
         MIASM_TRITON_REGISTER_MAP[miasm_expr] = reg_obj
 
 
+def create_triton_context(arch_id):
+    """
+    Returns a TritonContext for the miasm architecture
+    arch_id, configured for the taint analysis
+    """
+    ctx = TritonContext()
+    ctx.setArchitecture(miasm_arch_to_triton_arch(arch_id))
+    arm_triton_context(ctx)
+
+    return ctx
+
+
+def arm_triton_context(ctx):
+    """
+    Sets the modes of ctx; TritonContext.reset
+    drops them together with the taint and symbolic state.
+    """
+    ctx.setMode(MODE.ALIGNED_MEMORY, True)
+    ctx.setAstRepresentationMode(AST_REPRESENTATION.PYTHON)
+
+
 def forward_taint(asm_cfg, bin_stream, path, taint_sources, arch_id):
     """
     @param asm_cfg: AsmCFG instance. Each block has to have 
@@ -179,16 +206,23 @@ def forward_taint(asm_cfg, bin_stream, path, taint_sources, arch_id):
     """
 
     code = transform_asm_cfg(asm_cfg, bin_stream)
-    arch_id = miasm_arch_to_triton_arch(arch_id)
 
-    ctx = TritonContext()
-    ctx.setArchitecture(arch_id)
-    ctx.setMode(MODE.ALIGNED_MEMORY, True)
-    ctx.setAstRepresentationMode(AST_REPRESENTATION.PYTHON)
+    ctx = create_triton_context(arch_id)
     init_register_map(ctx)
 
-    taint_sources = transform_taint_sources(taint_sources)
+    return forward_taint_ctx(ctx, code, path, transform_taint_sources(taint_sources))
 
+
+def forward_taint_ctx(ctx, code, path, taint_sources):
+    """
+    Taints path in the fresh (or reset) TritonContext ctx
+
+    @param code: {addr: machine code}, see transform_asm_cfg
+
+    @param path: List of specific addresses
+
+    @param taint_sources: {addr: triton_reg}, see transform_taint_sources
+    """
     tainted_instr_addresses = set()
     for addr in path:
         instr_code = code[addr]
@@ -208,25 +242,104 @@ def forward_taint(asm_cfg, bin_stream, path, taint_sources, arch_id):
     return tainted_instr_addresses, path
 
 
+class TritonTaintSession(object):
+    """
+    Byte-granular taint analysis of the paths of a handler.
+
+    The TritonContext, the register map and the machine code
+    of the handler are set up once; between two paths, the
+    context is reset and re-armed. The taint source localization
+    keeps its state at the branches of the analysed paths, such
+    that paths sharing a prefix only execute their remaining blocks.
+    """
+
+    def __init__(self, ira, asm_cfg, ir_cfg, arch_id, bin_stream, context_address, bytecode_address):
+        self.ir_cfg = ir_cfg
+        self.code = transform_asm_cfg(asm_cfg, bin_stream)
+
+        self.ctx = create_triton_context(arch_id)
+        init_register_map(self.ctx)
+
+        self.to_be_tainted = gen_to_be_tainted(context_address, bytecode_address)
+        self.localization = TaintSourceLocalization(ira)
+        # the context is fresh until the first path is analysed
+        self.dirty = False
+
+    def analyze_path(self, path):
+        """
+        Taint analysis of a path of loc_keys
+        :return: tainted addresses, list of addresses of path
+        """
+        taint_sources = self.localization.analyze_path(self.ir_cfg, path, self.to_be_tainted)
+        path = make_address_path(path, self.ir_cfg)
+
+        if self.dirty:
+            self.ctx.reset()
+            arm_triton_context(self.ctx)
+        self.dirty = True
+
+        return forward_taint_ctx(self.ctx, self.code, path, transform_taint_sources(taint_sources))
+
+
 class InstructionTypeNotSupportedException(Exception):
     pass
 
 
+class LocalizationPrefix(object):
+    """
+    Node of the prefix trie of a TaintSourceLocalization. Nodes
+    of blocks with several successors keep a fork of the state
+    and the taint sources after their path prefix.
+    """
+
+    def __init__(self, symbols=None, taint_sources=()):
+        self.children = {}
+        self.symbols = symbols
+        self.taint_sources = taint_sources
+
+
 class TaintSourceLocalization(SymbolicExecutionEngine):
     def __init__(self, ira):
         super(TaintSourceLocalization, self).__init__(ira)
         self.to_be_tainted = set()
+        # dereferences of all sizes of the memory to be tainted
+        self.to_be_tainted_derefs = frozenset()
         self.taint_sources = []
         self.current_instr = None
+        # states at the branches of the analysed paths
+        self.root = None
 
     def analyze_path(self, ir_cfg, path, to_be_tainted):
-        self.symbols = SymbolMngr(addrsize=self.ir_arch.addrsize,
-                                  expr_simp=self.expr_simp)
-        self.to_be_tainted = set(to_be_tainted)
-        self.taint_sources = []
-
-        for loc_key in path:
+        to_be_tainted = set(to_be_tainted)
+        if to_be_tainted != self.to_be_tainted or self.root is None:
+            self.to_be_tainted = to_be_tainted
+            self.to_be_tainted_derefs = frozenset(deref for t_src in self.to_be_tainted
+                                                  for deref in self.generate_derefs(t_src))
+            self.root = LocalizationPrefix(CowSymbolMngr(addrsize=self.ir_arch.addrsize,
+                                                         expr_simp=self.expr_simp))
+
+        # resume after the last branch on the longest analysed prefix of path
+        node, resume, start = self.root, self.root, 0
+        for length, loc_key in enumerate(path, 1):
+            node = node.children.get(loc_key)
+            if node is None:
+                break
+            if node.symbols is not None:
+                resume, start = node, length
+        self.symbols = resume.symbols.fork()
+        self.taint_sources = list(resume.taint_sources)
+
+        node = resume
+        for loc_key in path[start:]:
             self.run_block_at(ir_cfg, loc_key)
+            child = node.children.get(loc_key)
+            if child is None:
+                child = LocalizationPrefix()
+                node.children[loc_key] = child
+            node = child
+            if node.symbols is None and len(ir_cfg.successors(loc_key)) > 1:
+                node.symbols = self.symbols.fork()
+                node.taint_sources = tuple(self.taint_sources)
 
         return self.taint_sources
 
@@ -251,14 +364,7 @@ class TaintSourceLocalization(SymbolicExecutionEngine):
             self.taint_sources.append(TaintSourceMiasm(dst, self.current_instr.offset))
 
     def is_in_to_be_tainted(self, expr):
-        for t_src in self.to_be_tainted:
-            derefs = self.generate_derefs(t_src)
-
-            for deref in derefs:
-                if deref in expr:
-                    return True
-
-        return False
+        return not self.to_be_tainted_derefs.isdisjoint(expr.summary.mems)
 
     def generate_derefs(self, expr):
         assert isinstance(expr, ExprMem)
@@ -5,6 +5,7 @@ import re
 import struct
 import logging
 from collections import defaultdict
+from types import MemberDescriptorType
 
 
 from future.utils import viewitems, viewvalues
@@ -992,6 +993,20 @@ class instruction(object):
         self.l = None
         self.b = None
 
+    def __getstate__(self):
+        # Architectures shadow some slots with class attributes (for instance
+        # 'delayslot'), which are read-only on instances: only keep real slots
+        cls = self.__class__
+        return {
+            name: getattr(self, name)
+            for name in instruction.__slots__
+            if isinstance(getattr(cls, name), MemberDescriptorType) and hasattr(self, name)
+        }
+
+    def __setstate__(self, state):
+        for name, value in viewitems(state):
+            setattr(self, name, value)
+
     def gen_args(self, args):
         out = ', '.join([str(x) for x in args])
         return out
@@ -35,6 +35,7 @@ import warnings
 import itertools
 from builtins import int as int_types
 from functools import cmp_to_key, total_ordering
+from weakref import KeyedRef, WeakSet
 from future.utils import viewitems
 
 from miasm.core.utils import force_bytes, cmp_elts
@@ -376,6 +377,10 @@ class ExprVisitorCallbackTopToBottom(ExprVisitorBase):
     if @callback return non None value, replace current node with this value
     Else, continue visit of sub-expressions
     """
+    # the cache is flushed once it exceeds this size, so that it does
+    # not keep every visited expression alive
+    max_cache_size = 1 << 17
+
     def __init__(self, callback):
         super(ExprVisitorCallbackTopToBottom, self).__init__()
         self.cache = dict()
@@ -385,6 +390,8 @@ class ExprVisitorCallbackTopToBottom(ExprVisitorBase):
         if expr in self.cache:
             return self.cache[expr]
         ret = self.visit_inner(expr, *args, **kwargs)
+        if len(self.cache) >= self.max_cache_size:
+            self.cache.clear()
         self.cache[expr] = ret
         return ret
 
@@ -401,6 +408,10 @@ class ExprVisitorCallbackBottomToTop(ExprVisitorBase):
     Rebuild expression by visiting sub-expressions
     Call @callback from leaves to root expressions
     """
+    # the cache is flushed once it exceeds this size, so that it does
+    # not keep every visited expression alive
+    max_cache_size = 1 << 17
+
     def __init__(self, callback):
         super(ExprVisitorCallbackBottomToTop, self).__init__()
         self.cache = dict()
@@ -410,6 +421,8 @@ class ExprVisitorCallbackBottomToTop(ExprVisitorBase):
         if expr in self.cache:
             return self.cache[expr]
         ret = self.visit_inner(expr, *args, **kwargs)
+        if len(self.cache) >= self.max_cache_size:
+            self.cache.clear()
         self.cache[expr] = ret
         return ret
 
@@ -473,16 +486,106 @@ canonize_visitor = ExprVisitorCanonize()
 
 # IR definitions
 
+def _release_object(ref):
+    """Drop the singleton entry of a collected expression"""
+    if Expr.args2expr.get(ref.key) is ref:
+        del Expr.args2expr[ref.key]
+
+
+_EMPTY_SET = frozenset()
+
+
+def _merge_sets(sets):
+    """Union of frozensets, reusing an operand when it covers the others so
+    that nodes with the same content share the same set"""
+    out = _EMPTY_SET
+    for elements in sets:
+        if elements is out or elements <= out:
+            continue
+        out = elements if out <= elements else out | elements
+    return out
+
+
+class ExprSummary(object):
+    """
+    Structural facts about an expression, computed once per node from the
+    summaries of its arguments:
+    - ids: ExprId appearing in the expression
+    - mems: ExprMem appearing in the expression
+    - slice_args: arguments of the ExprSlice appearing in the expression
+      (without looking into these arguments)
+    - has_cond: the expression contains an ExprCond
+    - depth: depth of the expression tree
+    - node_count: number of nodes of the expression tree
+    """
+
+    __slots__ = ["ids", "mems", "slice_args", "has_cond", "depth", "node_count"]
+
+    def __init__(self, ids, mems, slice_args, has_cond, depth, node_count):
+        self.ids = ids
+        self.mems = mems
+        self.slice_args = slice_args
+        self.has_cond = has_cond
+        self.depth = depth
+        self.node_count = node_count
+
+    @classmethod
+    def from_expr(cls, expr):
+        if expr.is_id():
+            return cls(frozenset([expr]), _EMPTY_SET, _EMPTY_SET, False, 1, 1)
+        if expr.is_int() or expr.is_loc():
+            return cls(_EMPTY_SET, _EMPTY_SET, _EMPTY_SET, False, 1, 1)
+
+        if expr.is_op() or expr.is_compose():
+            args = expr.args
+        elif expr.is_slice():
+            args = [expr.arg]
+        elif expr.is_mem():
+            args = [expr.ptr]
+        elif expr.is_cond():
+            args = [expr.cond, expr.src1, expr.src2]
+        elif expr.is_assign():
+            args = [expr.dst, expr.src]
+        else:
+            raise TypeError("Unknown expression type %r" % expr)
+
+        summaries = [arg.summary for arg in args]
+        mems = _merge_sets(summary.mems for summary in summaries)
+        if expr.is_mem():
+            mems = mems | frozenset([expr])
+        if expr.is_slice():
+            slice_args = frozenset([expr.arg])
+        else:
+            slice_args = _merge_sets(summary.slice_args for summary in summaries)
+
+        return cls(
+            _merge_sets(summary.ids for summary in summaries),
+            mems,
+            slice_args,
+            expr.is_cond() or any(summary.has_cond for summary in summaries),
+            1 + max(summary.depth for summary in summaries) if summaries else 1,
+            1 + sum(summary.node_count for summary in summaries),
+        )
+
+
 class Expr(object):
 
     "Parent class for Miasm Expressions"
 
-    __slots__ = ["_hash", "_repr", "_size"]
+    # _summary is set on first use and, depending only on the structure of
+    # the expression, kept when a singleton is instantiated again
+    __slots__ = ["_hash", "_repr", "_size", "_summary", "__weakref__"]
 
+    # Singletons, referenced weakly: an expression is unique while it is
+    # alive, and leaves the table once it is no longer referenced
     args2expr = {}
-    canon_exprs = set()
+    canon_exprs = WeakSet()
     use_singleton = True
 
+    # Singleton table counters
+    interned_hits = 0
+    interned_misses = 0
+
     def set_size(self, _):
         raise ValueError('size is not mutable')
 
@@ -504,12 +607,36 @@ class Expr(object):
         if not expr_cls.use_singleton:
             return object.__new__(expr_cls)
 
-        expr = Expr.args2expr.get((expr_cls, args))
-        if expr is None:
-            expr = object.__new__(expr_cls)
-            Expr.args2expr[(expr_cls, args)] = expr
+        key = (expr_cls, args)
+        ref = Expr.args2expr.get(key)
+        if ref is not None:
+            expr = ref()
+            if expr is not None:
+                Expr.interned_hits += 1
+                return expr
+
+        Expr.interned_misses += 1
+        expr = object.__new__(expr_cls)
+        Expr.args2expr[key] = KeyedRef(expr, _release_object, key)
         return expr
 
+    @staticmethod
+    def interning_stats():
+        """Return the size and the hit rate of the singleton tables"""
+        lookups = Expr.interned_hits + Expr.interned_misses
+        return {
+            "size": len(Expr.args2expr),
+            "canon_size": len(Expr.canon_exprs),
+            "hits": Expr.interned_hits,
+            "misses": Expr.interned_misses,
+            "hit_rate": float(Expr.interned_hits) / lookups if lookups else 0.0,
+        }
+
+    @staticmethod
+    def reset_interning_stats():
+        Expr.interned_hits = 0
+        Expr.interned_misses = 0
+
     def get_is_canon(self):
         return self in Expr.canon_exprs
 
@@ -721,7 +848,25 @@ class Expr(object):
         """Returns True if is ExprMem and ptr is_op_segm"""
         return False
 
+    @property
+    def summary(self):
+        """ExprSummary of the expression, computed on first access"""
+        try:
+            return self._summary
+        except AttributeError:
+            summary = ExprSummary.from_expr(self)
+            # ExprId and ExprMem are part of their own summary: storing it
+            # would create a reference cycle, recompute it instead
+            if not (self.is_id() or self.is_mem()):
+                self._summary = summary
+            return summary
+
     def __contains__(self, expr):
+        # identifiers and memory accesses are looked up in the summary
+        if isinstance(expr, ExprId):
+            return expr in self.summary.ids
+        if isinstance(expr, ExprMem):
+            return expr in self.summary.mems
         ret = contains_visitor.contains(self, expr)
         return ret
 
@@ -757,7 +902,7 @@ class ExprInt(Expr):
      - Constant 0x12345678 on 32bits
      """
 
-    __slots__ = Expr.__slots__ + ["_arg"]
+    __slots__ = ["_arg"]
 
 
     def __init__(self, arg, size):
@@ -847,7 +992,7 @@ class ExprId(Expr):
      - variable v1
      """
 
-    __slots__ = Expr.__slots__ + ["_name"]
+    __slots__ = ["_name"]
 
     def __init__(self, name, size=None):
         """Create an identifier
@@ -905,7 +1050,7 @@ class ExprLoc(Expr):
     """An ExprLoc represent a Label in Miasm IR.
     """
 
-    __slots__ = Expr.__slots__ + ["_loc_key"]
+    __slots__ = ["_loc_key"]
 
     def __init__(self, loc_key, size):
         """Create an identifier
@@ -960,7 +1105,7 @@ class ExprAssign(Expr):
      - var1 <- 2
     """
 
-    __slots__ = Expr.__slots__ + ["_dst", "_src"]
+    __slots__ = ["_dst", "_src"]
 
     def __init__(self, dst, src):
         """Create an ExprAssign for dst <- src
@@ -1061,7 +1206,7 @@ class ExprCond(Expr):
      - if (cond) then ... else ...
     """
 
-    __slots__ = Expr.__slots__ + ["_cond", "_src1", "_src2"]
+    __slots__ = ["_cond", "_src1", "_src2"]
 
     def __init__(self, cond, src1, src2):
         """Create an ExprCond
@@ -1133,7 +1278,7 @@ class ExprMem(Expr):
      - Memory write
     """
 
-    __slots__ = Expr.__slots__ + ["_ptr"]
+    __slots__ = ["_ptr"]
 
     def __init__(self, ptr, size=None):
         """Create an ExprMem
@@ -1220,7 +1365,7 @@ class ExprOp(Expr):
      - parity bit(var1)
     """
 
-    __slots__ = Expr.__slots__ + ["_op", "_args"]
+    __slots__ = ["_op", "_args"]
 
     def __init__(self, op, *args):
         """Create an ExprOp
@@ -1377,7 +1522,7 @@ class ExprOp(Expr):
 
 class ExprSlice(Expr):
 
-    __slots__ = Expr.__slots__ + ["_arg", "_start", "_stop"]
+    __slots__ = ["_arg", "_start", "_stop"]
 
     def __init__(self, arg, start, stop):
 
@@ -1457,7 +1602,7 @@ class ExprCompose(Expr):
     Compose is like a hamburger. It concatenate Expressions
     """
 
-    __slots__ = Expr.__slots__ + ["_args"]
+    __slots__ = ["_args"]
 
     def __init__(self, *args):
         """Create an ExprCompose
@@ -1698,9 +1843,7 @@ def get_expr_locs_visit(expr, locs):
 def get_expr_ids(expr):
     """Retrieve ExprId in @expr
     @expr: Expr"""
-    ids = set()
-    expr.visit(lambda x: get_expr_ids_visit(x, ids))
-    return ids
+    return set(expr.summary.ids)
 
 
 def get_expr_locs(expr):
@@ -1894,15 +2037,7 @@ def get_expr_ops(expr):
 def get_expr_mem(expr):
     """Retrieve memory accesses of an @expr
     @expr: Expr"""
-    def visit_getmem(expr, out=None):
-        if out is None:
-            out = set()
-        if isinstance(expr, ExprMem):
-            out.add(expr)
-        return expr
-    ops = set()
-    expr.visit(lambda x: visit_getmem(x, ops))
-    return ops
+    return set(expr.summary.mems)
 
 
 def _expr_compute_cf(op1, op2):
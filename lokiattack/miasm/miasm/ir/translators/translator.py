@@ -11,6 +11,18 @@ class Translator(object):
     available_translators = []
     # Implemented language
     __LANG__ = ""
+    # Translation method per Expr type
+    handlers = {
+        m2_expr.ExprInt: "from_ExprInt",
+        m2_expr.ExprId: "from_ExprId",
+        m2_expr.ExprLoc: "from_ExprLoc",
+        m2_expr.ExprCompose: "from_ExprCompose",
+        m2_expr.ExprSlice: "from_ExprSlice",
+        m2_expr.ExprOp: "from_ExprOp",
+        m2_expr.ExprMem: "from_ExprMem",
+        m2_expr.ExprAssign: "from_ExprAssign",
+        m2_expr.ExprCond: "from_ExprCond"
+    }
 
     @classmethod
     def register(cls, translator):
@@ -106,22 +118,17 @@ class Translator(object):
             return self._cache[expr]
 
         # Handle Expr type
-        handlers = {
-            m2_expr.ExprInt: self.from_ExprInt,
-            m2_expr.ExprId: self.from_ExprId,
-            m2_expr.ExprLoc: self.from_ExprLoc,
-            m2_expr.ExprCompose: self.from_ExprCompose,
-            m2_expr.ExprSlice: self.from_ExprSlice,
-            m2_expr.ExprOp: self.from_ExprOp,
-            m2_expr.ExprMem: self.from_ExprMem,
-            m2_expr.ExprAssign: self.from_ExprAssign,
-            m2_expr.ExprCond: self.from_ExprCond
-        }
-        for target, handler in viewitems(handlers):
-            if isinstance(expr, target):
-                ## Compute value and update the internal cache
-                ret = handler(expr)
-                self._cache[expr] = ret
-                return ret
-        raise ValueError("Unhandled type for %s" % expr)
+        handler = self.handlers.get(expr.__class__)
+        if handler is None:
+            for target, name in viewitems(self.handlers):
+                if isinstance(expr, target):
+                    handler = name
+                    break
+            else:
+                raise ValueError("Unhandled type for %s" % expr)
+
+        ## Compute value and update the internal cache
+        ret = getattr(self, handler)(expr)
+        self._cache[expr] = ret
+        return ret
 
@@ -6,6 +6,7 @@ import logging
 # Raise an ImportError if z3 is not available WITHOUT actually importing it
 imp.find_module("z3")
 
+from miasm.core.utils import BoundedDict
 from miasm.ir.translators.translator import Translator
 
 log = logging.getLogger("translator_z3")
@@ -26,12 +27,13 @@ class Z3Mem(object):
     these access will not occur in the same address space.
     """
 
-    def __init__(self, endianness="<", name="mem"):
+    def __init__(self, endianness="<", name="mem", ctx=None):
         """Initializes a Z3Mem object with a given @name and @endianness.
         @endianness: Endianness of memory representation. '<' for little endian,
             '>' for big endian.
         @name: name of memory Arrays generated. They will be named
             name+str(address size) (for example mem32, mem16...).
+        @ctx: (optional) z3 Context of the Arrays, z3's main context by default
         """
         # Import z3 only on demand
         global z3
@@ -42,6 +44,7 @@ class Z3Mem(object):
         self.endianness = endianness
         self.mems = {} # Address size -> memory z3.Array
         self.name = name
+        self.ctx = ctx
 
     def get_mem_array(self, size):
         """Returns a z3 Array used internally to represent memory for addresses
@@ -54,8 +57,8 @@ class Z3Mem(object):
         except KeyError:
             # Lazy instantiation
             self.mems[size] = z3.Array(self.name + str(size),
-                                        z3.BitVecSort(size),
-                                        z3.BitVecSort(8))
+                                        z3.BitVecSort(size, self.ctx),
+                                        z3.BitVecSort(8, self.ctx))
             mem = self.mems[size]
         return mem
 
@@ -109,41 +112,74 @@ class TranslatorZ3(Translator):
     If you want to interact with the memory abstraction after the translation,
     you can instantiate your own Z3Mem, that will be equivalent to the one
     used by TranslatorZ3.
+
+    By default, translations are cached in a bounded cache shared by all the
+    translators of a z3 Context (with the same endianness and loc_db): an
+    expression already translated by any of them is not walked again, and
+    shared subexpressions are translated to the same z3 AST.
     """
 
     # Implemented language
     __LANG__ = "z3"
     # Operations translation
     trivial_ops = ["+", "-", "/", "%", "&", "^", "|", "*", "<<"]
+    # Maximum size of the translation cache shared in a z3 Context
+    shared_cache_size = 100000
 
-    def __init__(self, endianness="<", loc_db=None, **kwargs):
+    def __init__(self, endianness="<", loc_db=None, ctx=None, shared_cache=True, **kwargs):
         """Instance a Z3 translator
         @endianness: (optional) memory endianness
+        @loc_db: (optional) LocationDB used to resolve ExprLoc
+        @ctx: (optional) z3 Context of the translations, z3's main context by
+            default
+        @shared_cache: (optional) if False, use a cache private to this
+            instance instead of the one shared in @ctx
         """
         # Import z3 only on demand
         global z3
         import z3
 
         super(TranslatorZ3, self).__init__(**kwargs)
-        self._mem = Z3Mem(endianness)
+        self.ctx = ctx
+        self._mem = Z3Mem(endianness, ctx=ctx)
         self.loc_db = loc_db
+        if shared_cache:
+            self._cache = self.get_shared_cache(z3.get_ctx(ctx), endianness, loc_db)
+
+    @classmethod
+    def get_shared_cache(cls, ctx, endianness="<", loc_db=None):
+        """Return the translation cache shared by the translators of @ctx
+        The caches are stored in the z3 Context, as the translated ASTs
+        reference it: they are released together.
+        @ctx: z3 Context
+        @endianness: memory endianness of the translators
+        @loc_db: LocationDB of the translators
+        """
+        caches = getattr(ctx, "_miasm_translation_caches", None)
+        if caches is None:
+            caches = ctx._miasm_translation_caches = {}
+        key = (cls, endianness, loc_db)
+        cache = caches.get(key)
+        if cache is None:
+            cache = caches[key] = BoundedDict(cls.shared_cache_size)
+        return cache
 
     def from_ExprInt(self, expr):
-        return z3.BitVecVal(int(expr), expr.size)
+        return z3.BitVecVal(int(expr), expr.size, self.ctx)
 
     def from_ExprId(self, expr):
-        return z3.BitVec(str(expr), expr.size)
+        return z3.BitVec(str(expr), expr.size, self.ctx)
 
     def from_ExprLoc(self, expr):
         if self.loc_db is None:
             # No loc_db, fallback to default name
-            return z3.BitVec(str(expr), expr.size)
+            return z3.BitVec(str(expr), expr.size, self.ctx)
         loc_key = expr.loc_key
         offset = self.loc_db.get_location_offset(loc_key)
         if offset is not None:
-            return z3.BitVecVal(offset, expr.size)
+            return z3.BitVecVal(offset, expr.size, self.ctx)
         # fallback to default name
-        return z3.BitVec(str(loc_key), expr.size)
+        return z3.BitVec(str(loc_key), expr.size, self.ctx)
 
     def from_ExprMem(self, expr):
         addr = self.from_expr(expr.ptr)
@@ -178,8 +214,8 @@ class TranslatorZ3(Translator):
         See modint.__div__ for implementation choice
         """
         result_sign = z3.If(num * den >= 0,
-                            z3.BitVecVal(1, num.size()),
-                            z3.BitVecVal(-1, num.size()),
+                            z3.BitVecVal(1, num.size(), self.ctx),
+                            z3.BitVecVal(-1, num.size(), self.ctx),
         )
         return z3.UDiv(self._abs(num), self._abs(den)) * result_sign
 
@@ -210,38 +246,38 @@ class TranslatorZ3(Translator):
                 elif expr.op == "==":
                     res = z3.If(
                         args[0] == args[1],
-                        z3.BitVecVal(1, 1),
-                        z3.BitVecVal(0, 1)
+                        z3.BitVecVal(1, 1, self.ctx),
+                        z3.BitVecVal(0, 1, self.ctx)
                     )
                 elif expr.op == "<u":
                     res = z3.If(
                         z3.ULT(args[0], args[1]),
-                        z3.BitVecVal(1, 1),
-                        z3.BitVecVal(0, 1)
+                        z3.BitVecVal(1, 1, self.ctx),
+                        z3.BitVecVal(0, 1, self.ctx)
                     )
                 elif expr.op == "<s":
                     res = z3.If(
                         args[0] < args[1],
-                        z3.BitVecVal(1, 1),
-                        z3.BitVecVal(0, 1)
+                        z3.BitVecVal(1, 1, self.ctx),
+                        z3.BitVecVal(0, 1, self.ctx)
                     )
                 elif expr.op == "<=u":
                     res = z3.If(
                         z3.ULE(args[0], args[1]),
-                        z3.BitVecVal(1, 1),
-                        z3.BitVecVal(0, 1)
+                        z3.BitVecVal(1, 1, self.ctx),
+                        z3.BitVecVal(0, 1, self.ctx)
                     )
                 elif expr.op == "<=s":
                     res = z3.If(
                         args[0] <= args[1],
-                        z3.BitVecVal(1, 1),
-                        z3.BitVecVal(0, 1)
+                        z3.BitVecVal(1, 1, self.ctx),
+                        z3.BitVecVal(0, 1, self.ctx)
                     )
                 else:
                     raise NotImplementedError("Unsupported OP yet: %s" % expr.op)
         elif expr.op == 'parity':
             arg = z3.Extract(7, 0, res)
-            res = z3.BitVecVal(1, 1)
+            res = z3.BitVecVal(1, 1, self.ctx)
             for i in range(8):
                 res = res ^ z3.Extract(i, i, arg)
         elif expr.op == '-':
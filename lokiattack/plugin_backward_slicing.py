@@ -3,17 +3,14 @@ Plugin for backward slicing based on Miasm
 """
 
 import sys
-import time
+from collections import namedtuple
 from pathlib import Path
 
 sys.path.insert(0, "./miasm")
-from miasm.analysis.binary import Container
-from miasm.analysis.machine import Machine
 from miasm.expression.expression import ExprSlice, ExprOp, ExprCond, ExprCompose, ExprInt, ExprId
 from miasm.ir.ir import IRCFG
-from lokiattack.helper import get_bytecode_address, get_context_address, get_key, get_handler_address
-from lokiattack.se import symbolically_execute_all_paths_alt, SEContext, symbolically_execute_path_alt
-from lokiattack.backward_slicing import slice_backwards_path, slice_backwards_path_alt
+from lokiattack.plugin import HandlerContext, PathAnalysis, prepare_semantics_context, run_path_analyses
+from lokiattack.backward_slicing import PathSlicer
 
 
 def count_asm_instructions(cfg: IRCFG) -> int:
@@ -33,8 +30,9 @@ def miasm_shl(x: ExprId, y: ExprId) -> ExprOp:
     return x << (ExprCompose(ExprSlice(y, 0, 8), ExprInt(0x0, 56)) & ExprInt(0x3f, 64))
 
 
-SET_KEY = True
 TIMEOUT = 60 * 1 * 60
+# exact budget of explored paths (None: unlimited)
+MAX_PATHS = None
 
 x = ExprId("x", 64)
 y = ExprId("y", 64)
@@ -56,76 +54,47 @@ handler_key_pos = [
     (8, 35, miasm_shl(x, y)),
 ]
 
-if len(sys.argv) < 4:
-    print(f"[*] Syntax: {sys.argv[0]} <workdir> <core semantics index> <attacker type (static|dynamic)>")
-    exit(0)
-
-
-workdir = Path(sys.argv[1])
-core_semantics_index = int(sys.argv[2])
-output = workdir.name
-if sys.argv[3] == "static":
-    SET_KEY = False
-elif sys.argv[3] == "dynamic":
-    SET_KEY = True
-else:
-    raise RuntimeError(f"Unexpected value for static|dynamic attacker: {sys.argv[3]}")
-
-if core_semantics_index > 6:
-    print("Semantics index out of range.")
-    exit(0)
-
-handler_index, key_index, core_semantics = handler_key_pos[core_semantics_index]
-num_paths = 0
-successful_simplified_semantics = 0
-
-sliced = set()
-start_time = time.time()
-
-# parse
-file_path = workdir / "obf_exe"
-bytecode_path = workdir / "byte_code.bin"
-context_addr = get_context_address(file_path.as_posix())
-bytecode_addr = get_bytecode_address(file_path.as_posix())
-# get handler address
-address = get_handler_address(file_path.as_posix(), handler_index)
-# get key from bytecode file
-key = get_key(bytecode_path, key_index)
-
-if SET_KEY:
-    se_context = SEContext(context_addr, bytecode_addr, None, None, None, key)
-else:
-    se_context = SEContext(context_addr, bytecode_addr, None, None, None, None)
-
-container = Container.from_stream(open(file_path, "rb"))
-machine = Machine(container.arch)
-mdis = machine.dis_engine(container.bin_stream)
-
-ira = machine.ira(mdis.loc_db)
-asm_cfg = mdis.dis_multiblock(address)
-ir_cfg = ira.new_ircfg_from_asmcfg(asm_cfg)
-
-# find key-dependent paths
-for result in symbolically_execute_all_paths_alt(ira, ir_cfg, address, se_context):
-    num_paths += 1
-
-    # backward slicing
-    sliced_instr_vas = slice_backwards_path_alt(
-        ir_cfg, result.output_instr_offset, result.path)
-
-    # update sets
-    sliced.update(set(sliced_instr_vas))
-
-    # check SE timeout
-    if time.time() - start_time > TIMEOUT:
-        break
-
-# end time measurement
-duration = time.time() - start_time
-
-print(f"{output};{count_asm_instructions(ir_cfg)};{len(sliced)};{num_paths};{duration}")
-
-# ret = ""
-# for va in sorted(sliced):
-#     ret = "{}0x{:x}\n".format(ret, va)
-# open("/tmp/sliced.txt", "w").write(ret)
+
+class SlicingResult(namedtuple("SlicingResult", "name num_instructions num_sliced num_paths duration")):
+    def __str__(self) -> str:
+        return ";".join(map(str, self))
+
+
+def prepare_context(workdir: str, core_semantics_index: str, attacker_type: str) -> HandlerContext:
+    return prepare_semantics_context(Path(workdir), int(core_semantics_index), attacker_type, handler_key_pos)
+
+
+class SlicingAnalysis(PathAnalysis):
+    def __init__(self, ctx: HandlerContext):
+        super().__init__(ctx, timeout=TIMEOUT, max_paths=MAX_PATHS)
+        self.sliced = set()
+        # paths of the handler share the SSA transformation of their common prefixes
+        self.slicer = PathSlicer(ctx.ir_cfg)
+
+    def add(self, result):
+        # backward slicing
+        sliced_instr_vas = self.slicer.slice_path(result.output_instr_offset, result.path)
+
+        # update sets
+        self.sliced.update(set(sliced_instr_vas))
+
+    def result(self) -> SlicingResult:
+        return SlicingResult(self.ctx.name, count_asm_instructions(self.ctx.ir_cfg), len(self.sliced),
+                             self.num_paths, self.duration)
+
+
+def create_analysis(ctx: HandlerContext) -> SlicingAnalysis:
+    return SlicingAnalysis(ctx)
+
+
+def run(ctx: HandlerContext) -> SlicingResult:
+    # slice all key-dependent paths
+    return run_path_analyses([create_analysis(ctx)])[0]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4:
+        print(f"[*] Syntax: {sys.argv[0]} <workdir> <core semantics index> <attacker type (static|dynamic)>")
+        exit(0)
+
+    print(run(prepare_context(*sys.argv[1:4])))
@@ -4,6 +4,7 @@
 Run dead code eliminiation (DCE)
 """
 
+from collections import namedtuple
 from pathlib import Path
 import sys
 
@@ -13,6 +14,7 @@ from miasm.analysis.data_flow import DeadRemoval, merge_blocks, remove_empty_ass
 from miasm.analysis.machine import Machine
 from miasm.expression.simplifications import expr_simp
 from miasm.ir.ir import IRCFG
+from lokiattack.plugin import HandlerContext
 
 
 def write_graph(output_file: Path, cfg: IRCFG) -> None:
@@ -36,73 +38,98 @@ def count_asm_instructions(cfg: IRCFG) -> int:
     return len(ret)
 
 
-# check args
-if len(sys.argv) < 3:
-    print(f"[!] Syntax: {sys.argv[0]} <file> <addr>")
-    sys.exit()
-
-# parse stdin
-file_path = Path(sys.argv[1]) / "obf_exe"
-start_addr = int(sys.argv[2], 16)
-
-# read binary file
-with open(file_path, "rb") as f:
-    container = Container.from_stream(f)
-# get CPU abstraction
-machine = Machine(container.arch)
-# disassembly engine
-mdis = machine.dis_engine(container.bin_stream, loc_db=container.loc_db)
-
-# init intermediate representation class
-ira = machine.ira(mdis.loc_db)
-
-# build cfgs
-asm_cfg = mdis.dis_multiblock(start_addr)
-ira_cfg = ira.new_ircfg_from_asmcfg(asm_cfg)
-
-# write IRA graph before simplifications
-# write_graph("before_simp.dot", ira_cfg)
-
-# count
-asm_instructions_before = count_asm_instructions(ira_cfg)
-ir_instructions_before = count_ir_instructions(ira_cfg)
-ir_basic_blocks_before = count_ir_basic_blocks(ira_cfg)
-
-# set entry point
-entry_points = {mdis.loc_db.get_offset_location(start_addr)}
-
-# dead code elimination
-deadrm = DeadRemoval(ira)
-ira_cfg.simplify(expr_simp)
-modified = True
-
-# fixpoint
-while modified:
-    modified = False
-    modified |= deadrm(ira_cfg)
-    modified |= remove_empty_assignblks(ira_cfg)
-    modified |= merge_blocks(ira_cfg, entry_points)
-
-# write IRA graph after simplifications
-# write_graph("after_simp.dot", ira_cfg)
-
-# count
-asm_instructions_after = count_asm_instructions(ira_cfg)
-ir_instructions_after = count_ir_instructions(ira_cfg)
-ir_basic_blocks_after = count_ir_basic_blocks(ira_cfg)
-
-output = f"{file_path.as_posix()};0x{start_addr:x};{len(asm_cfg.blocks)};" \
-         f"{asm_instructions_before};{asm_instructions_after};" \
-         f"{ir_instructions_before};{ir_instructions_after};" \
-         f"{ir_basic_blocks_before};{ir_basic_blocks_after}"
-
-print(output)
-# output
-# print("before and after dead code elimination:")
-# print("number of asm basic blocks: {}".format(len(asm_cfg.blocks)))
-# print("number of asm instructions: {} -> {}".format(asm_instructions_before,
-#                                                     asm_instructions_after))
-# print("number of IR instructions: {} -> {}".format(ir_instructions_before,
-#                                                    ir_instructions_after))
-# print("number of IR basic blocks: {} -> {}".format(ir_basic_blocks_before,
-#                                                    ir_basic_blocks_after))
+class DceResult(namedtuple("DceResult",
+                           "file_path address num_asm_blocks asm_instructions_before asm_instructions_after "
+                           "ir_instructions_before ir_instructions_after "
+                           "ir_basic_blocks_before ir_basic_blocks_after")):
+    def __str__(self) -> str:
+        return f"{self.file_path.as_posix()};0x{self.address:x};{self.num_asm_blocks};" \
+               f"{self.asm_instructions_before};{self.asm_instructions_after};" \
+               f"{self.ir_instructions_before};{self.ir_instructions_after};" \
+               f"{self.ir_basic_blocks_before};{self.ir_basic_blocks_after}"
+
+
+def prepare_context(workdir: str, address: str) -> HandlerContext:
+    # parse stdin
+    workdir = Path(workdir)
+    file_path = workdir / "obf_exe"
+    start_addr = int(address, 16)
+
+    # read binary file
+    with open(file_path, "rb") as f:
+        container = Container.from_stream(f)
+    # get CPU abstraction
+    machine = Machine(container.arch)
+    # disassembly engine
+    mdis = machine.dis_engine(container.bin_stream, loc_db=container.loc_db)
+
+    # init intermediate representation class
+    ira = machine.ira(mdis.loc_db)
+
+    # build cfgs
+    asm_cfg = mdis.dis_multiblock(start_addr)
+    ira_cfg = ira.new_ircfg_from_asmcfg(asm_cfg)
+
+    # DCE neither needs the VM context nor a key
+    return HandlerContext(workdir.name, workdir, file_path, container, machine, mdis, ira, asm_cfg, ira_cfg,
+                          None, start_addr, None, None, None, None, None)
+
+
+def run(ctx: HandlerContext) -> DceResult:
+    ira = ctx.ira
+    ira_cfg = ctx.ir_cfg
+    start_addr = ctx.address
+
+    # write IRA graph before simplifications
+    # write_graph("before_simp.dot", ira_cfg)
+
+    # count
+    asm_instructions_before = count_asm_instructions(ira_cfg)
+    ir_instructions_before = count_ir_instructions(ira_cfg)
+    ir_basic_blocks_before = count_ir_basic_blocks(ira_cfg)
+
+    # set entry point
+    entry_points = {ctx.mdis.loc_db.get_offset_location(start_addr)}
+
+    # dead code elimination
+    deadrm = DeadRemoval(ira)
+    ira_cfg.simplify(expr_simp)
+    modified = True
+
+    # fixpoint
+    while modified:
+        modified = False
+        modified |= deadrm(ira_cfg)
+        modified |= remove_empty_assignblks(ira_cfg)
+        modified |= merge_blocks(ira_cfg, entry_points)
+
+    # write IRA graph after simplifications
+    # write_graph("after_simp.dot", ira_cfg)
+
+    # count
+    asm_instructions_after = count_asm_instructions(ira_cfg)
+    ir_instructions_after = count_ir_instructions(ira_cfg)
+    ir_basic_blocks_after = count_ir_basic_blocks(ira_cfg)
+
+    return DceResult(ctx.file_path, start_addr, len(ctx.asm_cfg.blocks),
+                     asm_instructions_before, asm_instructions_after,
+                     ir_instructions_before, ir_instructions_after,
+                     ir_basic_blocks_before, ir_basic_blocks_after)
+
+
+if __name__ == "__main__":
+    # check args
+    if len(sys.argv) < 3:
+        print(f"[!] Syntax: {sys.argv[0]} <file> <addr>")
+        sys.exit()
+
+    print(run(prepare_context(sys.argv[1], sys.argv[2])))
+    # output
+    # print("before and after dead code elimination:")
+    # print("number of asm basic blocks: {}".format(len(asm_cfg.blocks)))
+    # print("number of asm instructions: {} -> {}".format(asm_instructions_before,
+    #                                                     asm_instructions_after))
+    # print("number of IR instructions: {} -> {}".format(ir_instructions_before,
+    #                                                    ir_instructions_after))
+    # print("number of IR basic blocks: {} -> {}".format(ir_basic_blocks_before,
+    #                                                    ir_basic_blocks_after))
@@ -3,17 +3,15 @@ Plugin for dumping MBAs
 """
 
 import sys
-import time
+from collections import namedtuple
 from pathlib import Path
 from random import getrandbits
+from typing import Optional
 
 sys.path.insert(0, "./miasm")
-from miasm.analysis.binary import Container
-from miasm.analysis.machine import Machine
 from miasm.expression.expression import ExprSlice, ExprOp, ExprCond, ExprCompose, ExprInt, ExprId
-from miasm.expression.simplifications import expr_simp
-from lokiattack.helper import get_bytecode_address, get_context_address, get_key, get_handler_address
-from lokiattack.se import symbolically_execute_all_paths_alt, SEContext, symbolically_execute_path_alt
+from lokiattack.io_sampling import evaluate_io
+from lokiattack.plugin import HandlerContext, PathAnalysis, prepare_semantics_context, run_path_analyses
 
 
 def miasm_mul(x: ExprId, y: ExprId) -> ExprSlice:
@@ -24,34 +22,19 @@ def miasm_shl(x: ExprId, y: ExprId) -> ExprOp:
     return x << (ExprCompose(ExprSlice(y, 0, 8), ExprInt(0x0, 56)) & ExprInt(0x3f, 64))
 
 
-def evaluate(expr, replacements):
-    simplified = expr.replace_expr(replacements)
-    simplified = expr_simp.expr_simp(simplified)
-    assert simplified.is_int()
-    return int(simplified)
-
-
-def compare_io_behavior(expr1, expr2):
+def has_same_io_behavior(expr1, expr2):
     global variables
-    rand_vals = []
-    replacements = {}
-    for v in variables:
-        rand_val = getrandbits(v.size)
-        replacements[v] = ExprInt(rand_val, v.size)
-        rand_vals.append(rand_val)
+    inputs = [[getrandbits(v.size) for v in variables] for _ in range(30)]
+    # evaluate both expressions on all samples at once
     try:
-        return evaluate(expr1, replacements) == evaluate(expr2, replacements)
+        return evaluate_io(expr1, variables, inputs) == evaluate_io(expr2, variables, inputs)
     except:
         return False
 
 
-def has_same_io_behavior(expr1, expr2):
-    return all([compare_io_behavior(expr1, expr2) for _ in range(30)])
-
-
-SET_KEY = True
-ALL_SEMANTICS = False
 TIMEOUT = 60 * 60
+# exact budget of explored paths (None: unlimited)
+MAX_PATHS = None
 
 x = ExprId("x", 64)
 y = ExprId("y", 64)
@@ -75,64 +58,44 @@ handler_key_pos = [
     (8, 35, miasm_shl(x, y)),
 ]
 
-if len(sys.argv) < 4:
-    print(f"[*] Syntax: {sys.argv[0]} <workdir> <core semantics index> <attacker type (static|dynamic)>")
-    exit(0)
-
-workdir = Path(sys.argv[1])
-core_semantics_index = int(sys.argv[2])
-output = workdir.name
-if sys.argv[3] == "static":
-    SET_KEY = False
-elif sys.argv[3] == "dynamic":
-    SET_KEY = True
-else:
-    raise RuntimeError(f"Unexpected value for static|dynamic attacker: {sys.argv[3]}")
-
-if core_semantics_index > 6:
-    print("Semantics index out of range.")
-    exit(0)
-
-handler_index, key_index, core_semantics = handler_key_pos[core_semantics_index]
-num_paths = 0
-successful_simplified_semantics = 0
-start_time = time.time()
-
-# parse
-file_path = workdir / "obf_exe"
-bytecode_path = workdir / "byte_code.bin"
-context_addr = get_context_address(file_path.as_posix())
-bytecode_addr = get_bytecode_address(file_path.as_posix())
-# get handler address
-address = get_handler_address(file_path.as_posix(), handler_index)
-# get key from bytecode file
-key = get_key(bytecode_path, key_index)
-
-if SET_KEY:
-    se_context = SEContext(context_addr, bytecode_addr, None, None, None, key)
-else:
-    se_context = SEContext(context_addr, bytecode_addr, None, None, None, None)
-
-container = Container.from_stream(open(file_path, "rb"))
-machine = Machine(container.arch)
-mdis = machine.dis_engine(container.bin_stream)
-
-ira = machine.ira(mdis.loc_db)
-asm_cfg = mdis.dis_multiblock(address)
-ir_cfg = ira.new_ircfg_from_asmcfg(asm_cfg)
-
-observed_semantics = set()
-
-# find key-dependent paths
-for result in symbolically_execute_all_paths_alt(ira, ir_cfg, address, se_context):
-    num_paths += 1
-
-    if has_same_io_behavior(result.output, core_semantics):
-         print(result.output)
-         exit()
-
-    observed_semantics.add(result.output)
-
-    # check SE timeout
-    if time.time() - start_time > TIMEOUT:
-        break
+class MbaDumpResult(namedtuple("MbaDumpResult", "name num_paths mba")):
+    def __str__(self) -> str:
+        return str(self.mba)
+
+
+def prepare_context(workdir: str, core_semantics_index: str, attacker_type: str) -> HandlerContext:
+    return prepare_semantics_context(Path(workdir), int(core_semantics_index), attacker_type, handler_key_pos)
+
+
+class MbaDumpAnalysis(PathAnalysis):
+    def __init__(self, ctx: HandlerContext):
+        super().__init__(ctx, timeout=TIMEOUT, max_paths=MAX_PATHS)
+        self.mba_dump = None
+
+    def add(self, result):
+        # the first path implementing the core semantics is dumped
+        if has_same_io_behavior(result.output, self.ctx.core_semantics):
+            self.mba_dump = MbaDumpResult(self.ctx.name, self.num_paths, result.output)
+            self.done = True
+
+    def result(self) -> Optional[MbaDumpResult]:
+        return self.mba_dump
+
+
+def create_analysis(ctx: HandlerContext) -> MbaDumpAnalysis:
+    return MbaDumpAnalysis(ctx)
+
+
+def run(ctx: HandlerContext) -> Optional[MbaDumpResult]:
+    # find key-dependent paths
+    return run_path_analyses([create_analysis(ctx)])[0]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4:
+        print(f"[*] Syntax: {sys.argv[0]} <workdir> <core semantics index> <attacker type (static|dynamic)>")
+        exit(0)
+
+    mba_dump = run(prepare_context(*sys.argv[1:4]))
+    if mba_dump:
+        print(mba_dump)
@@ -3,15 +3,14 @@ Plugin for symbolic execution (depth 3) based on Miasm
 """
 
 import sys
-import time
+from collections import namedtuple
 from pathlib import Path
 
 sys.path.insert(0, "./miasm")
-from miasm.analysis.binary import Container
-from miasm.analysis.machine import Machine
 from miasm.expression.expression import ExprSlice, ExprOp, ExprCond, ExprCompose, ExprInt, ExprId
-from lokiattack.helper import get_bytecode_address, get_context_address, get_key, get_handler_address
-from lokiattack.se import symbolically_execute_all_paths_alt, SEContext, symbolically_execute_path_alt
+from lokiattack.plugin import SE_WORKERS, HandlerContext, PathAnalysis, prepare_semantics_context, \
+    run_path_analyses
+from lokiattack.se import ObservedSemantics
 
 
 def miasm_mul(x: ExprId, y: ExprId) -> ExprSlice:
@@ -22,9 +21,10 @@ def miasm_shl(x: ExprId, y: ExprId) -> ExprOp:
     return x << (ExprCompose(ExprSlice(y, 0, 8), ExprInt(0x0, 56)) & ExprInt(0x3f, 64))
 
 
-SET_KEY = True
 ALL_SEMANTICS = False
 TIMEOUT = 60 * 60
+# exact budget of explored paths (None: unlimited)
+MAX_PATHS = None
 
 x = ExprId("x", 64)
 y = ExprId("y", 64)
@@ -47,79 +47,53 @@ handler_key_pos = [
 ]
 
 
-if len(sys.argv) < 4:
-    print(f"[*] Syntax: {sys.argv[0]} <workdir> <core semantics index> <attacker type (static|dynamic)>")
-    exit(0)
+class SymbolicExecutionResult(namedtuple("SymbolicExecutionResult",
+                                         "name simplified num_paths num_semantics duration semantics")):
+    def __str__(self) -> str:
+        status = "simplified" if self.simplified else "not simplified"
+        return f"{self.name};{status};{self.num_paths};{self.num_semantics};{self.duration};{self.semantics}"
 
 
-workdir = Path(sys.argv[1])
-core_semantics_index = int(sys.argv[2])
-output = workdir.name
-if sys.argv[3] == "static":
-    SET_KEY = False
-elif sys.argv[3] == "dynamic":
-    SET_KEY = True
-else:
-    raise RuntimeError(f"Unexpected value for static|dynamic attacker: {sys.argv[3]}")
+def prepare_context(workdir: str, core_semantics_index: str, attacker_type: str) -> HandlerContext:
+    return prepare_semantics_context(Path(workdir), int(core_semantics_index), attacker_type, handler_key_pos)
 
-if core_semantics_index > 6:
-    print("Semantics index out of range.")
-    exit(0)
 
-handler_index, key_index, core_semantics = handler_key_pos[core_semantics_index]
-num_paths = 0
-successful_simplified_semantics = 0
-start_time = time.time()
+class SymbolicExecutionAnalysis(PathAnalysis):
+    def __init__(self, ctx: HandlerContext):
+        super().__init__(ctx, timeout=TIMEOUT, max_paths=MAX_PATHS, num_workers=SE_WORKERS)
+        self.observed_semantics = ObservedSemantics()
 
-# parse
-file_path = workdir / "obf_exe"
-bytecode_path = workdir / "byte_code.bin"
-context_addr = get_context_address(file_path.as_posix())
-bytecode_addr = get_bytecode_address(file_path.as_posix())
-# get handler address
-address = get_handler_address(file_path.as_posix(), handler_index)
-# get key from bytecode file
-key = get_key(bytecode_path, key_index)
+    def add(self, result):
+        self.observed_semantics.add(result)
 
-if SET_KEY:
-    se_context = SEContext(context_addr, bytecode_addr, None, None, None, key)
-else:
-    se_context = SEContext(context_addr, bytecode_addr, None, None, None, None)
+    def result(self) -> SymbolicExecutionResult:
+        ctx, observed_semantics = self.ctx, self.observed_semantics
+        duration = self.duration
 
-container = Container.from_stream(open(file_path, "rb"))
-machine = Machine(container.arch)
-mdis = machine.dis_engine(container.bin_stream)
+        if ALL_SEMANTICS:
+            for s in observed_semantics:
+                print(s)
 
-ira = machine.ira(mdis.loc_db)
-asm_cfg = mdis.dis_multiblock(address)
-ir_cfg = ira.new_ircfg_from_asmcfg(asm_cfg)
+        # check success
+        for s in observed_semantics:
+            if s == ctx.core_semantics:
+                return SymbolicExecutionResult(ctx.name, True, self.num_paths, len(observed_semantics), duration, s)
 
-observed_semantics = set()
+        return SymbolicExecutionResult(ctx.name, False, self.num_paths, len(observed_semantics), duration, None)
 
-# find key-dependent paths
-for result in symbolically_execute_all_paths_alt(ira, ir_cfg, address, se_context):
-    num_paths += 1
 
-    observed_semantics.add(result.output)
+def create_analysis(ctx: HandlerContext) -> SymbolicExecutionAnalysis:
+    return SymbolicExecutionAnalysis(ctx)
 
-    # check SE timeout
-    if time.time() - start_time > TIMEOUT:
-        break
 
+def run(ctx: HandlerContext) -> SymbolicExecutionResult:
+    # find key-dependent paths
+    return run_path_analyses([create_analysis(ctx)])[0]
 
-# end time measurement
-duration = time.time() - start_time
 
+if __name__ == "__main__":
+    if len(sys.argv) < 4:
+        print(f"[*] Syntax: {sys.argv[0]} <workdir> <core semantics index> <attacker type (static|dynamic)>")
+        exit(0)
 
-if ALL_SEMANTICS:
-    for s in observed_semantics:
-        print(s.output)
-    exit()
-
-# check success
-for s in observed_semantics:
-    if s == core_semantics:
-        print(f"{output};simplified;{num_paths};{len(observed_semantics)};{duration};{s}")
-        exit()
-
-print(f"{output};not simplified;{num_paths};{len(observed_semantics)};{duration};{None}")
+    print(run(prepare_context(*sys.argv[1:4])))
@@ -4,20 +4,19 @@ Plugin for program synthesis based on Syntia
 
 import sys
 import time
+from collections import namedtuple
 from pathlib import Path
-from random import getrandbits
 
 sys.path.insert(0, "./miasm")
 
-from miasm.analysis.binary import Container
-from miasm.analysis.machine import Machine
-from lokiattack.helper import get_bytecode_address, get_context_address, get_key, get_handler_address
-from lokiattack.se import symbolically_execute_all_paths_alt, SEContext, symbolically_execute_path_alt
-from miasm.expression.expression import ExprInt, ExprId
-from miasm.expression.simplifications import expr_simp
+from lokiattack.io_sampling import sample_io
+from lokiattack.plugin import HandlerContext, prepare_handler_context
+from lokiattack.se import symbolically_execute_all_paths_alt
+from miasm.expression.expression import ExprId
 from syntia.mcts.mcts import MCTS, State, rpn_to_infix
 from syntia.mcts.game import Game, Variable
 from syntia.mcts.grammar import Grammar
+from syntia.utils.io_table import IOTable
 
 
 
@@ -29,28 +28,9 @@ def gen_variables(number_of_variables, bitsize):
     return variables
 
 
-def gen_io_map(expr_orig, variables):
-    io_map = {}
-
-    for _ in range(20):
-        rand_vals = []
-        expr = expr_orig
-        replacements = dict()
-
-        for v in variables:
-            rand_val = getrandbits(64)
-            replacements[v] = ExprInt(rand_val, v.size)
-            rand_vals.append(rand_val)
-
-        # replace vars with ints
-        simplified = expr.replace_expr(replacements)
-        # apply constant propagation
-        simplified = expr_simp.expr_simp(simplified)
-
-        assert simplified.is_int()
-        io_map[tuple(rand_vals)] = int(simplified)
-
-    return io_map
+def gen_io_map(expr, variables):
+    # evaluate all samples at once on concrete values
+    return IOTable(*sample_io(expr, variables, NUM_IO_SAMPLES))
 
 
 def synthesise(expr, variables):
@@ -61,17 +41,15 @@ def synthesise(expr, variables):
     playout_depth = 0
     max_time = SYNTHESIS_TIMEOUT
 
-    # io_map
-    io_map = gen_io_map(expr, variables)
+    # I/O samples
+    io_table = gen_io_map(expr, variables)
 
     variables = gen_variables(len(variables), bitsize)
     grammar = Grammar(variables, constants=["0", "1"])
     game = Game(grammar, variables, bitsize)
-    synthesis_inputs = [list(k) for k in io_map]
-    def synthesis_oracle(x): return io_map[tuple(x)]
 
     # init synthesizer
-    mc = MCTS(game, synthesis_oracle, synthesis_inputs, uct_scalar)
+    mc = MCTS(game, io_table.lookup, io_table, uct_scalar, max_nodes=MCTS_MAX_NODES)
     mc.verbosity_level = 0
     mc.playout_nesting = playout_depth
     s = State(game, game.bitsize)
@@ -92,76 +70,73 @@ def synthesise(expr, variables):
 
 SET_KEY = True
 PATH_TIMEOUT = 60 * 60
+# exact budget of explored paths (None: unlimited)
+MAX_PATHS = None
 SYNTHESIS_TIMEOUT = 120
+# I/O samples of the synthesis oracle
+NUM_IO_SAMPLES = 20
+# node budget of the MCTS tree (0: unlimited)
+MCTS_MAX_NODES = 0
 
 k = ExprId("key", 64)
 x = ExprId("x", 64)
 y = ExprId("y", 64)
 c = ExprId("c", 64)
 
-if len(sys.argv) < 4:
-    print(f"[*] Syntax: {sys.argv[0]} <file path> <handler index> <key>")
-    exit(0)
+
+class SynthesisResult(namedtuple("SynthesisResult",
+                                 "file_path handler_index key duration duration_synthesis num_semantics num_success")):
+    def __str__(self) -> str:
+        return f"{self.file_path.as_posix()};0x{self.handler_index:x};0x{self.key:x};{self.duration};" \
+               f"{self.duration_synthesis};{self.num_semantics};{self.num_success}"
 
 
-num_paths = 0
-successful_simplified_semantics = 0
-start_time = time.time()
+def prepare_context(workdir: str, handler_index: str, key: str) -> HandlerContext:
+    workdir = Path(workdir)
+    handler_index = int(handler_index, 16)
+    key = int(key, 16)
 
-# parse
-workdir = Path(sys.argv[1])
-handler_index = int(sys.argv[2], 16)
-key = int(sys.argv[3], 16)
+    return prepare_handler_context(workdir, handler_index, key)
 
-file_path = workdir / "obf_exe"
-context_addr = get_context_address(file_path.as_posix())
-bytecode_addr = get_bytecode_address(file_path.as_posix())
-# get handler address
-address = get_handler_address(file_path.as_posix(), handler_index)
 
-if SET_KEY:
-    se_context = SEContext(context_addr, bytecode_addr, None, None, None, key)
-else:
-    se_context = SEContext(context_addr, bytecode_addr, None, None, None, None)
+def run(ctx: HandlerContext) -> SynthesisResult:
+    num_paths = 0
 
-container = Container.from_stream(open(file_path, "rb"))
-machine = Machine(container.arch)
-mdis = machine.dis_engine(container.bin_stream)
+    # static attacker: keep the key symbolic
+    se_context = ctx.se_context if SET_KEY else ctx.se_context._replace(key_val=None)
 
-ira = machine.ira(mdis.loc_db)
-asm_cfg = mdis.dis_multiblock(address)
-ir_cfg = ira.new_ircfg_from_asmcfg(asm_cfg)
+    observed_semantics = set()
+    start_time = time.time()
 
-observed_semantics = set()
-start_time = time.time()
+    # find key-dependent paths
+    for result in symbolically_execute_all_paths_alt(ctx.ira, ctx.ir_cfg, ctx.address, se_context,
+                                                     timeout=PATH_TIMEOUT, max_paths=MAX_PATHS):
+        num_paths += 1
+        observed_semantics.add(result.output)
 
-# find key-dependent paths
-for result in symbolically_execute_all_paths_alt(ira, ir_cfg, address, se_context):
-    num_paths += 1
-    observed_semantics.add(result.output)
+    success_total = 0
+    duration_synthesis = 0.0
 
+    for expr in observed_semantics:
+        if SET_KEY:
+            success, duration_synth_task, expr = synthesise(expr, [x, y, c])
+        else:
+            success, duration_synth_task, expr = synthesise(expr, [x, y, c, k])
 
-        # check SE PA
-    if time.time() - start_time > PATH_TIMEOUT:
-        break
+        duration_synthesis += duration_synth_task
+        if success:
+            success_total += 1
 
-success_total = 0
-duration_synthesis = 0.0
+    # end time measurement
+    duration = time.time() - start_time
 
-for expr in observed_semantics:
-    if SET_KEY:
-        success, duration_synth_task, expr = synthesise(expr, [x, y, c])
-    else:
-        success, duration_synth_task, expr = synthesise(expr, [x, y, c, k])
+    return SynthesisResult(ctx.file_path, ctx.handler_index, ctx.key, duration, duration_synthesis,
+                           len(observed_semantics), success_total)
 
-    duration_synthesis += duration_synth_task
-    if success:
-        success_total += 1
 
-# end time measurement
-duration = time.time() - start_time
+if __name__ == "__main__":
+    if len(sys.argv) < 4:
+        print(f"[*] Syntax: {sys.argv[0]} <file path> <handler index> <key>")
+        exit(0)
 
-print(
-    f"{file_path.as_posix()};0x{handler_index:x};0x{key:x};{duration};" \
-    f"{duration_synthesis};{len(observed_semantics)};{success_total}"
-)
+    print(run(prepare_context(*sys.argv[1:4])))
@@ -3,18 +3,14 @@ Plugin for bit-granular taint analysis based on Miasm
 """
 
 import sys
-import time
+from collections import namedtuple
 from pathlib import Path
 
 sys.path.insert(0, "./miasm")
 
-from miasm.analysis.binary import Container
-from miasm.analysis.machine import Machine
 from miasm.expression.expression import ExprSlice, ExprOp, ExprCond, ExprCompose, ExprInt, ExprId
 from miasm.ir.ir import IRCFG
-from lokiattack.helper import get_bytecode_address, get_context_address, get_key, get_handler_address
-from lokiattack.se import symbolically_execute_all_paths_alt, SEContext, symbolically_execute_path_alt
-from lokiattack.taint_analysis_triton import taint_analysis_triton_alt
+from lokiattack.plugin import HandlerContext, PathAnalysis, prepare_semantics_context, run_path_analyses
 from lokiattack.taint_analysis_miasm import taint_analysis_miasm_alt
 
 
@@ -27,8 +23,9 @@ def count_asm_instructions(cfg: IRCFG) -> int:
     return len(ret)
 
 
-SET_KEY = True
 TIMEOUT = 60 * 60
+# exact budget of explored paths (None: unlimited)
+MAX_PATHS = None
 
 
 def miasm_mul(x: ExprId, y: ExprId) -> ExprSlice:
@@ -59,85 +56,50 @@ handler_key_pos = [
     (8, 35, miasm_shl(x, y)),
 ]
 
-if len(sys.argv) < 4:
-    print(f"[*] Syntax: {sys.argv[0]} <workdir> <core semantics index> <attacker type (static|dynamic)>")
-    exit(0)
-
-workdir = Path(sys.argv[1])
-core_semantics_index = int(sys.argv[2])
-output = workdir.name
-if sys.argv[3] == "static":
-    SET_KEY = False
-elif sys.argv[3] == "dynamic":
-    SET_KEY = True
-else:
-    raise RuntimeError(f"Unexpected value for static|dynamic attacker: {sys.argv[3]}")
-
-
-if core_semantics_index > 6:
-    print("Semantics index out of range.")
-    exit(0)
-
-handler_index, key_index, core_semantics = handler_key_pos[core_semantics_index]
-num_paths = 0
-successful_simplified_semantics = 0
-
-tainted = set()
-visited = set()
-start_time = time.time()
-
-# parse
-file_path = workdir / "obf_exe"
-bytecode_path = workdir / "byte_code.bin"
-context_addr = get_context_address(file_path.as_posix())
-bytecode_addr = get_bytecode_address(file_path.as_posix())
-# get handler address
-address = get_handler_address(file_path.as_posix(), handler_index)
-# get key from bytecode file
-key = get_key(bytecode_path, key_index)
-
-if SET_KEY:
-    se_context = SEContext(context_addr, bytecode_addr, None, None, None, key)
-else:
-    se_context = SEContext(context_addr, bytecode_addr, None, None, None, None)
-
-container = Container.from_stream(open(file_path, "rb"))
-machine = Machine(container.arch)
-mdis = machine.dis_engine(container.bin_stream)
-
-ira = machine.ira(mdis.loc_db)
-asm_cfg = mdis.dis_multiblock(address)
-ir_cfg = ira.new_ircfg_from_asmcfg(asm_cfg)
-
-# find key-dependent paths
-for result in symbolically_execute_all_paths_alt(ira, ir_cfg, address, se_context):
-    num_paths += 1
-
-    # taint analysis
-    tainted_instructions, visited_instructions = taint_analysis_miasm_alt(
-        ira, ir_cfg, result.path, context_addr, bytecode_addr)
-
-    # update sets
-    tainted.update(set([x.offset for x in tainted_instructions]))
-    visited.update(set([x.offset for x in visited_instructions]))
-
-    # check SE timeout
-    if time.time() - start_time > TIMEOUT:
-        break
-
-# end time measurement
-duration = time.time() - start_time
-
-print("{};{};{};{};{};{}".format(output, count_asm_instructions(
-    ir_cfg), len(visited), len(tainted), num_paths, duration))
-
-
-# ret = ""
-# for va in sorted(visited):
-#     ret = "{}0x{:x}\n".format(ret, va)
-# open("/tmp/visited_miasm.txt", "w").write(ret)
-
-# ret = ""
-# for va in sorted(tainted):
-#     ret = "{}0x{:x}\n".format(ret, va)
-# open("/tmp/tainted_miasm.txt", "w").write(ret)
+
+class TaintResult(namedtuple("TaintResult", "name num_instructions num_visited num_tainted num_paths duration")):
+    def __str__(self) -> str:
+        return ";".join(map(str, self))
+
+
+def prepare_context(workdir: str, core_semantics_index: str, attacker_type: str) -> HandlerContext:
+    return prepare_semantics_context(Path(workdir), int(core_semantics_index), attacker_type, handler_key_pos)
+
+
+class TaintAnalysis(PathAnalysis):
+    def __init__(self, ctx: HandlerContext):
+        super().__init__(ctx, timeout=TIMEOUT, max_paths=MAX_PATHS)
+        self.tainted = set()
+        self.visited = set()
+
+    def add(self, result):
+        ctx = self.ctx
+
+        # taint analysis
+        tainted_instructions, visited_instructions = taint_analysis_miasm_alt(
+            ctx.ira, ctx.ir_cfg, result.path, ctx.context_addr, ctx.bytecode_addr)
+
+        # update sets
+        self.tainted.update(set([x.offset for x in tainted_instructions]))
+        self.visited.update(set([x.offset for x in visited_instructions]))
+
+    def result(self) -> TaintResult:
+        return TaintResult(self.ctx.name, count_asm_instructions(self.ctx.ir_cfg), len(self.visited),
+                           len(self.tainted), self.num_paths, self.duration)
+
+
+def create_analysis(ctx: HandlerContext) -> TaintAnalysis:
+    return TaintAnalysis(ctx)
+
+
+def run(ctx: HandlerContext) -> TaintResult:
+    # taint all key-dependent paths
+    return run_path_analyses([create_analysis(ctx)])[0]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4:
+        print(f"[*] Syntax: {sys.argv[0]} <workdir> <core semantics index> <attacker type (static|dynamic)>")
+        exit(0)
+
+    print(run(prepare_context(*sys.argv[1:4])))
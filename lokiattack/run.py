@@ -5,19 +5,26 @@ Run LokiAttack with a specified plugin on specified workdir
 """
 
 import functools
+import importlib
 import logging
+import multiprocessing
 import os
 import subprocess
+import sys
+import traceback
 from argparse import ArgumentParser, Namespace
 from enum import Enum
 from multiprocessing import Pool
 from pathlib import Path
 from time import time
-from typing import List, Optional, Tuple
+from types import ModuleType
+from typing import Any, Dict, List, Optional, Tuple
 
 OBF_EXE_NAME = "obf_exe"
 TESTCASE_REPO = Path("../loki/testcases").resolve()
 TIMEOUT = 3600
+# core semantics analyzed per instance (see handler_key_pos in the plugins)
+NUM_CORE_SEMANTICS = 7
 
 NUM_CPUS: Optional[int] = os.cpu_count()
 assert NUM_CPUS is not None, "os.cpu_count() returned None"
@@ -111,42 +118,118 @@ def get_target_instances(path: Path, allowlist: List[str], denylist: List[str])
         return list(path.glob(f"**/{OBF_EXE_NAME}"))
 
 
-def test_smt_instance(cmd: List[str], target: Path) -> Optional[str]:
-    cmd += [target.parent.as_posix()]
+PLUGIN_MODULES = {
+    Plugins.SMT: "plugin_smt",
+    Plugins.TAINT_BIT: "plugin_taint_miasm",
+    Plugins.TAINT_BYTE: "plugin_taint_triton",
+    Plugins.BACKWARD_SLICING: "plugin_backward_slicing",
+    Plugins.SYMBOLIC_EXECUTION: "plugin_symbolic_execution",
+    Plugins.SYMBOLIC_EXECUTION_DEPTH_5: "plugin_symbolic_execution_depth_5",
+    Plugins.MBA_DUMPER: "plugin_mba_dumper",
+    Plugins.SYNTHESIS: "plugin_synthesis",
+    Plugins.COMPILER_OPTIMIZATIONS: "plugin_compiler_optimizations",
+}
+
+
+class NonDaemonicProcess(multiprocessing.get_context().Process):
+    """
+    Pool worker that may start processes of its own: the parallel path exploration of a
+    handler (--se-workers) falls back to sequential exploration in daemonic processes
+    """
+
+    @property
+    def daemon(self) -> bool:
+        return False
+
+    @daemon.setter
+    def daemon(self, value: bool) -> None:
+        pass
+
+
+class NonDaemonicContext(type(multiprocessing.get_context())):
+    Process = NonDaemonicProcess
+
+
+# plugins analyzing each explored path of a handler, which can share the exploration (fused mode)
+PATH_ANALYSIS_PLUGINS = (Plugins.TAINT_BYTE, Plugins.TAINT_BIT, Plugins.BACKWARD_SLICING, Plugins.SYMBOLIC_EXECUTION,
+                         Plugins.SYMBOLIC_EXECUTION_DEPTH_5, Plugins.MBA_DUMPER)
+
+# plugin module imported once per worker process (in-process mode)
+worker_plugin: Optional[ModuleType] = None
+# plugin modules imported once per worker process (fused mode)
+worker_plugins: List[ModuleType] = []
+
+
+def init_plugin_worker(module_name: str) -> None:
+    """Import the plugin -- and thereby miasm, z3 and triton -- once per worker process"""
+    global worker_plugin
+    sys.path.insert(0, "./miasm")
+    worker_plugin = importlib.import_module(module_name)
+
+
+def test_instance_in_process(args: List[str]) -> Optional[str]:
+    assert worker_plugin is not None, "Worker has not been initialized with a plugin"
     try:
-        p = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    except subprocess.CalledProcessError as e:
-        logger.error(e)
-        if e.output:
-            logger.warning(e.output.decode())
+        result = worker_plugin.run(worker_plugin.prepare_context(*args))
+    except Exception as e:
+        logger.error(f"{worker_plugin.__name__} failed for {' '.join(args)}: {e!r}")
+        logger.debug(traceback.format_exc())
         return None
-    except subprocess.TimeoutExpired as e:
-        logger.error(e)
-        return None
-    output = p.stdout.decode().strip()
-    if output:
-        print(output)
-        return output
-    else:
-        logger.warning(f"No output for {target.as_posix()}")
+    if result is None:
+        logger.warning(f"No output for {args[0]}")
         return None
+    output = str(result)
+    print(output)
+    return output
 
 
-def run_smt_plugin(cmd: List[str], num_jobs: int, target_instances: List[Path]) \
-            -> List[Optional[str]]:
-    with Pool(num_jobs) as pool:
-        fn = functools.partial(test_smt_instance, cmd)
-        results = pool.map(fn, target_instances)
-    assert len(results) == len(target_instances)
-    return results
+def init_fused_worker(module_names: List[str]) -> None:
+    """Import all fused plugins once per worker process"""
+    global worker_plugins
+    sys.path.insert(0, "./miasm")
+    worker_plugins = [importlib.import_module(module_name) for module_name in module_names]
 
 
-def test_instance(cmd: List[str], attacker_type: str, target_tuple: Tuple[Path, int]) -> Optional[str]:
-    target, core_semantics_idx = target_tuple
-    cmd += [target.parent.as_posix()]
-    cmd += [str(core_semantics_idx)]
-    cmd += [attacker_type]
-    # print(cmd)
+def test_instance_fused(args: List[str]) -> List[Optional[str]]:
+    """
+    Run all fused plugins on one task; the analyses of plugins targeting the
+    same handler share a single exploration of its paths
+    """
+    assert worker_plugins, "Worker has not been initialized with plugins"
+    # miasm is importable once init_fused_worker has extended sys.path
+    from lokiattack.plugin import run_path_analyses
+
+    outputs: List[Optional[str]] = [None] * len(worker_plugins)
+    explorations: Dict[tuple, list] = {}
+    for index, plugin in enumerate(worker_plugins):
+        try:
+            ctx = plugin.prepare_context(*args)
+            analysis = plugin.create_analysis(ctx)
+        except Exception as e:
+            logger.error(f"{plugin.__name__} failed for {' '.join(args)}: {e!r}")
+            logger.debug(traceback.format_exc())
+            continue
+        explorations.setdefault((ctx.file_path, ctx.handler_index, ctx.key), []).append((index, analysis))
+
+    for analyses in explorations.values():
+        names = ", ".join(worker_plugins[index].__name__ for index, _ in analyses)
+        try:
+            results = run_path_analyses([analysis for _, analysis in analyses])
+        except Exception as e:
+            logger.error(f"{names} failed for {' '.join(args)}: {e!r}")
+            logger.debug(traceback.format_exc())
+            continue
+        for (index, _), result in zip(analyses, results):
+            if result is None:
+                logger.warning(f"No output of {worker_plugins[index].__name__} for {args[0]}")
+                continue
+            outputs[index] = str(result)
+            print(outputs[index])
+    return outputs
+
+
+def test_instance_subprocess(module_name: str, args: List[str]) -> Optional[str]:
+    cmd = ["python3", f"{module_name}.py"] + args
     try:
         p = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
     except subprocess.CalledProcessError as e:
@@ -162,103 +245,160 @@ def test_instance(cmd: List[str], attacker_type: str, target_tuple: Tuple[Path,
         print(output)
         return output
     else:
-        logger.warning(f"No output for {target.as_posix()}")
+        logger.warning(f"No output for {args[0]}")
         return None
 
 
-def run_syntactic_simplification_plugin(cmd: List[str], num_jobs: int, attacker_type: str, \
-            target_instances: List[Path]) -> List[Optional[str]]:
-    logger.debug(f"Command is {' '.join(cmd)} INSTANCE_PATH")
-    targets = []
-    for i in range(7):
-        for obf_exe in target_instances:
-            targets.append((obf_exe, i))
-    with Pool(num_jobs) as pool:
-        fn = functools.partial(test_instance, cmd, attacker_type)
-        results = pool.map(fn, targets)
-    assert len(results) == len(targets)
+def run_tasks(module_name: str, num_jobs: int, tasks: List[List[str]], in_subprocess: bool,
+              max_tasks_per_worker: Optional[int], chunksize: int = 1) -> List[Optional[str]]:
+    """
+    Run the plugin on each task (list of plugin arguments). By default, tasks are executed
+    in-process by a pool of long-lived workers; in_subprocess spawns a new python3
+    process per task instead (isolation). Each run of chunksize consecutive tasks is
+    executed by the same worker.
+    """
+    if in_subprocess:
+        logger.debug(f"Command is python3 {module_name}.py INSTANCE_ARGS")
+        with Pool(num_jobs) as pool:
+            fn = functools.partial(test_instance_subprocess, module_name)
+            results = pool.map(fn, tasks, chunksize=chunksize)
+    else:
+        logger.debug(f"Running {module_name} in-process")
+        # import once in the parent: import errors surface here (a failing pool initializer would
+        # be respawned forever) and forked workers inherit the loaded modules
+        init_plugin_worker(module_name)
+        with NonDaemonicContext().Pool(num_jobs, initializer=init_plugin_worker, initargs=(module_name,),
+                                       maxtasksperchild=max_tasks_per_worker) as pool:
+            results = pool.map(test_instance_in_process, tasks, chunksize=chunksize)
+    assert len(results) == len(tasks)
     return results
 
 
-def test_handlerlist_instance(cmd: List[str], target: Tuple[str, str, str]) -> Optional[str]:
-    cmd += [e for e in target]
-    try:
-        p = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    except subprocess.CalledProcessError as e:
-        logger.error(e)
-        if e.output:
-            logger.warning(e.output.decode())
-        return None
-    except subprocess.TimeoutExpired as e:
-        logger.error(e)
-        return None
-    output = p.stdout.decode().strip()
-    if output:
-        print(output)
-        return output
-    else:
-        logger.warning(f"No output for {target[0]}")
-        return None
+def semantics_tasks(target_instances: List[Path], attacker_type: str) -> List[List[str]]:
+    """Tasks of all core semantics of all instances, in output order (all instances per core semantics)"""
+    return [[obf_exe.parent.as_posix(), str(i), attacker_type]
+            for i in range(NUM_CORE_SEMANTICS) for obf_exe in target_instances]
+
+
+def semantics_task_order(num_instances: int, num_jobs: int) -> Tuple[List[int], int]:
+    """
+    Execution order and chunksize of the semantics_tasks of num_instances instances. If every
+    worker gets at least NUM_CORE_SEMANTICS tasks, the core semantics of an instance form one
+    chunk, whose worker then reuses its analysis cache; otherwise, tasks are handed out one by
+    one to keep all workers busy.
+    :return: list of task indices, chunksize
+    """
+    num_tasks = num_instances * NUM_CORE_SEMANTICS
+    if num_tasks < num_jobs * NUM_CORE_SEMANTICS:
+        return list(range(num_tasks)), 1
+    return [i * num_instances + instance for instance in range(num_instances)
+            for i in range(NUM_CORE_SEMANTICS)], NUM_CORE_SEMANTICS
 
 
-def run_handlerlist_plugin(cmd: List[str], num_jobs: int, handler_list_file: Path, expected_elems_per_line: int) \
+def restore_task_order(results: List[Any], order: List[int]) -> List[Any]:
+    """Results in task order, given the results of the tasks executed in order"""
+    restored: List[Any] = [None] * len(results)
+    for index, result in zip(order, results):
+        restored[index] = result
+    return restored
+
+
+def run_fused_plugins(plugin_names: List[str], num_jobs: int, attacker_type: str, target_instances: List[Path],
+                      max_tasks_per_worker: Optional[int]) -> Dict[str, List[Optional[str]]]:
+    """
+    Run several path analysis plugins in a single pass: the paths of each handler are
+    explored once per attacker type and fed to the analyses of all plugins.
+    :return: outputs per task, per plugin name
+    """
+    plugins = [Plugins.from_name(plugin_name) for plugin_name in plugin_names]
+    for plugin in plugins:
+        if plugin not in PATH_ANALYSIS_PLUGINS:
+            raise NotImplementedError(f"{plugin} cannot share path explorations")
+    if Plugins.MBA_DUMPER in plugins:
+        assert attacker_type == "dynamic", "MBA diversity was only tested for stronger dynamic attacker"
+    module_names = [PLUGIN_MODULES[plugin] for plugin in plugins]
+    logger.info(f"Using fused plugins {', '.join(plugin.name for plugin in plugins)} -- num_jobs={num_jobs}, "
+                f"attacker_type={attacker_type}")
+
+    tasks = semantics_tasks(target_instances, attacker_type)
+    order, chunksize = semantics_task_order(len(target_instances), num_jobs)
+
+    # import once in the parent, see run_tasks
+    init_fused_worker(module_names)
+    with NonDaemonicContext().Pool(num_jobs, initializer=init_fused_worker, initargs=(module_names,),
+                                   maxtasksperchild=max_tasks_per_worker) as pool:
+        results = pool.map(test_instance_fused, [tasks[index] for index in order], chunksize=chunksize)
+    results = restore_task_order(results, order)
+    assert len(results) == len(tasks)
+
+    return {plugin_name: [outputs[index] for outputs in results] for index, plugin_name in enumerate(plugin_names)}
+
+
+def fused_output_path(output: Path, plugin_name: str) -> Path:
+    """Result file of plugin_name in fused mode: <output stem>_<plugin name><output suffix>"""
+    return output.with_name(f"{output.stem}_{plugin_name}{output.suffix}")
+
+
+def run_smt_plugin(module_name: str, num_jobs: int, target_instances: List[Path], in_subprocess: bool,
+                   max_tasks_per_worker: Optional[int]) -> List[Optional[str]]:
+    tasks = [[target.parent.as_posix()] for target in target_instances]
+    return run_tasks(module_name, num_jobs, tasks, in_subprocess, max_tasks_per_worker)
+
+
+def run_syntactic_simplification_plugin(module_name: str, num_jobs: int, attacker_type: str,
+            target_instances: List[Path], in_subprocess: bool, max_tasks_per_worker: Optional[int]) \
             -> List[Optional[str]]:
-    logger.debug(f"Command is {' '.join(cmd)} INSTANCE_PATH")
+    tasks = semantics_tasks(target_instances, attacker_type)
+    order, chunksize = semantics_task_order(len(target_instances), num_jobs)
+    results = run_tasks(module_name, num_jobs, [tasks[index] for index in order], in_subprocess,
+                        max_tasks_per_worker, chunksize=chunksize)
+    return restore_task_order(results, order)
+
+
+def run_handlerlist_plugin(module_name: str, num_jobs: int, handler_list_file: Path, expected_elems_per_line: int,
+            in_subprocess: bool, max_tasks_per_worker: Optional[int]) -> List[Optional[str]]:
     with open(handler_list_file, "r", encoding="utf-8") as f:
         content = [l.strip() for l in f.readlines() if l.strip()]
     assert len(content) > 0, "Expected at least one line in file"
     elems_per_line = len(content[0].strip().split())
     assert elems_per_line  == expected_elems_per_line, \
             f"Found {elems_per_line} elements in handler_list[0], expected {expected_elems_per_line}"
-    data = [tuple(l.split(" ")) for l in content]
-    with Pool(num_jobs) as pool:
-        fn = functools.partial(test_handlerlist_instance, cmd)
-        results = pool.map(fn, data)
-    assert len(results) == len(data)
-    return results
+    tasks = [l.split(" ") for l in content]
+    return run_tasks(module_name, num_jobs, tasks, in_subprocess, max_tasks_per_worker)
 
 
 def run_plugin(plugin_name: str, num_jobs: int, attacker_type: str, target_instances: List[Path], \
-            handler_list_file: Optional[Path]) -> List[Optional[str]]:
+            handler_list_file: Optional[Path], in_subprocess: bool = False,
+            max_tasks_per_worker: Optional[int] = None) -> List[Optional[str]]:
     """
-    For legacy reasons, this executes the plugin in a subprocess.
+    Run the plugin on all target instances. Plugins are executed in-process by default;
+    in_subprocess restores the legacy behavior of one python3 subprocess per task.
     """
     plugin = Plugins.from_name(plugin_name)
-    logger.info(f"Using plugin {plugin.name} -- num_jobs={num_jobs}, attacker_type={attacker_type}")
+    logger.info(f"Using plugin {plugin.name} -- num_jobs={num_jobs}, attacker_type={attacker_type}, "
+                f"in_subprocess={in_subprocess}")
 
-    cmd = ["python3"]
+    module_name = PLUGIN_MODULES[plugin]
     if plugin == Plugins.SMT:
         assert attacker_type == "static", "SMT experiments always assume static attacker"
-        cmd += ["plugin_smt.py"]
         # note: this is a special case; this plugin does not expect a core semantics index
-        return run_smt_plugin(cmd, num_jobs, target_instances)
-    if plugin == Plugins.TAINT_BYTE:
-        cmd += ["plugin_taint_triton.py"]
-        return run_syntactic_simplification_plugin(cmd, num_jobs, attacker_type, target_instances)
-    if plugin == Plugins.TAINT_BIT:
-        cmd += ["plugin_taint_miasm.py"]
-        return run_syntactic_simplification_plugin(cmd, num_jobs, attacker_type, target_instances)
-    if plugin == Plugins.BACKWARD_SLICING:
-        cmd += ["plugin_backward_slicing.py"]
-        return run_syntactic_simplification_plugin(cmd, num_jobs, attacker_type, target_instances)
-    if plugin == Plugins.SYMBOLIC_EXECUTION:
-        cmd += ["plugin_symbolic_execution.py"]
-        return run_syntactic_simplification_plugin(cmd, num_jobs, attacker_type, target_instances)
-    if plugin == Plugins.SYMBOLIC_EXECUTION_DEPTH_5:
-        cmd += ["plugin_symbolic_execution_depth_5.py"]
-        return run_syntactic_simplification_plugin(cmd, num_jobs, attacker_type, target_instances)
+        return run_smt_plugin(module_name, num_jobs, target_instances, in_subprocess, max_tasks_per_worker)
+    if plugin in (Plugins.TAINT_BYTE, Plugins.TAINT_BIT, Plugins.BACKWARD_SLICING, Plugins.SYMBOLIC_EXECUTION,
+                  Plugins.SYMBOLIC_EXECUTION_DEPTH_5):
+        return run_syntactic_simplification_plugin(module_name, num_jobs, attacker_type, target_instances,
+                                                   in_subprocess, max_tasks_per_worker)
     if plugin == Plugins.MBA_DUMPER:
         assert attacker_type == "dynamic", "MBA diversity was only tested for stronger dynamic attacker"
-        cmd += ["plugin_mba_dumper.py"]
-        return run_syntactic_simplification_plugin(cmd, num_jobs, attacker_type, target_instances)
+        return run_syntactic_simplification_plugin(module_name, num_jobs, attacker_type, target_instances,
+                                                   in_subprocess, max_tasks_per_worker)
     if plugin == Plugins.SYNTHESIS:
         assert attacker_type == "dynamic", "Synthesis was only tested for stronger dynamic attacker"
         if not handler_list_file:
             logger.error("Synthesis plugin requires a path to a file containing a list of PATH HANDLER_IDX VALID_KEY")
             assert handler_list_file, \
                     "Synthesis plugin requires a path to a file containing a list of PATH HANDLER_IDX VALID_KEY"
-        cmd += ["plugin_synthesis.py"]
-        return run_handlerlist_plugin(cmd, num_jobs, handler_list_file, 3)
+        return run_handlerlist_plugin(module_name, num_jobs, handler_list_file, 3, in_subprocess,
+                                      max_tasks_per_worker)
     if plugin == Plugins.COMPILER_OPTIMIZATIONS:
         assert attacker_type == "static", "Compiler optimizations assume static attacker"
         if not handler_list_file:
@@ -267,8 +407,8 @@ def run_plugin(plugin_name: str, num_jobs: int, attacker_type: str, target_insta
             )
             assert handler_list_file, \
                     "Compiler optimizations plugin requires a path to a file containing a list of PATH HANDLER_ADDRESS"
-        cmd += ["plugin_compiler_optimizations.py"]
-        return run_handlerlist_plugin(cmd, num_jobs, handler_list_file, 2)
+        return run_handlerlist_plugin(module_name, num_jobs, handler_list_file, 2, in_subprocess,
+                                      max_tasks_per_worker)
     else:
         raise NotImplementedError(f"{plugin} not supported yet")
 
@@ -282,7 +422,23 @@ def main(args: Namespace) -> None:
     if attacker_type not in ("static", "dynamic"):
         raise RuntimeError(f"Unknown attacker type '{attacker_type}' -- must be 'static' or 'dynamic'")
 
-    output = run_plugin(args.plugin_name, args.max_processes, attacker_type, target_instances, args.handler_list)
+    plugin_names = [name.strip() for name in args.plugin_name.split(",") if name.strip()]
+    if len(plugin_names) > 1:
+        if args.subprocess:
+            raise RuntimeError("Fused plugins run in-process only")
+        outputs = run_fused_plugins(plugin_names, args.max_processes, attacker_type, target_instances,
+                                    args.max_tasks_per_worker)
+        if args.output:
+            for plugin_name, output in outputs.items():
+                output_path = fused_output_path(args.output, plugin_name)
+                logger.debug(f"Writing output of {plugin_name} to {output_path.as_posix()}")
+                with open(output_path, "w", encoding="utf-8") as f:
+                    f.write("\n".join(map(str, output)))
+        logger.info(f"Done in {time() - start:.2f}s")
+        return
+
+    output = run_plugin(args.plugin_name, args.max_processes, attacker_type, target_instances, args.handler_list,
+                        args.subprocess, args.max_tasks_per_worker)
     if args.output:
         logger.debug(f"Writing output to {args.output.as_posix()}")
         with open(args.output, "w", encoding="utf-8") as f:
@@ -292,7 +448,9 @@ def main(args: Namespace) -> None:
 
 if __name__ == "__main__":
     parser = ArgumentParser(description="LokiAttack manager script")
-    parser.add_argument("plugin_name", help="Name of LokiAttack plugin")
+    parser.add_argument("plugin_name",
+                        help="Name of LokiAttack plugin, or comma-separated names of path analysis plugins "
+                             "sharing one path exploration (fused mode, one output file per plugin)")
     parser.add_argument("path", type=Path, help="path to evaluation directory")
     parser.add_argument("attacker_type", help="Whether attacker is static or dynamic")
     parser.add_argument("-o", "--output", type=Path, help="Output file where to store results")
@@ -312,8 +470,26 @@ if __name__ == "__main__":
     parser.add_argument("--max-processes", dest="max_processes", action="store", type=int,
                         default=NUM_CPUS,
                         help="Number of maximal usable processes (defaults to os.cpu_count())")
+    parser.add_argument("--subprocess", dest="subprocess", action="store_true", default=False,
+                        help="Run each task in a new python3 subprocess instead of in-process (isolation)")
+    parser.add_argument("--no-path-store", dest="path_store", action="store_false", default=True,
+                        help="Always explore the handlers' paths instead of replaying stored explorations")
+    parser.add_argument("--max-tasks-per-worker", dest="max_tasks_per_worker", action="store", type=int,
+                        default=None,
+                        help="Restart in-process workers after this many tasks (defaults to never)")
+    parser.add_argument("--se-workers", dest="se_workers", action="store", type=int, default=None,
+                        help="Number of processes exploring the paths of a single handler (symbolic execution "
+                             "plugins; defaults to os.cpu_count() / --max-processes, at least 1)")
     cargs = parser.parse_args()
 
     setup_logging(cargs.path, cargs.plugin_name, cargs.log_level * 10)
 
+    # read by lokiattack.path_store, in-process workers and subprocesses alike
+    if not cargs.path_store:
+        os.environ["LOKIATTACK_PATH_STORE"] = "0"
+    # explorer processes of a handler run next to the other tasks of the pool: explore
+    # sequentially if the pool already fills the cores
+    se_workers = cargs.se_workers or max(1, NUM_CPUS // max(1, cargs.max_processes))
+    os.environ["LOKIATTACK_SE_WORKERS"] = str(se_workers)
+
     main(cargs)
@@ -7,7 +7,7 @@ import random
 from syntia.mcts.mcts import *
 from syntia.mcts.game import Game, Variable
 from syntia.mcts.grammar import Grammar
-from syntia.mcts.utils import to_sha1, replace_variables
+from syntia.utils.io_table import IOTable
 from syntia.utils.utils import dump_to_json
 from syntia.utils.paralleliser import Paralleliser
 from functools import partial
@@ -134,13 +134,7 @@ class Synthesiser:
             return True
 
         inputs = gen_inputs(len(self.variables), self.num_of_samples)
-        outputs = []
-        for args in inputs:
-            expr_new = replace_variables(expr, game.variables.keys(), args)
-            output = game.evaluate_expr(expr_new)
-            outputs.append(output)
-
-        outputs = set(outputs)
+        outputs = set(game.evaluate_expr_samples(expr, inputs))
         if len(outputs) == 1 and (0 in outputs or 1 in outputs):
             return True
 
@@ -148,14 +142,10 @@ class Synthesiser:
 
     def gen_in_out_map(self):
         in_out_map = dict()
-        for index in range(len(self.inputs)):
 
-            for expr, game in self.expressions:
-                if expr not in in_out_map:
-                    in_out_map[expr] = dict()
-                expr_new = replace_variables(expr, self.variables_grammar, self.inputs[index][:len(self.variables)])
-                current_inputs_sha1 = to_sha1(str(self.inputs[index]).replace("L", ""))
-                in_out_map[expr][current_inputs_sha1] = game.evaluate_expr(expr_new)
+        for expr, game in self.expressions:
+            if expr not in in_out_map:
+                in_out_map[expr] = IOTable(self.inputs, game.evaluate_expr_samples(expr, self.inputs))
 
         return in_out_map
 
@@ -165,11 +155,8 @@ class Synthesiser:
         :param args: list of inputs
         :return: output
         """
-        # calc hash
-        args_sha1 = to_sha1(str(args).replace("L", ""))
-
         # return output
-        return self.in_out_map[expr][args_sha1]
+        return self.in_out_map[expr].lookup(args)
 
 
 def synthesise(commands, result, index):
@@ -186,10 +173,10 @@ def synthesise(commands, result, index):
 
     synthesis_oracle = lambda x: synthesiser.oracle(expr, x)
 
-    synthesis_inputs = list(synthesiser.inputs)
-    assert(len(synthesis_inputs) == parameters.samples)
+    io_table = synthesiser.in_out_map[expr]
+    assert(len(io_table) == parameters.samples)
 
-    mc = MCTS(game, synthesis_oracle, synthesis_inputs, uct_scalar=parameters.sa_const)
+    mc = MCTS(game, synthesis_oracle, io_table, uct_scalar=parameters.sa_const)
     mc.verbosity_level = 0
     s = State(game, game.bitsize)
 
@@ -0,0 +1,398 @@
+from __future__ import division
+
+import numpy as np
+
+
+def to_signed(v, max_unsigned):
+    """
+    Transforms a value to signed
+    :param v: int
+    :param max_unsigned: int, 2 ** bitsize
+    :return: int
+    """
+    if v & (max_unsigned // 2):
+        v -= max_unsigned
+    return v
+
+
+def trunc_div(a, b):
+    """
+    Truncating divions towards 0
+    :param a: int
+    :param b: int
+    :return: int
+    """
+    if a < 0:
+        a = -a
+        b = -b
+    if b < 0:
+        return (a + b + 1) // b
+    return a // b
+
+
+# operator semantics, mirroring Game.evaluate_expr:
+# op2 is the left and op1 the right operand, m is 2 ** op_size
+def bvudiv(op2, op1, m):
+    try:
+        return (op2 // op1) % m
+    except ZeroDivisionError:
+        return (-1) % m
+
+
+def bvsdiv(op2, op1, m):
+    op2 = to_signed(op2, m if op2 < m else m * m)
+    op1 = to_signed(op1, m)
+    try:
+        return trunc_div(op2, op1) % m
+    except ZeroDivisionError:
+        return (-1) % m if 0 <= op2 else 1
+
+
+def bvurem(op2, op1, m):
+    try:
+        return (op2 - op1 * (op2 // op1)) % m
+    except ZeroDivisionError:
+        if op2 == op1:
+            return 0
+        return op2
+
+
+def bvsrem(op2, op1, m):
+    op2 = to_signed(op2, m if op2 < m else m * m)
+    op1 = to_signed(op1, m)
+    try:
+        return (op2 - op1 * trunc_div(op2, op1)) % m
+    except ZeroDivisionError:
+        return op2
+
+
+def bvshl(op2, op1, m, shift_mask):
+    return ((op2 % m) * pow(2, (op1 % m) & shift_mask, m)) % m
+
+
+def bvlshr(op2, op1, m, shift_mask):
+    return ((op2 % m) >> ((op1 % m) & shift_mask)) % m
+
+
+def bvashr(op2, op1, m, shift_mask):
+    op2 = to_signed(op2 % m, m)
+    op1 = (op1 % m) & shift_mask
+    return (op2 >> (op1 % m)) % m
+
+
+def bvextract(op3, start, end):
+    return ((1 << (end - start + 1)) - 1) & (op3 >> start)
+
+
+def sign_extend(op1, v_size, d_size, op_size):
+    return to_signed(op1 % (2 ** op_size), 2 ** v_size) % (2 ** d_size)
+
+
+# operators that are evaluated by calling the functions above
+CALL_OPS = {
+    "bvudiv": "bvudiv({op2}, {op1}, {m})",
+    "bvsdiv": "bvsdiv({op2}, {op1}, {m})",
+    "bvurem": "bvurem({op2}, {op1}, {m})",
+    "bvsrem": "bvsrem({op2}, {op1}, {m})",
+    "bvshl": "bvshl({op2}, {op1}, {m}, {shift_mask})",
+    "bvlshr": "bvlshr({op2}, {op1}, {m}, {shift_mask})",
+    "bvashr": "bvashr({op2}, {op1}, {m}, {shift_mask})",
+}
+
+# operators that are inlined into the compiled expression
+INLINE_OPS = {
+    "bvadd": "(({op2} + {op1}) % {m})",
+    "bvsub": "(({op2} - {op1}) % {m})",
+    "bvmul": "(({op2} * {op1}) % {m})",
+    "bvand": "(({op2} & {op1}) % {m})",
+    "bvor": "(({op2} | {op1}) % {m})",
+    "bvxor": "(({op2} ^ {op1}) % {m})",
+    "zero_extend": "({op1} % {m})",
+    "bvconcat": "((({op2} % {m}) << {op_size}) | ({op1} % {m}))",
+    "bvnot": "((~ {op}) % {m})",
+    "bvneg": "((- {op}) % {m})",
+}
+
+# names visible to the compiled expressions
+NAMESPACE = {f.__name__: f for f in (bvudiv, bvsdiv, bvurem, bvsrem, bvshl, bvlshr, bvashr, bvextract, sign_extend)}
+
+
+def _modulus(op_size):
+    """
+    Source of 2 ** op_size; folded if op_size is a constant
+    :param op_size: str, source of the operand size
+    :return: str
+    """
+    if op_size.isdigit():
+        return str(2 ** int(op_size))
+    return "(2 ** {})".format(op_size)
+
+
+def rpn_to_python(expr, grammar, variables, bitsize):
+    """
+    Translates an expression in RPN into a Python
+    expression over the variables v0, v1, ...
+    :param expr: str, expression in rpn
+    :param grammar: Grammar
+    :param variables: list of variable names, in argument order
+    :param bitsize: int, bit size of the game
+    :return: str, Python expression
+    """
+    arguments = {v: "v{}".format(index) for index, v in enumerate(variables)}
+    shift_mask = 63 if bitsize == 64 else 31
+
+    stack = []
+    # walk over expression
+    for e in expr.split(" "):
+        # ternary operator
+        if e in grammar.op3:
+            op1 = stack.pop()
+            op2 = stack.pop()
+            op3 = stack.pop()
+            op_size = stack.pop()
+
+            if e == "bvextract":
+                result = "bvextract({}, {}, {})".format(op3, op2, op1)
+            elif e == "sign_extend":
+                result = "sign_extend({}, {}, {}, {})".format(op1, op2, op3, op_size)
+
+            stack.append(result)
+
+        # binary operator
+        elif e in grammar.op2:
+            op1 = stack.pop()
+            op2 = stack.pop()
+            op_size = stack.pop()
+
+            template = INLINE_OPS[e] if e in INLINE_OPS else CALL_OPS[e]
+            result = template.format(op2=op2, op1=op1, op_size=op_size, m=_modulus(op_size), shift_mask=shift_mask)
+
+            stack.append(result)
+        # unary operator
+        elif e in grammar.op1:
+            op = stack.pop()
+            op_size = stack.pop()
+
+            stack.append(INLINE_OPS[e].format(op=op, m=_modulus(op_size)))
+        elif e in arguments:
+            stack.append(arguments[e])
+        else:
+            stack.append(str(int(e)))
+
+    return "({} % {})".format(stack.pop(), 2 ** bitsize)
+
+
+def compile_expr(expr, grammar, variables, bitsize):
+    """
+    Compiles an expression in RPN into a function that
+    evaluates it on a list of samples. A sample holds
+    one value per variable, in the order of variables;
+    surplus values are ignored.
+    :param expr: str, expression in rpn
+    :param grammar: Grammar
+    :param variables: list of variable names
+    :param bitsize: int, bit size of the game
+    :return: function, list of samples -> list of ints
+    """
+    body = rpn_to_python(expr, grammar, variables, bitsize)
+    targets = ", ".join(["v{}".format(index) for index in range(len(variables))] + ["*_"])
+    source = "lambda samples: [{} for {} in samples]".format(body, targets)
+
+    return eval(compile(source, "<rpn>", "eval"), NAMESPACE)
+
+
+# NumPy backend: expressions whose intermediate values fit into 64 bits are
+# evaluated on uint64 columns holding one variable each, all samples at once
+
+# largest operand size of the NumPy backend
+NUMPY_MAX_BITSIZE = 64
+
+
+def np_mask(size):
+    """
+    Source of the uint64 mask 2 ** size - 1
+    :param size: int
+    :return: str
+    """
+    return "U({})".format((1 << size) - 1)
+
+
+def np_bvashr(op2, op1, size, shift_mask):
+    op2, op1 = np.broadcast_arrays(op2, op1)
+    mask = np.uint64((1 << size) - 1)
+    sign = np.uint64(1 << (size - 1))
+    # two's complement of the size-bit value
+    op2 = (((op2 & mask) ^ sign) - sign).view(np.int64)
+    op1 = ((op1 & mask) & np.uint64(shift_mask)).astype(np.int64)
+    return (op2 >> op1).view(np.uint64) & mask
+
+
+def np_sign_extend(op1, v_size, d_size, op_size):
+    op1 = op1 & np.uint64((1 << op_size) - 1)
+    d_mask = np.uint64((1 << d_size) - 1)
+    if v_size >= 64:
+        return op1 & d_mask
+    return np.where(op1 & np.uint64(1 << (v_size - 1)), op1 - np.uint64(1 << v_size), op1) & d_mask
+
+
+NP_OPS = {
+    "bvadd": "(({op2} + {op1}) & {mask})",
+    "bvsub": "(({op2} - {op1}) & {mask})",
+    "bvmul": "(({op2} * {op1}) & {mask})",
+    "bvand": "(({op2} & {op1}) & {mask})",
+    "bvor": "(({op2} | {op1}) & {mask})",
+    "bvxor": "(({op2} ^ {op1}) & {mask})",
+    "bvshl": "((({op2} & {mask}) << (({op1} & {mask}) & U({shift_mask}))) & {mask})",
+    "bvlshr": "(({op2} & {mask}) >> (({op1} & {mask}) & U({shift_mask})))",
+    "bvashr": "np_bvashr({op2}, {op1}, {op_size}, {shift_mask})",
+    "zero_extend": "({op1} & {mask})",
+    "bvconcat": "((({op2} & {mask}) << U({op_size})) | ({op1} & {mask}))",
+    "bvnot": "((~ {op}) & {mask})",
+    "bvneg": "((U(0) - {op}) & {mask})",
+}
+
+NP_NAMESPACE = {"U": np.uint64, "full": np.full, "np_bvashr": np_bvashr, "np_sign_extend": np_sign_extend}
+
+
+class Unsupported(Exception):
+    """Expression needs more than 64 bits"""
+
+
+def _np_constant(python_source):
+    """
+    Folds a variable-free subexpression with the Python semantics
+    :param python_source: str, Python expression
+    :return: tuple of NumPy source and value
+    """
+    value = eval(python_source, NAMESPACE)
+    if not 0 <= value < 2 ** NUMPY_MAX_BITSIZE:
+        raise Unsupported()
+    return "U({})".format(value), value
+
+
+def _np_size(entry):
+    """
+    Constant operand size of the NumPy backend
+    :param entry: tuple of NumPy source and value
+    :return: int
+    """
+    size = entry[1]
+    if size is None or not 0 < size <= NUMPY_MAX_BITSIZE:
+        raise Unsupported()
+    return size
+
+
+def rpn_to_numpy(expr, grammar, variables, bitsize):
+    """
+    Translates an expression in RPN into a NumPy
+    expression over the uint64 columns v0, v1, ...
+    Variable-free subexpressions are folded to constants.
+    :param expr: str, expression in rpn
+    :param grammar: Grammar
+    :param variables: list of variable names, in argument order
+    :param bitsize: int, bit size of the game
+    :return: str, NumPy expression; None if the expression needs more than 64 bits
+    """
+    if bitsize > NUMPY_MAX_BITSIZE:
+        return None
+
+    arguments = {v: "v{}".format(index) for index, v in enumerate(variables)}
+    shift_mask = 63 if bitsize == 64 else 31
+
+    # stack of (NumPy source, value if constant)
+    stack = []
+    try:
+        # walk over expression
+        for e in expr.split(" "):
+            # ternary operator
+            if e in grammar.op3:
+                op1 = stack.pop()
+                op2 = stack.pop()
+                op3 = stack.pop()
+                op_size = stack.pop()
+
+                if e == "bvextract":
+                    if op2[1] is None or op1[1] is None or not 0 <= op2[1] <= op1[1] < NUMPY_MAX_BITSIZE:
+                        raise Unsupported()
+                    if op3[1] is not None:
+                        result = _np_constant("bvextract({}, {}, {})".format(op3[1], op2[1], op1[1]))
+                    else:
+                        result = ("(({} >> U({})) & {})".format(op3[0], op2[1], np_mask(op1[1] - op2[1] + 1)),
+                                  None)
+                elif e == "sign_extend":
+                    sizes = [_np_size(op) for op in (op2, op3, op_size)]
+                    if op1[1] is not None:
+                        result = _np_constant("sign_extend({}, {}, {}, {})".format(op1[1], *sizes))
+                    else:
+                        result = ("np_sign_extend({}, {}, {}, {})".format(op1[0], *sizes), None)
+
+                stack.append(result)
+
+            # binary operator
+            elif e in grammar.op2:
+                op1 = stack.pop()
+                op2 = stack.pop()
+                op_size = stack.pop()
+
+                size = _np_size(op_size)
+                # division and remainder only occur on bvconcat operands
+                if e not in NP_OPS or (e == "bvconcat" and 2 * size > NUMPY_MAX_BITSIZE):
+                    raise Unsupported()
+
+                if op1[1] is not None and op2[1] is not None:
+                    template = INLINE_OPS[e] if e in INLINE_OPS else CALL_OPS[e]
+                    result = _np_constant(template.format(op2=op2[1], op1=op1[1], op_size=size, m=2 ** size,
+                                                          shift_mask=shift_mask))
+                else:
+                    result = (NP_OPS[e].format(op2=op2[0], op1=op1[0], op_size=size, mask=np_mask(size),
+                                               shift_mask=shift_mask), None)
+
+                stack.append(result)
+            # unary operator
+            elif e in grammar.op1:
+                op = stack.pop()
+                op_size = stack.pop()
+
+                size = _np_size(op_size)
+                if op[1] is not None:
+                    result = _np_constant(INLINE_OPS[e].format(op=op[1], m=2 ** size))
+                else:
+                    result = (NP_OPS[e].format(op=op[0], mask=np_mask(size)), None)
+
+                stack.append(result)
+            elif e in arguments:
+                stack.append((arguments[e], None))
+            else:
+                stack.append(_np_constant(str(int(e))))
+    except Unsupported:
+        return None
+
+    source, value = stack.pop()
+    if value is not None:
+        # constant expression
+        return "full(n, U({}))".format(value % 2 ** bitsize)
+    return "({} & {})".format(source, np_mask(bitsize))
+
+
+def compile_expr_numpy(expr, grammar, variables, bitsize):
+    """
+    Compiles an expression in RPN into a function that
+    evaluates it on uint64 columns, one per variable,
+    holding n samples each.
+    :param expr: str, expression in rpn
+    :param grammar: Grammar
+    :param variables: list of variable names
+    :param bitsize: int, bit size of the game
+    :return: function, (columns, n) -> uint64 array; None if the expression needs more than 64 bits
+    """
+    body = rpn_to_numpy(expr, grammar, variables, bitsize)
+    if body is None:
+        return None
+
+    targets = ", ".join(["v{}".format(index) for index in range(len(variables))] + ["*_"])
+    source = "def evaluate(columns, n):\n    {} = columns\n    return {}\n".format(targets, body)
+
+    namespace = dict(NP_NAMESPACE)
+    exec(compile(source, "<rpn>", "exec"), namespace)
+
+    return namespace["evaluate"]
@@ -1,10 +1,11 @@
 from __future__ import division
 from random import choice
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
 from orderedset import OrderedSet
 import z3
 
-from syntia.mcts.utils import top_most_right_most, replace_nth_occurrence
+from syntia.mcts.compiler import compile_expr, compile_expr_numpy
+from syntia.mcts.grammar import NON_TERMINALS
 
 
 class Variable(object):
@@ -13,7 +14,16 @@ class Variable(object):
         self.size = size
 
 
+# expression as a tuple of token ids, with the (depth, -index) pairs
+# of its non-terminals in ascending order: the first pair locates
+# the top-most-right-most non-terminal
+Derivation = namedtuple("Derivation", "tokens agenda")
+
+
 class Game(object):
+    # number of compiled expressions kept per game
+    max_compiled_exprs = 2 ** 16
+
     def __init__(self, grammar, variables, bitsize=64):
         # grammmar
         self.grammar = grammar
@@ -35,10 +45,33 @@ class Game(object):
         self.max_unsigned = 2 ** bitsize
         # z3 variables dict
         self._z3_var = dict()
+        # compiled expressions, OrderedDict
+        self._compiled_exprs = OrderedDict()
+        # expressions compiled to NumPy (None if unsupported), OrderedDict
+        self._compiled_numpy_exprs = OrderedDict()
 
         # initial move
         self.initial_move = "u{}".format(bitsize)
 
+        # token vocabulary
+        self.token_ids = dict()
+        self.token_names = []
+        # number of operands per token id, 0 for non-operators
+        self.token_arity = []
+        # sizes of non-terminal token ids
+        self.non_terminal_sizes = dict()
+        # tokenized rules
+        self._rule_derivations = dict()
+        # moves per non-terminal size, tuple
+        self._size_moves = dict()
+
+    def __getstate__(self):
+        # compiled expressions cannot be pickled
+        state = self.__dict__.copy()
+        state["_compiled_exprs"] = OrderedDict()
+        state["_compiled_numpy_exprs"] = OrderedDict()
+        return state
+
     def _init_variables(self, variables_):
         """
         Maps variable names to variables
@@ -76,6 +109,146 @@ class Game(object):
         """
         return all(t not in expr for t in self.grammar.non_terminals)
 
+    def size_moves(self, size):
+        """
+        Moves of the non-terminal of the given size
+        :param size: int
+        :return: tuple of str
+        """
+        moves = self._size_moves.get(size)
+        if moves is None:
+            moves = self._size_moves[size] = tuple(self.moves["u{}".format(size)])
+        return moves
+
+    def token_id(self, token):
+        """
+        Maps a token to its id, extending the vocabulary
+        :param token: str
+        :return: int
+        """
+        tid = self.token_ids.get(token)
+        if tid is None:
+            tid = len(self.token_names)
+            self.token_ids[token] = tid
+            self.token_names.append(token)
+
+            # operator arity
+            if token in self.grammar.op3:
+                self.token_arity.append(3)
+            elif token in self.grammar.op2:
+                self.token_arity.append(2)
+            elif token in self.grammar.op1:
+                self.token_arity.append(1)
+            else:
+                self.token_arity.append(0)
+
+            if token in NON_TERMINALS:
+                self.non_terminal_sizes[tid] = int(token.strip("u"))
+
+        return tid
+
+    def _non_terminals(self, tokens):
+        """
+        Walks over tokens like top_most_right_most
+        :param tokens: tuple of token ids
+        :return: list of (depth, index) pairs, depth 1 is the top level
+        """
+        non_terminals = []
+
+        stack = [1]
+        for index in range(len(tokens) - 1, -1, -1):
+            token = tokens[index]
+            # decrease number of operands
+            stack[-1] -= 1
+
+            # operator
+            arity = self.token_arity[token]
+            if arity:
+                stack.append(arity + 1)
+            # non-terminal
+            elif token in self.non_terminal_sizes:
+                non_terminals.append((len(stack), index))
+            # remove zero-remaining operators
+            while stack and stack[-1] == 0:
+                stack.pop()
+
+        return non_terminals
+
+    def tokenize(self, expr):
+        """
+        Transforms an expression into a derivation
+        :param expr: str
+        :return: Derivation
+        """
+        tokens = tuple(self.token_id(t) for t in expr.split(" "))
+        agenda = tuple(sorted((depth, -index) for depth, index in self._non_terminals(tokens)))
+
+        return Derivation(tokens, agenda)
+
+    def detokenize(self, tokens):
+        """
+        Transforms token ids into an expression
+        :param tokens: tuple of token ids
+        :return: str
+        """
+        return " ".join([self.token_names[t] for t in tokens])
+
+    def rule_derivation(self, rule):
+        """
+        Tokenized rule
+        :param rule: str
+        :return: tuple of token ids and (relative depth, offset) of its non-terminals
+        """
+        derivation = self._rule_derivations.get(rule)
+        if derivation is None:
+            tokens = tuple(self.token_id(t) for t in rule.split(" "))
+            non_terminals = tuple((depth - 1, index) for depth, index in self._non_terminals(tokens))
+            derivation = self._rule_derivations[rule] = (tokens, non_terminals)
+
+        return derivation
+
+    def derive(self, derivation, rule):
+        """
+        Replaces the top-most-right-most non-terminal by a rule
+        :param derivation: Derivation
+        :param rule: str
+        :return: Derivation
+        """
+        tokens, agenda = derivation
+        rule_tokens, rule_non_terminals = self._rule_derivations.get(rule) or self.rule_derivation(rule)
+
+        # replaced non-terminal
+        depth, index = agenda[0]
+        position = -index
+        # shift of the tokens right of it
+        shift = len(rule_tokens) - 1
+
+        tokens = tokens[:position] + rule_tokens + tokens[position + 1:]
+
+        # terminal rule
+        if not rule_non_terminals:
+            if shift:
+                agenda = tuple([(d, i - shift) if i < index else (d, i) for d, i in agenda[1:]])
+            else:
+                agenda = agenda[1:]
+            return Derivation(tokens, agenda)
+
+        agenda = [(d, i - shift) if i < index else (d, i) for d, i in agenda[1:]]
+        agenda += [(depth + d, index - i) for d, i in rule_non_terminals]
+        agenda.sort()
+
+        return Derivation(tokens, tuple(agenda))
+
+    def top_non_terminal_size(self, derivation):
+        """
+        Size of the top-most-right-most non-terminal
+        :param derivation: Derivation
+        :return: int, 0 for terminal derivations
+        """
+        if not derivation.agenda:
+            return 0
+        return self.non_terminal_sizes[derivation.tokens[-derivation.agenda[0][1]]]
+
     def derive_random_terminal(self, expr, max_nesting=1):
         """
 
@@ -83,13 +256,23 @@ class Game(object):
         :param max_nesting: max nesting steps
         :return: str, terminal expr
         """
+        derivation = self.derive_random_terminal_tokens(self.tokenize(expr), max_nesting)
+
+        return self.detokenize(derivation.tokens)
+
+    def derive_random_terminal_tokens(self, derivation, max_nesting=1):
+        """
+        derive_random_terminal on a derivation
+        :param derivation: Derivation
+        :param max_nesting: max nesting steps
+        :return: Derivation, terminal
+        """
 
         counter = 0
 
-        while not self.is_terminal(expr):
+        while derivation.agenda:
             # get tprm
-            tprm = top_most_right_most(expr)
-            non_terminal = expr.split(" ")[tprm]
+            non_terminal = self.token_names[derivation.tokens[-derivation.agenda[0][1]]]
             # derive arbitrary rule
             if counter < max_nesting:
                 r_move = self.random_rule(non_terminal)
@@ -99,11 +282,11 @@ class Game(object):
                 if not r_move:
                     r_move = self.random_transformation_rule(non_terminal)
             # replace subexpression
-            expr = replace_nth_occurrence(expr, r_move, tprm)
+            derivation = self.derive(derivation, r_move)
 
             counter += 1
 
-        return expr
+        return derivation
 
     def random_rule(self, non_terminal):
         """
@@ -312,6 +495,71 @@ class Game(object):
 
         return stack.pop() % self.max_unsigned
 
+    def compile_expr(self, expr):
+        """
+        Compiles an expression in RPN into a function that
+        evaluates it on a list of samples; see evaluate_expr_samples.
+        Compiled expressions are cached by expression string.
+        :param expr: str
+        :return: function
+        """
+        return self._cached_compile(self._compiled_exprs, compile_expr, expr)
+
+    def compile_expr_numpy(self, expr):
+        """
+        Compiles an expression in RPN into a function that
+        evaluates it on uint64 columns; see evaluate_expr_columns.
+        Compiled expressions are cached by expression string.
+        :param expr: str
+        :return: function or None, if the expression needs more than 64 bits
+        """
+        return self._cached_compile(self._compiled_numpy_exprs, compile_expr_numpy, expr)
+
+    def _cached_compile(self, cache, compiler, expr):
+        """
+        Looks up a compiled expression, compiles it on a miss
+        :param cache: OrderedDict, expr -> compiled expression
+        :param compiler: function
+        :param expr: str
+        :return: compiled expression
+        """
+        if expr in cache:
+            cache.move_to_end(expr)
+            return cache[expr]
+
+        compiled = compiler(expr, self.grammar, list(self.variables), self.bitsize)
+
+        # remember compiled expression
+        cache[expr] = compiled
+        if len(cache) > self.max_compiled_exprs:
+            cache.popitem(last=False)
+
+        return compiled
+
+    def evaluate_expr_samples(self, expr, samples):
+        """
+        Evaluates an expression in RPN on multiple inputs. Equivalent to
+        evaluate_expr on expr with the variables replaced by the values
+        of each sample, without any string processing.
+        :param expr: str, expression over the game's variables
+        :param samples: list of lists of ints, one value per variable
+        :return: list of ints, evaluated expression per sample
+        """
+        return self.compile_expr(expr)(samples)
+
+    def evaluate_expr_columns(self, expr, columns):
+        """
+        Evaluates an expression in RPN on all samples at
+        once, using NumPy uint64 arithmetic.
+        :param expr: str, expression over the game's variables
+        :param columns: 2D uint64 array, one row of sample values per variable
+        :return: uint64 array or None, if the expression needs more than 64 bits (bvconcat)
+        """
+        compiled = self.compile_expr_numpy(expr)
+        if compiled is None:
+            return None
+        return compiled(columns, columns.shape[1])
+
     def to_z3(self, expr):
         """
         Transform an expression into an z3 expression
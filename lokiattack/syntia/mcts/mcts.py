@@ -5,14 +5,17 @@ from math import sqrt, log
 from random import choice
 from time import time
 
+import numpy as np
 from orderedset import OrderedSet
 
-from syntia.mcts.metrics import distance_metric
-from syntia.mcts.utils import rpn_to_infix, replace_variables, to_sha1, top_most_right_most, \
-    replace_nth_occurrence
+from syntia.mcts.metrics import distance_metric, distance_metric_batch
+from syntia.mcts.utils import rpn_to_infix
+from syntia.utils.io_table import IOTable
 
 
 class Node(object):
+    __slots__ = ("parent", "state", "depth", "visits", "children", "average_reward", "total_reward", "dead")
+
     def __init__(self, parent=None, state=None, depth=0):
         """
         Initialises a MCTS node
@@ -38,7 +41,7 @@ class Node(object):
         self.dead = False
 
     def is_fully_expanded(self):
-        return self.state.remaining_moves == OrderedSet()
+        return not self.state.has_remaining_moves()
 
     def is_terminal(self):
         return self.state.is_terminal()
@@ -82,12 +85,16 @@ class Node(object):
 
 
 class State(object):
-    def __init__(self, game, size, move=None, expr=""):
+    __slots__ = ("game", "size", "derivation", "_expr", "_remaining", "move_index", "current_move")
+
+    def __init__(self, game, size, move=None, expr="", derivation=None, move_index=None):
         """
         Initialises a game state
         :param game:
         :param move:
         :param expr:
+        :param derivation: tokenized expr, replaces expr
+        :param move_index: index of move in the moves of the parent state
         """
         # game to play
         self.game = game
@@ -95,27 +102,69 @@ class State(object):
         self.size = size
 
         # current expression
-        if not expr:
-            expr = self.game.initial_move
-        self.expr = expr
-
-        # all moves
-        self.moves = game.moves
-        # moves that can be taken
-        if size:
-            self.remaining_moves = game.moves["u{}".format(size)].copy()
-        else:
-            self.remaining_moves = OrderedSet()
+        if derivation is None:
+            if not expr:
+                expr = self.game.initial_move
+            derivation = self.game.tokenize(expr)
+        self.derivation = derivation
+        # expression string, built on demand
+        self._expr = expr or None
 
-        # top-most-right-most index
-        self.tprm_index = -1
+        # bitset of the moves that can be taken, None until the first move
+        self._remaining = None if size else 0
 
         # current move
+        self.move_index = move_index
         self.current_move = move
 
+    @property
+    def moves(self):
+        return self.game.moves
+
+    @property
+    def remaining_moves(self):
+        """
+        Moves that can be taken
+        :return: OrderedSet
+        """
+        moves = self.game.size_moves(self.size)
+        return OrderedSet(moves[index] for index in self._remaining_indices())
+
+    def _remaining_indices(self):
+        """
+        Indices of the moves that can be taken, materializes the bitset
+        :return: list of int
+        """
+        if self._remaining is None:
+            self._remaining = (1 << len(self.game.size_moves(self.size))) - 1
+        remaining = self._remaining
+        return [index for index in range(remaining.bit_length()) if remaining >> index & 1]
+
+    def has_remaining_moves(self):
+        return self._remaining is None or self._remaining != 0
+
+    def restore_move(self, index):
+        """
+        Makes a taken move available again
+        :param index: move index
+        """
+        self._remaining |= 1 << index
+
+    @property
+    def expr(self):
+        if self._expr is None:
+            self._expr = self.game.detokenize(self.derivation.tokens)
+        return self._expr
+
+    @property
+    def tprm(self):
+        """
+        Index of the top-most-right-most non-terminal
+        """
+        return -self.derivation.agenda[0][1]
+
     def is_terminal(self):
-        if self.game.is_terminal(self.expr):
-            return True
+        return not self.derivation.agenda
 
     def is_non_terminal(self):
         return not self.is_terminal()
@@ -126,38 +175,29 @@ class State(object):
         :param random: bool, flag how to choose next state
         :return: State
         """
-        # init top-most-right-most index
-        if not self.tprm_index >= 0:
-            self.tprm = top_most_right_most(self.expr)
-
-        non_terminal = self.expr.split(" ")[self.tprm]
-
+        remaining = self._remaining_indices()
         # chose next move randomly
         if random:
-            move = choice(list(self.remaining_moves))
+            index = choice(remaining)
         else:
-            move = list(self.remaining_moves[non_terminal]).pop(0)
-        # remove move from list
-        self.remaining_moves.remove(move)
+            index = remaining[0]
+        # remove move from bitset
+        self._remaining &= ~(1 << index)
+        move = self.game.size_moves(self.size)[index]
 
         # replace non-terminal
-        expr = replace_nth_occurrence(self.expr, move, self.tprm)
+        derivation = self.game.derive(self.derivation, move)
 
         # new state size
-        tprm = top_most_right_most(expr)
-        non_terminal = expr.split(" ")[tprm]
+        size = self.game.top_non_terminal_size(derivation)
 
-        if not self.game.is_terminal(expr):
-            size = int(non_terminal.strip("u"))
-        else:
-            size = 0
         # new state
-        state = State(self.game, size, move=move, expr=expr)
+        state = State(self.game, size, move=move, derivation=derivation, move_index=index)
 
         return state
 
     def __eq__(self, other):
-        return self.expr == other.expr
+        return self.derivation.tokens == other.derivation.tokens
 
     def __ne__(self, other):
         return not self.__eq__(other)
@@ -169,28 +209,44 @@ class State(object):
         return self.__str__()
 
     def __hash__(self):
-        return hash(self.expr)
+        return hash(self.derivation.tokens)
 
 
 class MCTS(object):
     def __init__(self, game, oracle, inputs, uct_scalar=1, nesting_level=0,
-                 op_to_rules=OrderedDict()):
+                 op_to_rules=OrderedDict(), max_nodes=0):
         """
         Initialises MCTS tree search
         :param game: game to play
-        :param oracle: function, in/out oracle
+        :param oracle: function, in/out oracle (may be None if inputs is an IOTable)
+        :param inputs: list of inputs or IOTable of inputs and oracle outputs
         :param uct_scalar: float
         :param op_to_rules: dict of pruning rules
+        :param max_nodes: int, node budget of the tree (0: unlimited)
         """
         # input/output oracle
         self.oracle = oracle
-        # set of nodes
-        self.nodes = set()
-        # synthesis inputs
-        self.inputs = inputs
+        # number of nodes in the tree
+        self.num_nodes = 1
+        # maximal number of nodes during the last search
+        self.peak_nodes = 1
+        # node budget, 0 for unlimited
+        self.max_nodes = max_nodes
+        # fraction of the node budget kept by an eviction
+        self.eviction_ratio = 0.9
+        # synthesis inputs and oracle outputs, addressed by sample index
+        if isinstance(inputs, IOTable):
+            self.io_table = inputs
+            self.inputs = inputs.input_list()
+        else:
+            self.io_table = None
+            self.inputs = inputs
+        # variable values per synthesis input, built on first use
+        self._synthesis_samples = None
+        # uint64 variable columns and oracle outputs, built on first use
+        self._batch_samples = None
         # root node
         self.root = Node()
-        self.nodes.add(self.root)
         # game to play
         self.game = game
 
@@ -213,7 +269,7 @@ class MCTS(object):
         # synthesis result
         self.final_expression = ""
 
-        # dict of oracle results
+        # oracle results per input tuple
         self.oracle_queries = dict()
 
         # max nesting playout
@@ -238,6 +294,11 @@ class MCTS(object):
         # verbosity level
         self.verbosity_level = 0
 
+        # callable, stops the search if it returns True
+        self.cancel_check = None
+        # callable(expr, reward), notified of new top terminal results
+        self.top_result_callback = None
+
     def search(self, state, max_iter, max_time=0):
         """
         Performs the MCTS search
@@ -249,6 +310,7 @@ class MCTS(object):
 
         # store globally
         self.max_iter = max_iter
+        self.peak_nodes = self.num_nodes
 
         # init time
         start_time = time()
@@ -259,6 +321,9 @@ class MCTS(object):
             # break if timeout
             if max_time and required_time > max_time:
                 break
+            # break if cancelled
+            if self.cancel_check is not None and self.cancel_check():
+                break
 
             # store globally
             self.current_iter = current_iter
@@ -270,6 +335,10 @@ class MCTS(object):
             self.back_propagation(node, reward)
             current_iter += 1
 
+            # enforce node budget
+            if self.max_nodes and self.num_nodes > self.max_nodes:
+                self.evict_nodes()
+
             # update time
             current_time = time()
             required_time = current_time - start_time
@@ -291,7 +360,8 @@ class MCTS(object):
 
                 node = new_node
 
-                self.nodes.add(node)
+                self.num_nodes += 1
+                self.peak_nodes = max(self.peak_nodes, self.num_nodes)
 
                 return node
             # prune node with only dead children
@@ -360,7 +430,7 @@ class MCTS(object):
 
         # disable terminal nodes
         if node.is_terminal():
-            node.dead = True
+            self.release_node(node)
 
         return reward
 
@@ -387,7 +457,7 @@ class MCTS(object):
         :return: float, best reward
         """
         # initialise new MCTS instance
-        mc = MCTS(self.game, self.oracle, self.inputs, nesting_level=self.nesting_level - 1, uct_scalar=self.uct_scalar)
+        mc = MCTS(self.game, self.oracle, self.io_samples(), nesting_level=self.nesting_level - 1, uct_scalar=self.uct_scalar)
 
         # new state
         state = State(self.game, expr=node.state.expr)
@@ -469,7 +539,8 @@ class MCTS(object):
         :return: reward of current node
         """
         # random terminal expression
-        expr = self.game.derive_random_terminal(node.state.expr, max_nesting=self.playout_nesting)
+        derivation = self.game.derive_random_terminal_tokens(node.state.derivation, max_nesting=self.playout_nesting)
+        expr = self.game.detokenize(derivation.tokens)
 
         # node reward
         reward = self.score(expr)
@@ -495,23 +566,30 @@ class MCTS(object):
         :param expr: expression to evaluate
         :return: score
         """
-        # init reward
-        reward = 0
+        # vectorized scoring
+        batch = self.batch_samples()
+        if batch:
+            columns, q_oracle = batch
 
-        # iterate over input pairs
-        for args in self.inputs:
-            # build replacement data structures
-            repl_dict, repl_list = self._build_variable_replacements(self.game.grammar.variables, list(args))
+            # synthesis queries
+            q_syn = self.game.evaluate_expr_columns(expr, columns)
+            if q_syn is None:
+                q_syn = np.array(self.game.evaluate_expr_samples(expr, self.synthesis_samples()), dtype=np.uint64)
 
-            # oracle query
-            # q_oracle = self.query_oracle(repl_list)
-            q_oracle = self.query_oracle(args)
+            # apply distance metrics
+            d = distance_metric_batch(q_oracle, q_syn, self.game.bitsize)
 
-            # replace terminals with concrete values
-            expr_rep = replace_variables(expr, replacements=repl_dict)
+            # sum up in input order
+            return float(np.cumsum(d)[-1]) / len(self.inputs)
 
-            # synthesis query
-            q_syn = self.game.evaluate_expr(expr_rep)
+        # init reward
+        reward = 0
+
+        # synthesis queries
+        outputs = self.game.evaluate_expr_samples(expr, self.synthesis_samples())
+
+        # iterate over input pairs
+        for q_oracle, q_syn in zip(self.io_samples().output_list(), outputs):
 
             # apply distance metrics
             d = distance_metric(q_oracle, q_syn, self.game.bitsize)
@@ -521,6 +599,50 @@ class MCTS(object):
 
         return reward / len(self.inputs)
 
+    def synthesis_samples(self):
+        """
+        Variable values of each synthesis input, as
+        passed to the compiled expressions
+        :return: list of lists of integers
+        """
+        if self._synthesis_samples is None:
+            self._synthesis_samples = [self._build_variable_replacements(self.game.grammar.variables, list(args))[1]
+                                       for args in self.inputs]
+        return self._synthesis_samples
+
+    def io_samples(self):
+        """
+        Synthesis inputs and their oracle outputs; the oracle
+        is queried on first use if no IOTable was given
+        :return: IOTable
+        """
+        if self.io_table is None:
+            self.io_table = IOTable.from_oracle(self.inputs, self.query_oracle)
+        return self.io_table
+
+    def batch_samples(self):
+        """
+        Synthesis inputs and oracle outputs for vectorized
+        scoring: a uint64 array with one row of values per
+        variable and a uint64 array of oracle outputs.
+        :return: tuple of arrays, or False if the values do not fit into uint64
+        """
+        if self._batch_samples is None:
+            self._batch_samples = False
+
+            # oracle queries
+            q_oracle = self.io_samples().output_list()
+
+            # vectorized metrics require bitsize-bit outputs
+            if self.inputs and self.game.bitsize <= 64 and \
+                    all(isinstance(q, int) and 0 <= q < self.game.max_unsigned for q in q_oracle):
+                samples = self.synthesis_samples()
+                if all(0 <= v < 2 ** 64 for values in samples for v in values):
+                    columns = np.array(samples, dtype=np.uint64).reshape(len(samples), len(self.game.variables))
+                    self._batch_samples = (np.ascontiguousarray(columns.T), np.array(q_oracle, dtype=np.uint64))
+
+        return self._batch_samples
+
     def _build_variable_replacements(self, variables, values):
         """
         Builds data structures for variable replacements
@@ -557,11 +679,14 @@ class MCTS(object):
         :return: oracle results
         """
         # calculate key
-        key = to_sha1(str(args))
+        key = tuple(args)
         # check if key ins known
         if key not in self.oracle_queries:
             # query oracle
-            self.oracle_queries[key] = self.oracle(args)
+            if self.oracle is None:
+                self.oracle_queries[key] = self.io_table.lookup(args)
+            else:
+                self.oracle_queries[key] = self.oracle(args)
         # oracle query
         result = self.oracle_queries[key]
 
@@ -614,6 +739,10 @@ class MCTS(object):
 
                 # add tp best results
                 self.best_terminal_results.add(node.state.expr)
+
+                # publish
+                if self.top_result_callback is not None:
+                    self.top_result_callback(node.state.expr, reward)
         else:
             # update top non-terminal node and reward
             if reward > self.top_non_terminal_reward and node.state.expr != "u64":
@@ -651,8 +780,11 @@ class MCTS(object):
         self.final_expression = expr
         self.finished = True
 
-    @staticmethod
-    def prune_node(node):
+        # publish
+        if self.top_result_callback is not None:
+            self.top_result_callback(expr, 1.0)
+
+    def prune_node(self, node):
         """
         Sets a node to dead if
 
@@ -662,5 +794,46 @@ class MCTS(object):
         """
         if node.is_fully_expanded():
             if all([child.dead for child in node.children]):
-                node.dead = True
+                self.release_node(node)
                 return True
+
+    def release_node(self, node):
+        """
+        Sets a node to dead and removes it from the tree;
+        dead nodes are never selected again
+        :param node: node to release
+        """
+        if node.dead:
+            return
+        node.dead = True
+
+        # all children are dead and released
+        node.children = []
+        if node.parent:
+            node.parent.children.remove(node)
+        self.num_nodes -= 1
+
+    def evict_nodes(self):
+        """
+        Shrinks the tree to eviction_ratio of the node budget
+        by removing the leaves with the lowest average reward
+        (and, on ties, the fewest visits). The moves leading
+        to evicted leaves become available again.
+        """
+        # collect leaves
+        leaves = []
+        todo = [self.root]
+        while todo:
+            node = todo.pop()
+            if node.children:
+                todo.extend(node.children)
+            elif node.parent:
+                leaves.append(node)
+
+        # least promising first
+        leaves.sort(key=lambda n: (n.average_reward, n.visits))
+
+        for node in leaves[:self.num_nodes - int(self.max_nodes * self.eviction_ratio)]:
+            node.parent.children.remove(node)
+            node.parent.state.restore_move(node.state.move_index)
+            self.num_nodes -= 1
@@ -1,5 +1,7 @@
 from __future__ import division
 
+import numpy as np
+
 
 def bitcount(v):
     """
@@ -218,3 +220,132 @@ def distance_metric(a, b, bitsize):
     d = score / 6
 
     return d
+
+
+# Vectorized metrics. They take uint64 arrays a and b of
+# values below 2 ** bitsize (bitsize <= 64) and compute the
+# metrics above for all elements at once.
+
+# set bits per byte value
+_BYTE_BITCOUNT = np.array([bin(v).count("1") for v in range(256)], dtype=np.int64)
+
+
+def bitcount_batch(v):
+    """
+    Number of set bits per element
+    :param v: uint64 array
+    :return: int64 array
+    """
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(v).astype(np.int64)
+    v = np.ascontiguousarray(v)
+    return _BYTE_BITCOUNT[v.view(np.uint8)].reshape(v.shape + (8,)).sum(axis=-1)
+
+
+def bit_length_batch(v):
+    """
+    Bit length per element
+    :param v: uint64 array
+    :return: int64 array
+    """
+    # exponent of the float conversion; rounding may overshoot by one above 2 ** 53
+    n = np.clip(np.frexp(v.astype(np.float64))[1], 1, 64).astype(np.int64)
+    # correct overshoot
+    n -= (v >> (n - 1).astype(np.uint64)) == 0
+
+    return n
+
+
+def leading_zeros_batch(v, bitsize):
+    """
+    Count leading zeros per element
+    :param v: uint64 array
+    :param bitsize: bit length
+    :return: int64 array
+    """
+    return bitsize - bit_length_batch(v)
+
+
+def trailing_zeros_batch(v, bitsize):
+    """
+    Count trailing zeros per element
+    :param v: uint64 array
+    :param bitsize: bit length
+    :return: int64 array
+    """
+    # the lowest set bit converts to float exactly
+    lowest = v & (np.uint64(0) - v)
+    n = np.frexp(lowest.astype(np.float64))[1].astype(np.int64) - 1
+
+    return np.where(v == 0, bitsize, n)
+
+
+def leading_ones_batch(v, bitsize):
+    """
+    Count leading ones per element
+    :param v: uint64 array
+    :param bitsize: bit length
+    :return: int64 array
+    """
+    return leading_zeros_batch(~v & np.uint64((1 << bitsize) - 1), bitsize)
+
+
+def trailing_ones_batch(v, bitsize):
+    """
+    Count trailing ones per element
+    :param v: uint64 array
+    :param bitsize: bit length
+    :return: int64 array
+    """
+    return trailing_zeros_batch(~v & np.uint64((1 << bitsize) - 1), bitsize)
+
+
+def metric_num_distance_batch(a, b):
+    """
+    Numeric distance of a and b, normalised with their
+    local maximum. Values above 2 ** 53 are rounded to
+    float before the division.
+    :param a: uint64 array
+    :param b: uint64 array
+    :return: float64 array
+    """
+    # numeric distance and maximum
+    d = np.where(a > b, a - b, b - a)
+    maximum = np.maximum(a, b)
+
+    # avoid division by 0
+    equal = a == b
+    return np.where(equal, 1.0, 1 - d / np.where(equal, np.uint64(1), maximum))
+
+
+def distance_metric_batch(a, b, bitsize):
+    """
+    Combines different distance metrics, per element;
+    the metrics are summed in the order of distance_metric
+    :param a: uint64 array
+    :param b: uint64 array
+    :param bitsize: int
+    :return: float64 array
+    """
+    n = len(a)
+    mask = np.uint64((1 << bitsize) - 1)
+
+    # leading/trailing zeros of a and b, and of their complements (ones)
+    values = np.concatenate((a, b, ~a & mask, ~b & mask))
+    leading = leading_zeros_batch(values, bitsize).reshape(2, 2, n)
+    trailing = trailing_zeros_batch(values, bitsize).reshape(2, 2, n)
+
+    # numeric differences, normalised; rows: zeros, ones
+    leading = 1 - np.abs(leading[:, 0] - leading[:, 1]) / bitsize
+    trailing = 1 - np.abs(trailing[:, 0] - trailing[:, 1]) / bitsize
+
+    # apply metrics
+    score = 1 - (bitcount_batch(a ^ b) / bitsize)
+    score += leading[0]
+    score += trailing[0]
+    score += leading[1]
+    score += trailing[1]
+    score += metric_num_distance_batch(a, b)
+
+    # normalise weights
+    return score / 6
@@ -0,0 +1,115 @@
+import numpy as np
+
+
+def _to_array(values):
+    """
+    Packs integers into a read-only uint64 array; values
+    that do not fit into 64 bits are kept as Python ints
+    :param values: list of ints or list of lists of ints
+    :return: numpy array
+    """
+    try:
+        array = np.array(values, dtype=np.uint64)
+    except OverflowError:
+        array = np.array(values, dtype=object)
+    array.setflags(write=False)
+
+    return array
+
+
+class IOTable(object):
+    """
+    I/O samples of a synthesis task. Inputs and outputs are
+    parallel integer arrays addressed by sample index: row i
+    of inputs is mapped to outputs[i].
+
+    The table consists of two flat buffers instead of one
+    object per value, so that forked Paralleliser workers
+    share its pages read-only and pickling it copies two
+    arrays instead of a dict.
+    """
+
+    def __init__(self, inputs, outputs):
+        """
+        :param inputs: list of lists of ints, one list per sample
+        :param outputs: list of ints, one per sample
+        """
+        assert len(inputs) == len(outputs)
+
+        self.inputs = _to_array([list(args) for args in inputs])
+        self.outputs = _to_array(list(outputs))
+
+        # Python int views, built on first use
+        self._input_list = None
+        self._output_list = None
+        # sample index per input tuple, built on first use
+        self._index = None
+
+    @classmethod
+    def from_oracle(cls, inputs, oracle):
+        """
+        Queries an oracle once per input
+        :param inputs: list of lists of ints
+        :param oracle: function, list of ints -> int
+        :return: IOTable
+        """
+        return cls(inputs, [oracle(args) for args in inputs])
+
+    @classmethod
+    def from_map(cls, io_map):
+        """
+        Builds a table from a dict of input tuples to outputs
+        :param io_map: dict
+        :return: IOTable
+        """
+        return cls(list(io_map), list(io_map.values()))
+
+    def __getstate__(self):
+        # the Python views are rebuilt on demand
+        return self.inputs, self.outputs
+
+    def __setstate__(self, state):
+        self.inputs, self.outputs = state
+        self._input_list = None
+        self._output_list = None
+        self._index = None
+
+    def __len__(self):
+        return len(self.outputs)
+
+    def __iter__(self):
+        return iter(self.input_list())
+
+    def input_list(self):
+        """
+        Inputs as Python ints
+        :return: list of lists of ints
+        """
+        if self._input_list is None:
+            self._input_list = self.inputs.tolist()
+        return self._input_list
+
+    def output_list(self):
+        """
+        Outputs as Python ints
+        :return: list of ints
+        """
+        if self._output_list is None:
+            self._output_list = self.outputs.tolist()
+        return self._output_list
+
+    def input(self, index):
+        return self.input_list()[index]
+
+    def output(self, index):
+        return self.output_list()[index]
+
+    def lookup(self, args):
+        """
+        Output of a sample given by its input values
+        :param args: list of ints
+        :return: int
+        """
+        if self._index is None:
+            self._index = {tuple(args): index for index, args in enumerate(self.input_list())}
+        return self.output(self._index[tuple(args)])
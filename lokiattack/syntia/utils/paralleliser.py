@@ -1,131 +1,196 @@
 import multiprocessing
-from random import choice, shuffle
+from multiprocessing.connection import wait
+from random import shuffle
+from time import time
+
+
+class WorkerChannel(object):
+    """
+    Worker end of the Paralleliser, passed to the workers
+    in place of the result list: results[index] = result
+    sends the result to the coordinator.
+
+    Workers of the same task group share their best reward
+    and a cancellation flag in shared memory. A worker that
+    reaches reward 1.0 cancels its task group; the results
+    of cancelled workers are discarded.
+    """
+
+    def __init__(self, connection, best_reward, cancelled):
+        """
+        :param connection: sending end of a pipe to the coordinator
+        :param best_reward: multiprocessing.Value, best reward of the task group
+        :param cancelled: multiprocessing.RawValue, cancellation flag of the task group
+        """
+        self.connection = connection
+        self.best_reward = best_reward
+        self.cancelled = cancelled
+        # this worker cancelled its task group
+        self.solved = False
+
+    def __setitem__(self, index, result):
+        # discard results of cancelled workers
+        if self.is_cancelled() and not self.solved:
+            return
+        self.connection.send(("result", result))
+
+    def publish(self, expr, reward):
+        """
+        Publishes a best-so-far expression. Only improvements
+        over the task group's best reward are sent.
+        :param expr: expression
+        :param reward: expression's reward
+        """
+        with self.best_reward.get_lock():
+            if reward <= self.best_reward.value:
+                return
+            self.best_reward.value = reward
+
+        self.connection.send(("best", (expr, reward)))
+
+        # cancel the other workers of the task group
+        if reward == 1.0:
+            self.solved = True
+            self.cancelled.value = 1
+
+    def is_cancelled(self):
+        """
+        Checks if the task group has been cancelled
+        :return: bool
+        """
+        return bool(self.cancelled.value)
+
+    def attach(self, mc):
+        """
+        Connects an MCTS instance: it publishes its top
+        terminal results and stops on cancellation
+        :param mc: MCTS instance
+        """
+        mc.cancel_check = self.is_cancelled
+        mc.top_result_callback = self.publish
+
+    def close(self):
+        self.connection.close()
+
+
+def _run_worker(worker, command, channel, index):
+    try:
+        worker(command, channel, index)
+    finally:
+        channel.close()
 
 
 class Paralleliser(object):
+    # seconds cancelled workers have to stop before they are terminated
+    cancel_timeout = 1.0
+
     def __init__(self, commands, workers, number_of_tasks, task_groups, number_of_cpus=0):
         self.commands = commands
         self.workers = workers
         self.number_of_tasks = number_of_tasks
         self.task_groups = task_groups
 
-        self.process_to_task_group = dict()
-        self.process_to_task_id = dict()
         self.task_group_results = dict()
+        # best-so-far expression and reward per task group
+        self.task_group_best = dict()
 
         if not number_of_cpus:
             number_of_cpus = multiprocessing.cpu_count()
         self.number_of_cpus = number_of_cpus
 
     def execute(self):
-        # initialise parallel data structures
-        manager = multiprocessing.Manager()
-        results = manager.list()
-        processes = [None] * self.number_of_tasks
-
-        # set task_groups to not-finished
-        task_group_states = {}
-        for task in self.task_groups:
-            task_group_states[task] = 0
-
-        # initialise process mappings
-        process_to_task_group = dict()
-        process_to_index = dict()
-
-        # initialise processes
-        for i in range(len(processes)):
-            # extend results
-            results.append(None)
-
-            # get command
-            command = self.commands[i]
+        # initialise results
+        results = [None] * self.number_of_tasks
 
-            # create process
-            processes[i] = multiprocessing.Process(target=self.workers[i], args=(command, results, i))
-
-            # map process to process index
-            process_to_index[processes[i]] = i
-
-            # choose task group randomly
-            process_to_task_group[processes[i]] = self.task_groups[i]
+        # shared best reward and cancellation flag per task group
+        shared_state = dict()
+        for task_group in self.task_groups:
+            if task_group not in shared_state:
+                shared_state[task_group] = (multiprocessing.Value("d", 0.0), multiprocessing.RawValue("b", 0))
 
         # initialise data structures
-        active_processes = set()
-        done = set()
-        process_counter = -1
+        active_processes = dict()
+        connection_to_index = dict()
+        cancel_deadlines = dict()
 
         # random permutation of process indexes
-        random_process_indices = list(range(len(processes)))
+        random_process_indices = list(range(self.number_of_tasks))
         shuffle(random_process_indices)
 
         # iterate until all processes have been processed
-        while len(done) < len(processes):
+        while random_process_indices or active_processes:
             # add more processes, if # processes < # cpu cores and there are processes remaining
-            while len(active_processes) < self.number_of_cpus and process_counter < len(processes) - 1:
-                # increase index
-                process_counter += 1
-                # random process index
-                random_process_index = random_process_indices.pop()
-                # get next process
-                process = processes[random_process_index]
+            while len(active_processes) < self.number_of_cpus and random_process_indices:
+                process_index = random_process_indices.pop()
+                task_group = self.task_groups[process_index]
 
-                # get process' task group
-                task_group = process_to_task_group[process]
+                # process' task group has been solved
+                if task_group in self.task_group_results:
+                    continue
 
-                # print random_process_index, task_group
+                # start process
+                receiver, sender = multiprocessing.Pipe(duplex=False)
+                channel = WorkerChannel(sender, *shared_state[task_group])
+                process = multiprocessing.Process(target=_run_worker,
+                                                  args=(self.workers[process_index], self.commands[process_index],
+                                                        channel, process_index))
+                process.start()
+                # the pipe reports EOF once the process exits
+                sender.close()
+
+                active_processes[process_index] = process
+                connection_to_index[receiver] = process_index
+
+            if not active_processes:
+                continue
+
+            # block until a worker sends a message or exits
+            timeout = None
+            if cancel_deadlines:
+                timeout = max(0, min(cancel_deadlines.values()) - time())
+
+            for connection in wait(list(connection_to_index), timeout):
+                process_index = connection_to_index[connection]
+                try:
+                    message, value = connection.recv()
+                except EOFError:
+                    # process has terminated
+                    del connection_to_index[connection]
+                    connection.close()
+                    active_processes.pop(process_index).join()
+                    continue
 
-                # process' taskgroup has been solved
-                if task_group_states[task_group]:
-                    done.add(process)
+                self._handle_message(process_index, message, value, results, shared_state, cancel_deadlines)
 
-                # get next process
-                if process in done:
+            # terminate cancelled processes that did not stop in time
+            current_time = time()
+            for task_group, deadline in list(cancel_deadlines.items()):
+                if current_time < deadline:
                     continue
+                del cancel_deadlines[task_group]
+                for process_index, process in active_processes.items():
+                    if self.task_groups[process_index] == task_group:
+                        process.terminate()
 
-                # start process
-                process.start()
+        return results
+
+    def _handle_message(self, process_index, message, value, results, shared_state, cancel_deadlines):
+        task_group = self.task_groups[process_index]
+
+        # best-so-far expression
+        if message == "best":
+            expr, reward = value
+            if task_group not in self.task_group_best or reward > self.task_group_best[task_group][1]:
+                self.task_group_best[task_group] = (expr, reward)
+
+        # final result
+        elif message == "result":
+            results[process_index] = value
+
+            # first result solves the task group
+            if value and task_group not in self.task_group_results:
+                self.task_group_results[task_group] = value
 
-                # add to active processes
-                active_processes.add(process)
-
-            # if there are active processes
-            if active_processes:
-                # choose random process
-                process = choice(list(active_processes.copy()))
-
-                # process has been terminated
-                if not process.is_alive():
-                    # get process index
-                    process_index = process_to_index[process]
-                    # get result
-                    result = results[process_index]
-
-                    # if process terminated with a result:
-                    if result:
-                        # get process' task group
-                        task_group = process_to_task_group[process]
-                        # set task group to finished
-                        task_group_states[task_group] = 1
-
-                        # store task group's result
-                        self.task_group_results[task_group] = result
-
-                        # terminate active processes in current task group
-                        for process in active_processes.copy():
-                            # process is in the same task group?
-                            if task_group == process_to_task_group[process]:
-                                # kill process
-                                process.terminate()
-                                # add to done
-                                done.add(process)
-                                # remove from active processes
-                                active_processes.remove(process)
-
-                    # delete process
-                    else:
-                        # add to done
-                        done.add(process)
-                        # remove from active processes
-                        active_processes.remove(process)
-
-        return results
\ No newline at end of file
+                # cancel the remaining processes of the task group
+                shared_state[task_group][1].value = 1
+                cancel_deadlines[task_group] = time() + self.cancel_timeout
@@ -6,7 +6,7 @@ from syntia.mcts.mcts import *
 from syntia.mcts.game import Game, Variable
 from syntia.mcts.grammar import Grammar
 from syntia.utils.paralleliser import Paralleliser
-from syntia.mcts.utils import to_sha1
+from syntia.utils.io_table import IOTable
 from z3 import simplify
 from orderedset import OrderedSet
 
@@ -179,12 +179,14 @@ class AssemblyOracleSynthesizer:
 
         # get sampling outputs
         current_outputs = [out[output_index][0] for out in self.sampling_outputs]
+        # built once per output and shared read-only by all workers of the task group
+        io_table = IOTable(self.sampling_inputs, current_outputs)
 
         # define grammar
         grammar = Grammar(self.variables, constants=self.constants, bitsize=output_bitsize * 8)
         # synthesis command
         configuration = [self.variables, grammar, uct_scalar, max_mcts_rounds, playout_depth, output_name, output_index,
-                         output_bitsize, self.sampling_inputs, current_outputs]
+                         output_bitsize, io_table]
 
         return configuration, task_group
 
@@ -204,18 +206,15 @@ def oracle(args):
     :return: output
     """
     # initialise
-    global in_out_map
-
-    # calc hash
-    args_sha1 = to_sha1(str(args).replace("L", ""))
+    global io_table
 
     # return output
-    return in_out_map[args_sha1]
+    return io_table.lookup(args)
 
 
 def worker_synthesize_from_assembly_oracle(commands, result, worker_index):
     # initialise
-    global in_out_map
+    global io_table
 
     # parse synthesis parameters
     variables = commands[0]
@@ -226,22 +225,16 @@ def worker_synthesize_from_assembly_oracle(commands, result, worker_index):
     output_name = commands[5]
     output_index = commands[6]
     output_bitsize = commands[7]
-    synthesis_inputs = commands[8]
-    synthesis_outputs = commands[9]
-
-    # fill in/out map
-    in_out_map = dict()
-    for index in range(len(synthesis_inputs)):
-        current_inputs_sha1 = to_sha1(str(synthesis_inputs[index]).replace("L", ""))
-        in_out_map[current_inputs_sha1] = synthesis_outputs[index]
+    io_table = commands[8]
 
     # init mcts
     game = Game(grammar, variables, bitsize=output_bitsize * 8)
     s = State(game, output_bitsize * 8)
 
-    mc = MCTS(game, oracle, synthesis_inputs, uct_scalar=utc_scalar)
+    mc = MCTS(game, oracle, io_table, uct_scalar=utc_scalar)
     mc.playout_nesting = playout_depth
     mc.verbosity_level = 0
+    result.attach(mc)
 
     # start synthesis
     mc.search(s, max_mcts_rounds)
@@ -268,6 +261,9 @@ def worker_synthesize_from_assembly_oracle(commands, result, worker_index):
     ret["top_terminal"]["expression"]["infix"] = rpn_to_infix(expr)
     ret["top_terminal"]["reward"] = reward
 
+    # search tree size
+    ret["peak_nodes"] = mc.peak_nodes
+
     # synthesis results
     ret["successful"] = "yes" if mc.final_expression else "no"
     if mc.final_expression:
@@ -0,0 +1,39 @@
+"""
+Regression checks of compiled expressions against the constant propagation of expr_simp
+"""
+
+import random
+import sys
+from pathlib import Path
+
+import pytest
+
+LOKIATTACK_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, (LOKIATTACK_DIR / "miasm").as_posix())
+sys.path.insert(0, LOKIATTACK_DIR.as_posix())
+
+from miasm.expression.expression import ExprId, ExprInt, ExprOp
+
+from lokiattack.expr_compiler import compile_expr
+from lokiattack.io_sampling import evaluate_io, evaluate_sample
+
+x = ExprId("x", 64)
+y = ExprId("y", 64)
+one = ExprInt(1, 64)
+
+
+def test_division_is_floor_division():
+    assert evaluate_io(ExprOp("/", x, ExprInt(3, 64)), [x], [[10]]) == [3]
+
+
+@pytest.mark.parametrize("expr", [
+    ExprOp("/", x, y | one),
+    ExprOp("%", x + y, y | one),
+    ExprOp("/", x * y, ExprInt(7, 64)) + x,
+    ExprOp("udiv", x, y | one) ^ ExprOp("sdiv", y, x | one),
+])
+def test_compiled_expr_matches_expr_simp(expr):
+    rnd = random.Random(0)
+    inputs = [[rnd.getrandbits(64), rnd.getrandbits(64)] for _ in range(100)]
+
+    assert compile_expr(expr, [x, y])(inputs) == [evaluate_sample(expr, {x: a, y: b}) for a, b in inputs]
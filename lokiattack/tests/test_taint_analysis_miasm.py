@@ -0,0 +1,57 @@
+"""
+Regression checks of the bit-level TaintEngine against the tainted instructions
+reported by the former symbolic (T-bit) taint analysis
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+LOKIATTACK_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, (LOKIATTACK_DIR / "miasm").as_posix())
+sys.path.insert(0, LOKIATTACK_DIR.as_posix())
+
+from miasm.analysis.machine import Machine
+from miasm.core import asmblock, parse_asm
+from miasm.core.bin_stream import bin_stream_str
+from miasm.core.locationdb import LocationDB
+from miasm.expression.expression import ExprId
+
+from lokiattack.taint_analysis_miasm import TaintEngine, TaintSource
+
+BASE_ADDRESS = 0x1000
+
+
+def lift(asm):
+    """Assemble and lift an x86_64 snippet; returns ira, ir_cfg and the path through it"""
+    machine = Machine("x86_64")
+    asm_cfg, loc_db = parse_asm.parse_txt(machine.mn, 64, "main:\n" + asm + "\nRET\n", LocationDB())
+    loc_db.set_location_offset(loc_db.get_name_location("main"), BASE_ADDRESS)
+    code = bytearray(0x100)
+    for offset, raw in asmblock.asm_resolve_final(machine.mn, asm_cfg, loc_db).items():
+        code[offset - BASE_ADDRESS:offset - BASE_ADDRESS + len(raw)] = raw
+
+    loc_db = LocationDB()
+    mdis = machine.dis_engine(bin_stream_str(bytes(code), base_address=BASE_ADDRESS), loc_db=loc_db)
+    ira = machine.ira(loc_db)
+    ir_cfg = ira.new_ircfg_from_asmcfg(mdis.dis_multiblock(BASE_ADDRESS))
+    return ira, ir_cfg, [loc_db.get_offset_location(BASE_ADDRESS)]
+
+
+@pytest.mark.parametrize("asm, expected", [
+    # cancelling idioms clear the taint of RAX
+    ("XOR RAX, RAX\nMOV RBX, RAX", []),
+    ("SUB RAX, RAX\nMOV RBX, RAX", []),
+    ("MOV RCX, RAX\nSUB RCX, RAX\nMOV RBX, RCX", ["MOV RCX, RAX"]),
+    ("MOV RCX, RAX\nXOR RCX, RAX\nMOV RBX, RCX", ["MOV RCX, RAX"]),
+    ("MOV RCX, RAX\nAND RCX, 0\nMOV RBX, RCX", ["MOV RCX, RAX"]),
+    ("ADD RAX, 1\nMOV RBX, RAX", ["ADD RAX, 0x1", "MOV RBX, RAX"]),
+])
+def test_tainted_instructions(asm, expected):
+    ira, ir_cfg, path = lift(asm)
+    te = TaintEngine(ira, [TaintSource(ExprId("RAX", 64), None)], ir_cfg)
+    te.analyze_path(path)
+
+    assert sorted(" ".join(str(instr).split()) for instr in te.tainted_instructions) == expected
+    assert len(te.visited_instructions) == asm.count("\n") + 2